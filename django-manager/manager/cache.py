@@ -0,0 +1,125 @@
+import math
+import time
+import pickle
+
+from django.core.cache.backends.base import BaseCache, DEFAULT_TIMEOUT, InvalidCacheBackendError
+
+try:
+    import uwsgi
+except ImportError:
+    # not running in uWSGI
+    uwsgi = None
+
+
+class UWSGICache(BaseCache):
+    """
+    Cache backend that stores values in a uWSGI ``cache2``, so that all
+    workers of the same uWSGI instance share the cache without an external
+    service. The cache ``LOCATION`` is the name of the uWSGI cache, that
+    must be configured in ``uwsgi.ini``:
+        * values are pickled with their expiration time and must fit in
+          the cache ``blocksize``
+        * expired items are ignored when read, and removed by the uWSGI
+          cache sweeper
+        * ``add()`` and ``incr()`` hold the uWSGI lock, so they are atomic
+          across workers; ``incr()`` keeps the expiration time of the item
+
+    The backend is available only in processes started by uWSGI.
+    """
+    def __init__(self, location, params):
+        super().__init__(params)
+        if uwsgi is None:
+            raise InvalidCacheBackendError('UWSGICache can be used only when running in uWSGI')
+        self._cache = location
+
+    def _timeout(self, timeout):
+        """
+        Returns the timeout in seconds, where ``None`` never expires.
+        """
+        if timeout == DEFAULT_TIMEOUT:
+            return self.default_timeout
+        return timeout
+
+    def _key(self, key, version):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        return key
+
+    def _load(self, key):
+        """
+        Returns the ``(expires_at, value)`` item of the given key, or
+        ``None`` if it's missing or expired.
+        """
+        data = uwsgi.cache_get(key, self._cache)
+        if data is None:
+            return None
+        expires_at, value = pickle.loads(data)
+        if expires_at is not None and expires_at <= time.time():
+            return None
+        return expires_at, value
+
+    def _get(self, key):
+        """
+        Returns the value of the given key, or ``None`` if it's
+        missing or expired.
+        """
+        item = self._load(key)
+        return None if item is None else item[1]
+
+    def _store(self, key, value, expires_at):
+        data = pickle.dumps((expires_at, value), pickle.HIGHEST_PROTOCOL)
+        # uWSGI expires items in seconds, where 0 never expires
+        expires = 0 if expires_at is None else max(1, int(math.ceil(expires_at - time.time())))
+        uwsgi.cache_update(key, data, expires, self._cache)
+
+    def _set(self, key, value, timeout):
+        timeout = self._timeout(timeout)
+        if timeout is not None and timeout <= 0:
+            uwsgi.cache_del(key, self._cache)
+            return
+        self._store(key, value, None if timeout is None else time.time() + timeout)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self._key(key, version)
+        timeout = self._timeout(timeout)
+        if timeout is not None and timeout <= 0:
+            return False
+        # the uWSGI lock is shared by all workers
+        uwsgi.lock()
+        try:
+            if self._get(key) is not None:
+                return False
+            self._set(key, value, timeout)
+            return True
+        finally:
+            uwsgi.unlock()
+
+    def get(self, key, default=None, version=None):
+        value = self._get(self._key(key, version))
+        return default if value is None else value
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self._set(self._key(key, version), value, timeout)
+
+    def delete(self, key, version=None):
+        uwsgi.cache_del(self._key(key, version), self._cache)
+
+    def has_key(self, key, version=None):
+        return self._get(self._key(key, version)) is not None
+
+    def incr(self, key, delta=1, version=None):
+        key = self._key(key, version)
+        uwsgi.lock()
+        try:
+            item = self._load(key)
+            if item is None:
+                raise ValueError("Key '%s' not found" % key)
+            expires_at, value = item
+            # the item keeps its expiration time
+            self._store(key, value + delta, expires_at)
+            return value + delta
+        finally:
+            uwsgi.unlock()
+
+    def clear(self):
+        uwsgi.cache_clear(self._cache)
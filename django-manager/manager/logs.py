@@ -0,0 +1,183 @@
+import os
+import queue
+import atexit
+import logging
+import threading
+
+from contextlib import contextmanager
+import logging.handlers
+
+from django.conf import settings
+
+
+# context attributes added to log records, in the order they are logged
+CONTEXT_FIELDS = ('receipt', 'adapter', 'duration')
+
+# context of the current thread
+_context = threading.local()
+
+# queue handlers installed by ``enable_queue()``
+_handlers = []
+
+# seconds waited by a stopping listener for stalled handlers
+STOP_TIMEOUT = 5
+
+
+@contextmanager
+def log_context(**values):
+    """
+    Adds the given values (i.e. ``receipt`` or ``adapter``) to the records
+    logged by the current thread in this block. Values of an outer block
+    are restored when the block exits.
+    """
+    previous = getattr(_context, 'values', {})
+    _context.values = dict(previous, **values)
+    try:
+        yield
+    finally:
+        _context.values = previous
+
+
+class ContextFilter(logging.Filter):
+    """
+    Adds the values of the current ``log_context()`` as record attributes,
+    and a ``context`` attribute with all ``CONTEXT_FIELDS`` of the record,
+    so that formatters can append ``%(context)s`` to the message (i.e.
+    ``sold items pushed receipt=42 adapter=printer``). Values passed with
+    ``extra`` are kept.
+
+    Records are filtered once, by the first handler that sees them, so
+    that a ``QueueHandler`` adds the context of the logging thread.
+    """
+    def filter(self, record):
+        if hasattr(record, 'context'):
+            return True
+
+        for key, value in getattr(_context, 'values', {}).items():
+            if not hasattr(record, key):
+                setattr(record, key, value)
+        record.context = ''.join(
+            ' {}={}'.format(key, getattr(record, key)) for key in CONTEXT_FIELDS if hasattr(record, key)
+        )
+        return True
+
+
+class QueueListener(logging.handlers.QueueListener):
+    """
+    ``QueueListener`` that can be stopped when its bounded queue is full.
+    """
+    def stop(self):
+        try:
+            self.queue.put(self._sentinel, timeout=STOP_TIMEOUT)
+        except queue.Full:
+            # handlers are stalled, so queued records are lost
+            return
+        self._thread.join()
+        self._thread = None
+
+
+class QueueHandler(logging.handlers.QueueHandler):
+    """
+    Handler that puts records in a bounded queue without blocking, while a
+    ``QueueListener`` thread of the current process writes them with the
+    ``targets`` handlers; a stalled syslog socket or console doesn't slow
+    down requests anymore. When the queue is full, records are dropped and
+    counted in ``dropped``; the number of dropped records is logged as soon
+    as the queue has room again.
+    """
+    def __init__(self, targets, maxsize):
+        super().__init__(queue.Queue(maxsize))
+        self.targets = targets
+        self.maxsize = maxsize
+        self.dropped = 0
+        self.reported = 0
+        self.listener = None
+        self.pid = None
+        self.addFilter(ContextFilter())
+
+    def start(self):
+        """
+        Starts the listener thread of the current process. A forked worker
+        doesn't inherit the thread of its parent, so it starts its own
+        listener with a new queue.
+        """
+        if self.pid == os.getpid():
+            return
+        self.queue = queue.Queue(self.maxsize)
+        self.dropped = self.reported = 0
+        self.listener = QueueListener(self.queue, *self.targets, respect_handler_level=True)
+        self.listener.start()
+        self.pid = os.getpid()
+
+    def stop(self):
+        """
+        Writes the queued records and stops the listener thread.
+        """
+        if self.pid == os.getpid():
+            self.listener.stop()
+            self.pid = None
+
+    def enqueue(self, record):
+        # ``handle()`` holds the handler lock, so counters are updated by one thread at a time
+        try:
+            if self.dropped > self.reported:
+                self.queue.put_nowait(self._dropped_record())
+                self.reported = self.dropped
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def _dropped_record(self):
+        message = 'log queue full, dropped {} records'.format(self.dropped - self.reported)
+        return logging.LogRecord(__name__, logging.WARNING, __file__, 0, message, None, None)
+
+
+def enable_queue(names=None, maxsize=None):
+    """
+    Replaces the handlers of the given loggers (default:
+    ``LOGGING_QUEUE_LOGGERS``) with ``QueueHandler`` instances, one for
+    each set of handlers, and starts their listeners. Under uWSGI it's
+    called by each worker after the fork, because a listener thread of
+    the master may hold a handler lock when workers are forked.
+    """
+    if not _handlers:
+        names = settings.LOGGING_QUEUE_LOGGERS if names is None else names
+        maxsize = settings.LOGGING_QUEUE_SIZE if maxsize is None else maxsize
+        handlers = {}
+        for name in names:
+            logger = logging.getLogger(name)
+            targets = tuple(logger.handlers)
+            if not targets:
+                continue
+            if targets not in handlers:
+                handlers[targets] = QueueHandler(targets, maxsize)
+            logger.handlers = [handlers[targets]]
+        _handlers.extend(handlers.values())
+        # queued records are written before the process exits
+        atexit.register(disable_queue)
+
+    for handler in _handlers:
+        handler.start()
+
+
+def disable_queue():
+    """
+    Stops the listeners and restores the handlers of all loggers.
+    """
+    for logger in [logging.getLogger()] + list(logging.Logger.manager.loggerDict.values()):
+        for handler in getattr(logger, 'handlers', []):
+            if handler in _handlers:
+                logger.handlers = list(handler.targets)
+    for handler in _handlers:
+        handler.stop()
+    del _handlers[:]
+
+
+def get_stats():
+    """
+    Returns the number of queued and dropped records of each queue.
+    """
+    return [
+        {'queued': handler.queue.qsize(), 'dropped': handler.dropped, 'maxsize': handler.maxsize}
+        for handler in _handlers
+    ]
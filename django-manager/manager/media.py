@@ -0,0 +1,59 @@
+import os
+import re
+import mimetypes
+
+from django.conf import settings
+from django.http import Http404, HttpResponse
+from django.utils._os import safe_join
+from django.utils.cache import patch_cache_control
+from django.views import static
+from django.core.exceptions import SuspiciousFileOperation
+
+
+# names that include a hash of the file content (i.e. product icon
+# variants), that never change and can be cached forever
+IMMUTABLE_NAMES = re.compile(r'\.[0-9a-f]{12}\.\w+$')
+
+# one year, as suggested by RFC 2616 for responses that never expire
+IMMUTABLE_MAX_AGE = 365 * 24 * 60 * 60
+
+
+def serve(request, path):
+    """
+    Serves uploaded media files. With the default ``django`` mode, files
+    are sent with the WSGI ``file_wrapper``, that uWSGI transfers with
+    ``sendfile()`` from its offload threads, so the worker is released
+    immediately. Behind another web server, ``MEDIA_SERVE_MODE`` delegates
+    the file transfer to the server:
+        * ``x-sendfile``: the response includes the file path in the
+          ``X-Sendfile`` header (Apache ``mod_xsendfile``, lighttpd)
+        * ``x-accel-redirect``: the response includes the file URL below
+          ``MEDIA_INTERNAL_URL`` in the ``X-Accel-Redirect`` header (nginx)
+
+    Content-hashed names are cached forever, while other files are cached
+    for ``MEDIA_MAX_AGE`` seconds.
+    """
+    mode = settings.MEDIA_SERVE_MODE
+    if mode == 'django':
+        response = static.serve(request, path, document_root=settings.MEDIA_ROOT)
+    else:
+        try:
+            fullpath = safe_join(settings.MEDIA_ROOT, path)
+        except SuspiciousFileOperation:
+            raise Http404('"{}" does not exist'.format(path))
+        if not os.path.isfile(fullpath):
+            raise Http404('"{}" does not exist'.format(path))
+
+        content_type, encoding = mimetypes.guess_type(fullpath)
+        response = HttpResponse(content_type=content_type or 'application/octet-stream')
+        if mode == 'x-accel-redirect':
+            response['X-Accel-Redirect'] = settings.MEDIA_INTERNAL_URL + path
+        else:
+            response['X-Sendfile'] = fullpath
+
+    if response.status_code == 200:
+        if IMMUTABLE_NAMES.search(path):
+            patch_cache_control(response, public=True, max_age=IMMUTABLE_MAX_AGE, immutable=True)
+        else:
+            patch_cache_control(response, public=True, max_age=settings.MEDIA_MAX_AGE)
+    return response
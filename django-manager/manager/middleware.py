@@ -0,0 +1,111 @@
+import re
+import zlib
+
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+from django.utils.deprecation import MiddlewareMixin
+from django.utils.text import compress_string
+
+try:
+    import brotli
+except ImportError:
+    # brotli is an optional dependency
+    brotli = None
+
+
+re_accepts_gzip = re.compile(r'\bgzip\b')
+re_accepts_brotli = re.compile(r'\bbr\b')
+
+# content types that are already compressed
+COMPRESSED_CONTENT_TYPES = re.compile(
+    r'^(image/(?!svg)|video/|audio/|font/woff|application/(zip|gzip|x-gzip|x-bzip2|x-xz|pdf|octet-stream))'
+)
+
+
+def gzip_sequence(sequence):
+    """
+    Compresses a streaming response with gzip, flushing the compressed
+    data after each chunk so that the client receives it immediately.
+    """
+    compressor = zlib.compressobj(6, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+    for item in sequence:
+        data = compressor.compress(item) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def brotli_sequence(sequence):
+    """
+    Compresses a streaming response with brotli, flushing the compressed
+    data after each chunk.
+    """
+    compressor = brotli.Compressor(quality=settings.COMPRESSION_BROTLI_QUALITY)
+    for item in sequence:
+        data = compressor.process(item) + compressor.flush()
+        if data:
+            yield data
+    yield compressor.finish()
+
+
+class CompressionMiddleware(MiddlewareMixin):
+    """
+    Compresses responses with brotli, if it's installed and the client
+    accepts it, or with gzip. Like the Django ``GZipMiddleware``:
+        * responses shorter than ``COMPRESSION_MIN_SIZE`` are not compressed
+        * streaming responses (i.e. exports) are compressed chunk by chunk
+        * responses with a ``Content-Encoding`` are left untouched
+        * files (``FileResponse``, i.e. media files) are left untouched
+        * strong ETags become weak
+
+    Content types that are already compressed (images, archives) are
+    not compressed again.
+    """
+    def process_response(self, request, response):
+        if not response.streaming and len(response.content) < settings.COMPRESSION_MIN_SIZE:
+            return response
+
+        if response.has_header('Content-Encoding'):
+            return response
+
+        # files are sent with ``wsgi.file_wrapper`` (i.e. uWSGI offloading),
+        # that is lost when their streaming content is replaced
+        if getattr(response, 'file_to_stream', None) is not None:
+            return response
+
+        if COMPRESSED_CONTENT_TYPES.match(response.get('Content-Type', '')):
+            return response
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+
+        accept_encoding = request.META.get('HTTP_ACCEPT_ENCODING', '')
+        if brotli is not None and re_accepts_brotli.search(accept_encoding):
+            encoding = 'br'
+        elif re_accepts_gzip.search(accept_encoding):
+            encoding = 'gzip'
+        else:
+            return response
+
+        if response.streaming:
+            # the compressed size is not known in advance
+            if encoding == 'br':
+                response.streaming_content = brotli_sequence(response.streaming_content)
+            else:
+                response.streaming_content = gzip_sequence(response.streaming_content)
+            del response['Content-Length']
+        else:
+            if encoding == 'br':
+                content = brotli.compress(response.content, quality=settings.COMPRESSION_BROTLI_QUALITY)
+            else:
+                content = compress_string(response.content)
+            # use the compressed content only if it's actually shorter
+            if len(content) >= len(response.content):
+                return response
+            response.content = content
+            response['Content-Length'] = str(len(content))
+
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response['ETag'] = 'W/' + etag
+        response['Content-Encoding'] = encoding
+        return response
@@ -29,6 +29,8 @@ RAVEN_CONFIG = {
 }
 
 # logging
+LOGGING_QUEUE = env('DJANGO_LOGGING_QUEUE', True)
+
 LOGGING['loggers'] = {
     'django': {
         'handlers': ['console', 'syslog'],
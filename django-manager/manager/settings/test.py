@@ -9,10 +9,14 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': ':memory:',
-    }
+    },
+    # a second database used to test the replica router
+    'replica': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': ':memory:',
+    },
 }
+DATABASES_REPLICA = None
 
 # Django REST Framework defaults to JSON requests
-REST_FRAMEWORK = {
-    'TEST_REQUEST_DEFAULT_FORMAT': 'json'
-}
+REST_FRAMEWORK['TEST_REQUEST_DEFAULT_FORMAT'] = 'json'
@@ -1,14 +1,18 @@
+import re
+
 from django.contrib import admin
 
 from django.conf import settings
 from django.conf.urls import url, include
-from django.conf.urls.static import static
 
 from django.views.generic import RedirectView
 
+from . import media
+
 
 urlpatterns = [
     url(r'^$', RedirectView.as_view(url='/admin/', permanent=False)),
     url(r'^admin/', admin.site.urls),
     url(r'^api/', include('registers.urls')),
-] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+    url(r'^{}(?P<path>.*)$'.format(re.escape(settings.MEDIA_URL.lstrip('/'))), media.serve, name='media'),
+]
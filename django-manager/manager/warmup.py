@@ -0,0 +1,40 @@
+import time
+import logging
+
+from django.conf import settings
+from django.db import connections
+from django.utils.module_loading import import_string
+
+from registers.catalog import get_catalog
+from registers.adapters.registry import get_adapters
+
+
+logger = logging.getLogger(__name__)
+
+
+def preload():
+    """
+    Imports the adapters modules and their dependencies, so that they are
+    loaded once by the master process and shared by forked workers.
+    Adapters are not initialized because their threads and connections
+    are not inherited by forked workers.
+    """
+    for adapter in settings.PUSH_ADAPTERS:
+        if isinstance(adapter, str):
+            import_string(adapter)
+
+
+def warmup():
+    """
+    Prepares a worker before it accepts requests, so that the first
+    receipt after a deploy isn't slower than the others:
+        * opens the database connections
+        * initializes the adapters of the worker
+        * renders the products catalog, if it's not cached
+    """
+    start = time.monotonic()
+    for connection in connections.all():
+        connection.ensure_connection()
+    get_adapters()
+    get_catalog()
+    logger.info('worker warmed up in %.1fms', (time.monotonic() - start) * 1000)
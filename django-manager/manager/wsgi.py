@@ -1,4 +1,38 @@
+from django.conf import settings
 from django.core.wsgi import get_wsgi_application
 
+from manager.logs import enable_queue
+from manager.warmup import preload, warmup
+from registers.adapters.registry import reset_adapters
+
 
 application = get_wsgi_application()
+
+try:
+    from uwsgidecorators import postfork
+except ImportError:
+    # not running in uWSGI
+    postfork = None
+
+# under uWSGI the listener thread is started by each worker: a thread of
+# the master could hold a logging lock when workers are forked
+if settings.LOGGING_QUEUE and postfork is None:
+    enable_queue()
+
+if settings.WARMUP:
+    preload()
+
+if postfork is not None:
+    @postfork
+    def initialize_worker():
+        """
+        Ensures that each worker initializes its own adapters, even if
+        they have been used by the master process before the fork, starts
+        its logging thread and warms up the worker before it accepts
+        requests.
+        """
+        reset_adapters()
+        if settings.LOGGING_QUEUE:
+            enable_queue()
+        if settings.WARMUP:
+            warmup()
@@ -13,12 +13,14 @@ import AppBarTop from './components/AppBar';
 import ProductList from './components/ProductList';
 
 
-const initialData = [
-    {id: 1, name: 'Croissant', price: '5.90', image: 'https://upload.wikimedia.org/wikipedia/commons/9/9b/Croissant,_cross_section.jpg'},
-    {id: 2, name: 'Croissant', price: '5.90', image: 'https://upload.wikimedia.org/wikipedia/commons/9/9b/Croissant,_cross_section.jpg'},
-    {id: 3, name: 'Croissant', price: '5.90', image: 'https://upload.wikimedia.org/wikipedia/commons/9/9b/Croissant,_cross_section.jpg'},
-    {id: 4, name: 'Croissant', price: '5.90', image: 'https://upload.wikimedia.org/wikipedia/commons/9/9b/Croissant,_cross_section.jpg'},
-];
+// products catalog included in the page by the server
+const catalog = JSON.parse(document.getElementById('catalog').textContent);
+const initialData = catalog.map((product) => ({
+    id: product.id,
+    name: product.name,
+    price: product.default_price,
+    image: product.icons ? product.icons['128'].webp : product.icon,
+}));
 
 const App = () => (
   <MuiThemeProvider>
@@ -1,10 +1,55 @@
+import hashlib
+
+from django.core.cache import cache
+from django.contrib.admin.views.decorators import staff_member_required
+from django.contrib.staticfiles.templatetags.staticfiles import static
+from django.http import HttpResponse
+from django.utils.cache import patch_cache_control
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import condition
 from django.views.generic import TemplateView
 
+from registers.catalog import get_catalog, get_version
+
+
+# bundles built by webpack; in production their URLs include a content hash
+BUNDLES = ('main.css', 'vendor.bundle.js', 'main.js')
+PAGE_KEY = 'pos:page:{}'
+
+
+def get_page_version(request, *args, **kwargs):
+    """
+    Returns the version of the POS page, that changes when the products
+    catalog or the bundles are changed.
+    """
+    bundles = '|'.join(static(name) for name in BUNDLES)
+    return '{}-{}'.format(get_version(), hashlib.md5(bundles.encode()).hexdigest()[:12])
+
 
+@method_decorator(staff_member_required, name='dispatch')
+@method_decorator(condition(etag_func=get_page_version), name='get')
 class POSTemplateView(TemplateView):
     """
     React static application that shows a list of products
     so that the shop owner can sold items with just
     few taps.
+
+    The products catalog is included in the page, so that the
+    application doesn't wait for the products API. The page is
+    rendered once for each catalog version and bundles build,
+    and browsers revalidate it with its ``ETag``.
     """
     template_name = 'pos.html'
+
+    def get(self, request, *args, **kwargs):
+        key = PAGE_KEY.format(get_page_version(request))
+        content = cache.get(key)
+        if content is None:
+            version, catalog = get_catalog()
+            response = self.render_to_response(self.get_context_data(catalog=catalog, **kwargs))
+            content = response.render().content
+            cache.set(key, content)
+        response = HttpResponse(content)
+        # the page includes the catalog, that is available only to staff users
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
@@ -4,8 +4,21 @@ class BaseAdapter(object):
     creating a new Adapter. This is used to add external integrations
     when a receipt model is saved, pushing data to a third-party
     component like a printer or a web service.
+
+    Adapters receive a ``ReceiptSnapshot``: an immutable tuple with the
+    receipt date, its register, sold items (product name, price and
+    quantity) and the total amount. The same snapshot is shared by all
+    adapters, so they must not query the database.
+
+    Adapters written for the ``Receipt`` model can set ``legacy = True``
+    to keep receiving the model instance. Adapters that push to the
+    device of each ``Register`` set ``per_device = True``, so that each
+    device has its own circuit breaker.
     """
-    def push(self, items):
+    legacy = False
+    per_device = False
+
+    def push(self, snapshot):
         """
         Push method is called when the serializer or the Django admin
         stores data in the selected database. This method MUST be
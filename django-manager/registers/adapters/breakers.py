@@ -0,0 +1,116 @@
+import time
+import logging
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.module_loading import import_string
+
+from .utils import slugify
+from .registry import adapter_name
+from ..exceptions import AdapterPushFailed, AdapterUnavailable
+
+
+logger = logging.getLogger(__name__)
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half-open'
+
+
+class CircuitBreaker(object):
+    """
+    CircuitBreaker stops calling an ``Adapter`` that keeps failing, so that
+    requests don't wait for its timeouts during an outage:
+        * ``closed``: the adapter is called and failures are counted
+        * ``open``: after ``ADAPTERS_CIRCUIT_THRESHOLD`` consecutive failures,
+          ``AdapterUnavailable`` is raised without calling the adapter
+        * ``half-open``: after ``ADAPTERS_CIRCUIT_RESET_TIMEOUT`` seconds, one
+          request probes the adapter; a success closes the circuit, while
+          a failure opens it again
+
+    The state is stored in the Django cache so that it's shared between
+    workers when the cache backend is shared; failures are counted with
+    ``cache.incr()``, so concurrent workers don't lose failures. Only
+    failures of the external service (``AdapterPushFailed`` with a 5xx
+    status) are counted.
+    """
+    def __init__(self, name):
+        self.name = name
+        self.key = 'registers:circuit:{}'.format(slugify(name))
+        self.failures_key = '{}:failures'.format(self.key)
+        self.opened_key = '{}:opened'.format(self.key)
+        self.probe_key = '{}:probe'.format(self.key)
+
+    @classmethod
+    def for_adapter(cls, adapter, port=None):
+        """
+        Returns the ``CircuitBreaker`` of the given adapter instance or
+        dotted path, without initializing the adapter. Adapters with
+        ``per_device = True`` have a circuit for each register device
+        (``port``), so that an unplugged printer doesn't disable the other
+        registers; other adapters (i.e. network services) have one circuit.
+        """
+        name = adapter_name(adapter)
+        if isinstance(adapter, str):
+            adapter = import_string(adapter)
+        if port and getattr(adapter, 'per_device', False) is True:
+            name = '{} on {}'.format(name, port)
+        return cls(name)
+
+    @property
+    def failures(self):
+        return cache.get(self.failures_key, 0)
+
+    @property
+    def state(self):
+        opened_at = cache.get(self.opened_key)
+        if opened_at is None:
+            return CLOSED
+        if time.time() - opened_at < settings.ADAPTERS_CIRCUIT_RESET_TIMEOUT:
+            return OPEN
+        return HALF_OPEN
+
+    def call(self, func, *args, **kwargs):
+        """
+        Calls the given function if the circuit allows it, updating
+        the circuit state with the result.
+        """
+        state = self.state
+        if state == OPEN:
+            raise AdapterUnavailable
+        if state == HALF_OPEN and not cache.add(self.probe_key, True, settings.ADAPTERS_CIRCUIT_RESET_TIMEOUT):
+            # another request is already probing the adapter
+            raise AdapterUnavailable
+
+        try:
+            result = func(*args, **kwargs)
+        except AdapterPushFailed as e:
+            if e.status_code >= 500:
+                self.record_failure(state)
+            raise
+        else:
+            if state != CLOSED or self.failures:
+                self.reset()
+            return result
+
+    def record_failure(self, state=CLOSED):
+        cache.add(self.failures_key, 0, timeout=None)
+        try:
+            failures = cache.incr(self.failures_key)
+        except ValueError:
+            # the circuit has been reset in the meantime
+            cache.add(self.failures_key, 1, timeout=None)
+            failures = 1
+
+        if state == HALF_OPEN or failures >= settings.ADAPTERS_CIRCUIT_THRESHOLD:
+            if state == HALF_OPEN or cache.get(self.opened_key) is None:
+                logger.warning('circuit opened for %s after %d failures', self.name, failures)
+            cache.set(self.opened_key, time.time(), timeout=None)
+            cache.delete(self.probe_key)
+
+    def reset(self):
+        """
+        Closes the circuit, forgetting previous failures.
+        """
+        cache.delete_many([self.failures_key, self.opened_key, self.probe_key])
+        logger.info('circuit closed for %s', self.name)
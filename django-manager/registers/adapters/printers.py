@@ -1,40 +1,179 @@
+import os
+import logging
+import threading
+
+from concurrent.futures import ThreadPoolExecutor
+
 from django.conf import settings
 
-from serial import Serial, SerialException
+from serial import Serial, SerialException, serial_for_url
 from cash_register.models.xditron import SaremaX1
 
 from .base import BaseAdapter
+from .queues import PrintQueue
+from ..receipts import convert_snapshot
 from ..exceptions import CashRegisterNotReady
 
 
+logger = logging.getLogger(__name__)
+
+# devices are created lazily and reused by all receipts of this process
+_devices = {}
+_devices_pid = None
+_devices_lock = threading.Lock()
+
+
+class SerialDevice(object):
+    """
+    SerialDevice keeps one persistent serial connection to a cash
+    register and a single worker thread that writes on it. Receipts sent
+    to the same device are printed one after the other, while different
+    devices print in parallel. The ``PrintQueue`` extends the same
+    guarantee to all workers of the host, rejecting receipts when
+    too many of them are waiting.
+
+    The device is also the connection handler given to ``SaremaX1``:
+    ``send()`` opens and closes the connection for each receipt, so
+    ``close()`` keeps the port open and the connection is reused.
+    """
+    def __init__(self, name, port, baudrate, xonxoff, timeout):
+        self.name = name
+        self.port = port
+        self.baudrate = baudrate
+        self.xonxoff = xonxoff
+        self.timeout = timeout
+        self._conn = None
+        self._worker = ThreadPoolExecutor(max_workers=1)
+        self.queue = PrintQueue(port)
+
+    def open(self):
+        if self._conn is None:
+            if '://' in self.port:
+                # URL handlers like ``socket://`` or ``rfc2217://``
+                conn = serial_for_url(self.port, do_not_open=True)
+            else:
+                conn = Serial()
+                conn.port = self.port
+            conn.baudrate = self.baudrate
+            conn.xonxoff = self.xonxoff
+            conn.timeout = self.timeout
+            conn.write_timeout = self.timeout
+            conn.open()
+            self._conn = conn
+            logger.debug('serial connection opened on %s', self.port)
+
+    def write(self, data):
+        self._conn.write(data)
+
+    def flush(self):
+        self._conn.flush()
+
+    def close(self):
+        # the connection is kept open for the next receipt
+        pass
+
+    def reset(self):
+        """
+        Closes the serial connection; the next receipt opens it again.
+        """
+        if self._conn is not None:
+            try:
+                self._conn.close()
+            except SerialException:
+                pass
+            self._conn = None
+
+    def _print(self, items):
+        with self.queue.lock():
+            try:
+                register = SaremaX1(self.name, connection=self)
+                register.sell_products(items)
+                register.send()
+            except SerialException:
+                # a broken connection must not be reused
+                self.reset()
+                raise
+
+    def print(self, items):
+        """
+        Prints the given items using the device worker, waiting
+        until the receipt is sent to the cash register. If the
+        device queue is full, ``CashRegisterBusy`` is raised.
+        """
+        with self.queue.slot():
+            return self._worker.submit(self._print, items).result()
+
+    def shutdown(self):
+        self._worker.shutdown(wait=True)
+        self.reset()
+
+
+def get_device(register=None):
+    """
+    Returns the ``SerialDevice`` for the given ``Register`` (a model or
+    a ``RegisterConfig``), creating it if it's the first time it's used
+    in this process. If no ``Register``
+    is given, the default device defined in settings is used.
+    """
+    global _devices_pid
+    if register is not None:
+        config = (register.name, register.serial_port, register.baudrate, register.xonxoff, register.timeout)
+    else:
+        config = (
+            settings.REGISTER_NAME,
+            settings.SERIAL_PORT,
+            settings.SERIAL_BAUDRATE,
+            settings.SERIAL_XONXOFF,
+            settings.SERIAL_TIMEOUT,
+        )
+
+    with _devices_lock:
+        # connections and threads are not inherited by forked workers
+        if _devices_pid != os.getpid():
+            _devices.clear()
+            _devices_pid = os.getpid()
+
+        device = _devices.get(config)
+        if device is None:
+            # a changed configuration replaces the previous device
+            for key in [key for key in _devices if key[1] == config[1]]:
+                _devices.pop(key).shutdown()
+            device = _devices[config] = SerialDevice(*config)
+        return device
+
+
+def shutdown_devices():
+    """
+    Closes all serial connections and stops all device workers.
+    """
+    with _devices_lock:
+        for device in _devices.values():
+            device.shutdown()
+        _devices.clear()
+
+
 class CashRegisterAdapter(BaseAdapter):
     """
     CashRegisterAdapter uses the `python-cash-register` module
     to push data to a real cash register. This is useful if you want
     to use a web UI (or the Django Admin) to create your receipt.
 
+    Each ``Receipt`` is printed by the device of its ``Register``, or
+    by the default device if the receipt is not bound to a register.
+
     Data are still persisted in the database so that backfilling
     can be done.
     """
-    def push(self, items):
+    per_device = True
+
+    def push(self, snapshot):
         """
-        Function that prints the passed arguments using a connected
+        Function that prints the given `ReceiptSnapshot` using a connected
         cash register. It handles the serial communication, raising
         an exception if something goes wrong.
         """
         try:
-            # define the serial port
-            conn = Serial()
-            conn.port = settings.SERIAL_PORT
-            conn.baudrate = settings.SERIAL_BAUDRATE
-            conn.xonxoff = settings.SERIAL_XONXOFF
-            conn.timeout = settings.SERIAL_TIMEOUT
-
-            # create a cash register with a serial connection handler
-            register = SaremaX1(settings.REGISTER_NAME, connection=conn)
-
-            # prepare and send cash register commands
-            register.sell_products(items)
-            register.send()
+            device = get_device(snapshot.register)
+            device.print(convert_snapshot(snapshot))
         except SerialException:
             raise CashRegisterNotReady
@@ -0,0 +1,93 @@
+import os
+import time
+import fcntl
+import logging
+
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .utils import slugify
+from ..exceptions import CashRegisterBusy
+
+
+logger = logging.getLogger(__name__)
+
+
+class PrintQueue(object):
+    """
+    PrintQueue serializes the access to a cash register between all
+    workers of this host, so that only one of them writes on the serial
+    port at a time:
+        * ``slot()`` reserves a place in the queue and raises
+          ``CashRegisterBusy`` if the queue is full
+        * ``lock()`` waits for the device lock file
+
+    The queue depth is stored in the Django cache so that it's shared
+    between workers when the cache backend is shared.
+    """
+    def __init__(self, port):
+        name = slugify(port) or 'default'
+        self.depth_key = 'registers:queue:{}'.format(name)
+        self.lock_path = os.path.join(settings.PRINT_QUEUE_LOCK_DIR, 'cash-register-{}.lock'.format(name))
+
+    @property
+    def depth(self):
+        """
+        Number of receipts that are waiting or printing on this device.
+        """
+        return cache.get(self.depth_key, 0)
+
+    @contextmanager
+    def slot(self):
+        # counters expire so that receipts lost by a killed worker
+        # don't block the queue forever
+        while True:
+            if cache.add(self.depth_key, 1, timeout=settings.PRINT_QUEUE_TIMEOUT * 10):
+                depth = 1
+                break
+            try:
+                depth = cache.incr(self.depth_key)
+                break
+            except ValueError:
+                # the counter expired in the meantime, and it may be
+                # added again by another worker
+                continue
+
+        try:
+            if depth > settings.PRINT_QUEUE_MAX_DEPTH:
+                logger.warning('print queue is full (%d receipts) for %s', depth - 1, self.lock_path)
+                raise CashRegisterBusy
+            yield depth
+        finally:
+            try:
+                cache.decr(self.depth_key)
+            except ValueError:
+                pass
+
+    @contextmanager
+    def lock(self):
+        """
+        Acquires the device lock file, waiting at most ``PRINT_QUEUE_TIMEOUT``
+        seconds. The lock is released by the kernel even if the worker
+        is killed while printing.
+        """
+        fd = os.open(self.lock_path, os.O_RDWR | os.O_CREAT, 0o664)
+        try:
+            deadline = time.monotonic() + settings.PRINT_QUEUE_TIMEOUT
+            while True:
+                try:
+                    fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    break
+                except BlockingIOError:
+                    if time.monotonic() > deadline:
+                        raise CashRegisterBusy
+                    time.sleep(0.01)
+
+            try:
+                yield
+            finally:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+        finally:
+            os.close(fd)
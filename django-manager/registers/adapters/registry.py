@@ -0,0 +1,60 @@
+import os
+import threading
+
+from django.conf import settings
+from django.dispatch import receiver
+from django.core.signals import setting_changed
+from django.utils.module_loading import import_string
+
+
+# adapters of the current process
+_adapters = None
+_adapters_pid = None
+_adapters_lock = threading.Lock()
+
+
+def adapter_name(adapter):
+    """
+    Returns the dotted path of the given ``PUSH_ADAPTERS`` entry, that
+    is either an adapter instance or its dotted path.
+    """
+    if isinstance(adapter, str):
+        return adapter
+    adapter_class = type(adapter)
+    return '{}.{}'.format(adapter_class.__module__, adapter_class.__name__)
+
+
+def get_adapters():
+    """
+    Returns the ``PUSH_ADAPTERS`` instances of the current process. Adapters
+    are imported and initialized when they are used for the first time,
+    so that heavy modules and background threads (i.e. the Datadog flush
+    thread) are not created at startup, nor inherited by forked workers.
+    Entries that are already instances are returned as they are.
+    """
+    global _adapters, _adapters_pid
+    with _adapters_lock:
+        # threads are not inherited by forked workers
+        if _adapters is None or _adapters_pid != os.getpid():
+            _adapters = [
+                import_string(adapter)() if isinstance(adapter, str) else adapter
+                for adapter in settings.PUSH_ADAPTERS
+            ]
+            _adapters_pid = os.getpid()
+        return _adapters
+
+
+def reset_adapters():
+    """
+    Forgets the adapters of the current process, so that they are
+    initialized again when they are used.
+    """
+    global _adapters
+    with _adapters_lock:
+        _adapters = None
+
+
+@receiver(setting_changed)
+def _reset_adapters_on_change(setting, **kwargs):
+    if setting == 'PUSH_ADAPTERS':
+        reset_adapters()
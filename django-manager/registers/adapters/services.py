@@ -14,12 +14,12 @@ logger = logging.getLogger(__name__)
 
 class DatadogAdapter(BaseAdapter):
     """
-    DatadogAdapter sends the given `Receipt` values to a local
+    DatadogAdapter sends the given `ReceiptSnapshot` values to a local
     Datadog agent via dogstatsd.
     """
-    METRIC_PREFIX = 'shop.{}'.format(slugify(settings.REGISTER_NAME))
-
     def __init__(self):
+        self.metric_prefix = 'shop.{}'.format(slugify(settings.REGISTER_NAME))
+
         # prepare the statsd client
         options = {
             'api_key': settings.DATADOG_API_KEY,
@@ -32,32 +32,32 @@ class DatadogAdapter(BaseAdapter):
         self.statsd.start(flush_interval=1, roll_up_interval=1, disabled=disabled)
         logger.debug('statsd thread initialized, disabled: %s', disabled)
 
-    def push(self, receipt):
+    def push(self, snapshot):
         """
-        Sends data to a local Datadog agent. The `Receipt` products
+        Sends data to a local Datadog agent. The `ReceiptSnapshot` products
         are properly tagged using a stringify function so that
         they can be easily aggregated through Datadog backend.
         """
         try:
             # count the receipt
-            timestamp = receipt.date.timestamp()
-            count_metric = '{prefix}.receipt.count'.format(prefix=self.METRIC_PREFIX)
+            timestamp = snapshot.date.timestamp()
+            count_metric = '{prefix}.receipt.count'.format(prefix=self.metric_prefix)
             self.statsd.increment(count_metric, timestamp=timestamp)
 
-            for item in receipt.sell_set.all():
+            for item in snapshot.items:
                 # generate tags and metrics name
-                tags = ['product:{}'.format(slugify(item.product.name))]
-                items_count = '{prefix}.receipt.items.count'.format(prefix=self.METRIC_PREFIX)
-                receipt_amount = '{prefix}.receipt.amount'.format(prefix=self.METRIC_PREFIX)
+                tags = ['product:{}'.format(slugify(item.product))]
+                items_count = '{prefix}.receipt.items.count'.format(prefix=self.metric_prefix)
+                receipt_amount = '{prefix}.receipt.amount'.format(prefix=self.metric_prefix)
 
                 # compute item metrics
                 quantity = item.quantity
-                total = float((item.price * item.quantity).amount)
+                total = float(item.total)
 
                 # send data
                 self.statsd.increment(items_count, timestamp=timestamp, value=quantity, tags=tags)
                 self.statsd.increment(receipt_amount, timestamp=timestamp, value=total, tags=tags)
 
-            logger.debug('pushed metrics for %d sold items', receipt.sell_set.count())
+            logger.debug('pushed metrics for %d sold items', len(snapshot.items))
         except Exception:
             raise AdapterPushFailed
@@ -1,7 +1,27 @@
 from django.conf import settings
-from django.contrib import admin
+from django.conf.urls import url
+from django.contrib import admin, messages
+from django.contrib.admin.actions import delete_selected
+from django.core.urlresolvers import reverse
+from django.http import HttpResponse, HttpResponseRedirect
+from django.shortcuts import get_object_or_404
+from django.template.response import TemplateResponse
+from django.utils.html import format_html
+from django.db.models import Count, DecimalField, F, IntegerField, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
 
-from .models import Product, Receipt, Sell
+from .db import use_replica
+from .dispatch import push_receipts
+from .adapters.queues import PrintQueue
+from .adapters.breakers import CLOSED, CircuitBreaker
+from .models import Product, ProductSales, Profile, Receipt, Register, Sell, TillToken
+from .profiling import get_sample_rate, set_sample_rate
+from .authentication import revoke_tokens
+
+
+# precision of receipt totals
+TOTAL_FIELD = DecimalField(max_digits=20, decimal_places=5)
 
 
 def backfill(modeladmin, request, queryset):
@@ -9,36 +29,327 @@ def backfill(modeladmin, request, queryset):
     Re-launch the adapters for the given `Receipt`
     queryset.
     """
-    for receipt in queryset:
-        for adapter in settings.PUSH_ADAPTERS:
-            # re-push data
-            adapter.push(receipt)
+    # re-push data
+    push_receipts(queryset)
 backfill.short_description = 'Backfill data using Adapters'  # noqa
 
 
+def delete_receipts(modeladmin, request, queryset):
+    """
+    Deletes the selected ``Receipt`` queryset like the default
+    ``delete_selected`` action, and updates the counters of their days.
+    """
+    days = {timezone.localtime(date).date() for date in queryset.values_list('date', flat=True)}
+    response = delete_selected(modeladmin, request, queryset)
+    # a response is returned by the confirmation page
+    if response is None:
+        for day in sorted(days):
+            ProductSales.objects.rebuild(day)
+    return response
+delete_receipts.short_description = delete_selected.short_description  # noqa
+
+
+def get_breakers():
+    """
+    Returns the ``CircuitBreaker`` of each adapter, for the default device
+    and for the device of each ``Register`` if the adapter has a circuit
+    for each device.
+    """
+    ports = [None] + list(Register.objects.order_by('serial_port').values_list('serial_port', flat=True).distinct())
+    breakers = {}
+    for adapter in settings.PUSH_ADAPTERS:
+        for port in ports:
+            breaker = CircuitBreaker.for_adapter(adapter, port)
+            breakers.setdefault(breaker.name, breaker)
+    return list(breakers.values())
+
+
+class ReplicaChangeListMixin:
+    """
+    Reads changelist pages from the database replica, if it's configured.
+    Changelist actions (POST) use the default database.
+    """
+    def changelist_view(self, request, extra_context=None):
+        if request.method != 'GET':
+            return super().changelist_view(request, extra_context)
+
+        with use_replica():
+            response = super().changelist_view(request, extra_context)
+            # querysets are evaluated when the template is rendered
+            if hasattr(response, 'render'):
+                response.render()
+            return response
+
+
 class SellInline(admin.TabularInline):
     model = Sell
     extra = 1
 
+    def get_queryset(self, request):
+        """
+        Sold items are rendered with their ``Product`` name, so the
+        relationship is retrieved in the same query.
+        """
+        return super().get_queryset(request).select_related('product')
+
+    def formfield_for_foreignkey(self, db_field, request, **kwargs):
+        """
+        Each inline row renders a ``Product`` select; choices are
+        evaluated once per request and shared between all rows,
+        otherwise the products table is queried for every row.
+        """
+        field = super().formfield_for_foreignkey(db_field, request, **kwargs)
+        if db_field.name == 'product':
+            if not hasattr(request, '_product_choices'):
+                request._product_choices = list(field.choices)
+            field.choices = request._product_choices
+        return field
+
 
 @admin.register(Receipt)
-class ReceiptAdmin(admin.ModelAdmin):
-    actions = [backfill]
+class ReceiptAdmin(ReplicaChangeListMixin, admin.ModelAdmin):
+    actions = [backfill, delete_receipts]
     ordering = ['-date']
+    date_hierarchy = 'date'
+    list_display = ['date', 'register', 'items_count', 'total']
+    list_filter = ['date', 'register']
+    list_select_related = ['register']
     inlines = [
         SellInline,
     ]
 
+    def get_queryset(self, request):
+        """
+        Totals and items count are computed by the database in the
+        changelist query, so that rendering a page of receipts doesn't
+        execute one aggregation per row. Sold items are filtered by
+        the receipt date too, so that only the partition of the
+        receipt month is read.
+        """
+        queryset = super().get_queryset(request)
+        sells = Sell.objects.filter(receipt=OuterRef('pk'), date=OuterRef('date')).order_by().values('receipt')
+        items = sells.annotate(items=Count('pk')).values('items')
+        total = sells.annotate(total=Sum(F('price') * F('quantity'), output_field=TOTAL_FIELD)).values('total')
+        return queryset.annotate(
+            receipt_items=Coalesce(Subquery(items, output_field=IntegerField()), 0),
+            receipt_total=Subquery(total, output_field=TOTAL_FIELD),
+        )
+
+    def get_actions(self, request):
+        """
+        Replaces the default bulk delete, that doesn't update the counters.
+        """
+        actions = super().get_actions(request)
+        actions.pop('delete_selected', None)
+        return actions
+
+    def items_count(self, obj):
+        return obj.receipt_items
+    items_count.short_description = 'Items'  # noqa
+    items_count.admin_order_field = 'receipt_items'
+
+    def total(self, obj):
+        return '{0:.2f}'.format(obj.receipt_total or 0)
+    total.short_description = 'Total'  # noqa
+    total.admin_order_field = 'receipt_total'
+
+    def get_urls(self):
+        urls = [
+            url(r'^adapters/$', self.admin_site.admin_view(self.adapters_view), name='registers_adapters'),
+        ]
+        return urls + super().get_urls()
+
+    def adapters_view(self, request):
+        """
+        Shows the circuit breaker state of each registered ``Adapter``,
+        allowing to close an open circuit.
+        """
+        breakers = get_breakers()
+        if request.method == 'POST':
+            for breaker in breakers:
+                if breaker.name == request.POST.get('reset'):
+                    breaker.reset()
+                    self.message_user(request, 'Circuit closed for {}'.format(breaker.name))
+            return HttpResponseRedirect(request.path)
+
+        context = dict(
+            self.admin_site.each_context(request),
+            title='Adapters status',
+            opts=self.model._meta,
+            breakers=breakers,
+        )
+        return TemplateResponse(request, 'admin/registers/adapters.html', context)
+
+    def changelist_view(self, request, extra_context=None):
+        """
+        Warns about adapters that are disabled because of failures.
+        """
+        for breaker in get_breakers():
+            if breaker.state != CLOSED:
+                message = format_html(
+                    '{} is disabled after repeated failures (<a href="{}">adapters status</a>)',
+                    breaker.name,
+                    reverse('admin:registers_adapters'),
+                )
+                self.message_user(request, message, messages.WARNING)
+        return super().changelist_view(request, extra_context)
+
     def save_related(self, request, form, formsets, change):
         """
-        Publish data to registered `Adapters`.
+        Publish data to registered `Adapters`. Sold items may be changed
+        in any way, so the ``ProductSales`` counters of the involved days
+        are recomputed.
         """
         # save the model as usual
         super().save_related(request, form, formsets, change)
         instance = form.instance
+        # the previous date is available only when editing the receipt
+        dates = {instance.date, form.initial.get('date', instance.date)}
+        for day in {timezone.localtime(date).date() for date in dates}:
+            ProductSales.objects.rebuild(day)
         # push data
-        for adapter in settings.PUSH_ADAPTERS:
-            adapter.push(instance)
+        push_receipts([instance])
+
+    def delete_model(self, request, obj):
+        """
+        Removes the ``Receipt`` and updates the counters of its day.
+        """
+        super().delete_model(request, obj)
+        ProductSales.objects.rebuild(timezone.localtime(obj.date).date())
+
+
+@admin.register(Product)
+class ProductAdmin(ReplicaChangeListMixin, admin.ModelAdmin):
+    list_display = ['name', 'default_price']
+    ordering = ['name']
+    search_fields = ['name']
+
+
+@admin.register(ProductSales)
+class ProductSalesAdmin(ReplicaChangeListMixin, admin.ModelAdmin):
+    date_hierarchy = 'day'
+    list_display = ['day', 'product', 'quantity', 'revenue']
+    list_select_related = ['product']
+    ordering = ['-day', '-quantity']
+
+
+@admin.register(Register)
+class RegisterAdmin(admin.ModelAdmin):
+    list_display = ['name', 'serial_port', 'user', 'queue_depth']
+    list_select_related = ['user']
+    ordering = ['name']
+
+    def queue_depth(self, obj):
+        return PrintQueue(obj.serial_port).depth
+    queue_depth.short_description = 'Print queue'  # noqa
+
+
+def revoke(modeladmin, request, queryset):
+    """
+    Revokes the selected tokens, so that till devices cannot use them anymore.
+    """
+    queryset.update(revoked=True)
+    revoke_tokens()
+revoke.short_description = 'Revoke selected tokens'  # noqa
+
+
+@admin.register(TillToken)
+class TillTokenAdmin(admin.ModelAdmin):
+    list_display = ['__str__', 'register', 'user', 'created', 'revoked']
+    list_filter = ['revoked', 'register']
+    list_select_related = ['register', 'user']
+    readonly_fields = ['key', 'created']
+    actions = [revoke]
+
 
+@admin.register(Profile)
+class ProfileAdmin(admin.ModelAdmin):
+    date_hierarchy = 'created'
+    list_display = ['created', 'method', 'path', 'register', 'user', 'status_code', 'duration_ms', 'samples',
+                    'downloads']
+    list_filter = ['method', 'status_code', 'register']
+    list_select_related = ['register', 'user']
+    exclude = ['stacks', 'pstats']
+    readonly_fields = ['created', 'method', 'path', 'register', 'user', 'status_code', 'duration', 'samples',
+                       'downloads']
 
-admin.site.register(Product)
+    def get_queryset(self, request):
+        # profiles are downloaded, not rendered
+        return super().get_queryset(request).defer('stacks', 'pstats')
+
+    def has_add_permission(self, request):
+        return False
+
+    def duration_ms(self, obj):
+        return '{:.1f}ms'.format(obj.duration)
+    duration_ms.short_description = 'Duration'  # noqa
+    duration_ms.admin_order_field = 'duration'
+
+    def downloads(self, obj):
+        return format_html(
+            '<a href="{}">flame graph stacks</a> | <a href="{}">pstats</a>',
+            reverse('admin:registers_profile_stacks', args=[obj.pk]),
+            reverse('admin:registers_profile_pstats', args=[obj.pk]),
+        )
+    downloads.short_description = 'Downloads'  # noqa
+
+    def get_urls(self):
+        urls = [
+            url(r'^sampling/$', self.admin_site.admin_view(self.sampling_view), name='registers_profile_sampling'),
+            url(r'^(?P<pk>\d+)/stacks/$', self.admin_site.admin_view(self.stacks_view),
+                name='registers_profile_stacks'),
+            url(r'^(?P<pk>\d+)/pstats/$', self.admin_site.admin_view(self.pstats_view),
+                name='registers_profile_pstats'),
+        ]
+        return urls + super().get_urls()
+
+    def sampling_view(self, request):
+        """
+        Changes how many API requests are profiled, for a limited time.
+        """
+        if request.method == 'POST':
+            try:
+                rate = max(int(request.POST['rate']), 0)
+                minutes = max(int(request.POST['minutes']), 1)
+            except (KeyError, ValueError):
+                self.message_user(request, 'Use an integer rate and duration.', messages.ERROR)
+            else:
+                set_sample_rate(rate, timeout=minutes * 60)
+                if rate:
+                    self.message_user(request, '1 out of {} requests is profiled for {} minutes'.format(rate, minutes))
+                else:
+                    self.message_user(request, 'Sampling disabled for {} minutes'.format(minutes))
+            return HttpResponseRedirect(request.path)
+
+        context = dict(
+            self.admin_site.each_context(request),
+            title='Profiling',
+            opts=self.model._meta,
+            rate=get_sample_rate(),
+        )
+        return TemplateResponse(request, 'admin/registers/profiling.html', context)
+
+    def stacks_view(self, request, pk):
+        """
+        Downloads the sampled stacks, i.e. for ``flamegraph.pl`` or speedscope.
+        """
+        profile = get_object_or_404(Profile.objects.only('stacks'), pk=pk)
+        response = HttpResponse(profile.stacks, content_type='text/plain; charset=utf-8')
+        response['Content-Disposition'] = 'attachment; filename="profile-{}.folded"'.format(pk)
+        return response
+
+    def pstats_view(self, request, pk):
+        """
+        Downloads the ``cProfile`` statistics, i.e. for ``pstats`` or snakeviz.
+        """
+        profile = get_object_or_404(Profile.objects.only('pstats'), pk=pk)
+        response = HttpResponse(bytes(profile.pstats), content_type='application/octet-stream')
+        response['Content-Disposition'] = 'attachment; filename="profile-{}.pstats"'.format(pk)
+        return response
+
+    def changelist_view(self, request, extra_context=None):
+        """
+        Shows the sampling status, linking its page.
+        """
+        extra_context = dict(extra_context or {}, sample_rate=get_sample_rate())
+        return super().changelist_view(request, extra_context)
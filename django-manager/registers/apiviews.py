@@ -1,50 +1,177 @@
-from django.db import transaction
+import os
+import json
+
+from datetime import datetime, time
+
 from django.conf import settings
+from django.http import StreamingHttpResponse
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_date
 
 from rest_framework import mixins, viewsets
+from rest_framework.decorators import list_route
+from rest_framework.exceptions import ValidationError
 from rest_framework.permissions import IsAdminUser
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
 
-from .models import Product, Receipt
-from .serializers import ProductSerializer, ReceiptSerializer
+from .archive import scan
+from .db import use_replica
+from .dispatch import push_receipts
+from .imports import import_products, parse_products
+from .pagination import SearchPagination
+from .profiling import ProfilingMixin
+from .parsers import MessagePackParser
+from .renderers import MessagePackRenderer
+from .search import search_products
+from .models import Product, ProductSales, Receipt, Register
+from .serializers import FastReceiptSerializer, ProductSerializer, ProductSalesSerializer, ReceiptSerializer
 
 
-class ProductViewSet(mixins.ListModelMixin, viewsets.GenericViewSet):
+class ProductViewSet(ProfilingMixin, mixins.ListModelMixin, viewsets.GenericViewSet):
     """
-    The ``ProductViewSet`` API, provides only the list of the configured
-    products, and doesn't allow any [C-UD] interaction.
+    The ``ProductViewSet`` API, provides the list of the configured
+    products, a search by name and a bulk import, and doesn't allow any
+    other [C-UD] interaction. Besides JSON, products are rendered with
+    MessagePack if the client accepts it. Products are read from the
+    database replica, if it's configured. Requests may be profiled (see
+    ``ProfilingMixin``).
     """
     permission_classes = (IsAdminUser,)
+    renderer_classes = api_settings.DEFAULT_RENDERER_CLASSES + [MessagePackRenderer]
 
     queryset = Product.objects.all()
     serializer_class = ProductSerializer
 
+    @use_replica()
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    @list_route(url_path='top-sellers')
+    @use_replica()
+    def top_sellers(self, request):
+        """
+        Returns the most sold products of a day, using the materialized
+        ``ProductSales`` counters. Optional query parameters are:
+            * ``day``: ISO date of the counters (default: today)
+            * ``limit``: how many products are returned (default: 10)
+        """
+        try:
+            day = parse_date(request.query_params.get('day', '')) or timezone.localdate()
+            limit = int(request.query_params.get('limit', 10))
+        except ValueError:
+            raise ValidationError('Use a valid ISO date and an integer limit.')
+
+        counters = ProductSales.objects.top_sellers(day, limit=max(limit, 0))
+        serializer = ProductSalesSerializer(counters, many=True)
+        return Response(serializer.data)
+
+    @list_route()
+    @use_replica()
+    def search(self, request):
+        """
+        Returns a page of products whose name starts with or contains the
+        ``q`` query parameter, with prefix matches first. Pages are selected
+        with the ``limit`` (default: 20) and ``offset`` query parameters.
+        """
+        query = request.query_params.get('q', '').strip()
+        if not query:
+            raise ValidationError({'q': ['This query parameter is required.']})
+
+        paginator = SearchPagination()
+        page = paginator.paginate_queryset(search_products(query), request, view=self)
+        # only products of the requested page are loaded
+        products = Product.objects.in_bulk(page)
+        serializer = self.get_serializer([products[pk] for pk in page if pk in products], many=True)
+        return paginator.get_paginated_response(serializer.data)
 
-class ReceiptViewSet(mixins.CreateModelMixin, viewsets.GenericViewSet):
+    @list_route(methods=['post'], url_path='import')
+    def bulk_import(self, request):
+        """
+        Creates or updates products by name, with a few queries for the
+        whole catalog. Products are sent either as a JSON list, or as a
+        multipart upload of a ``file`` (``.csv`` or ``.json``) with the
+        referenced ``icons`` files. Returns how many products have been
+        created, updated and left unchanged.
+        """
+        upload = request.FILES.get('file')
+        if upload is None:
+            rows = request.data
+        else:
+            format = os.path.splitext(upload.name)[1].lstrip('.').lower()
+            if format not in ('csv', 'json'):
+                raise ValidationError({'file': ['Use a .csv or a .json file.']})
+            rows = parse_products(upload, format)
+
+        # uploaded files are already open
+        icons = {icon.name: (lambda icon=icon: icon) for icon in request.FILES.getlist('icons')}
+        return Response(import_products(rows, icons))
+
+
+class ReceiptViewSet(ProfilingMixin, mixins.CreateModelMixin, viewsets.GenericViewSet):
     """
     The ``ReceiptViewSet`` API provides an endpoint to create a new ``Receipt``
     according to given products. Indeed the API is not related to a
     particular model but only makes use of a custom ``ReceiptSerializer``
     to store the new ``Receipt`` while printing a new receipt using a
-    connected device.
+    connected device. Receipts may be sent with MessagePack instead of JSON.
+    Requests may be profiled (see ``ProfilingMixin``).
     """
     permission_classes = (IsAdminUser,)
+    parser_classes = api_settings.DEFAULT_PARSER_CLASSES + [MessagePackParser]
+    renderer_classes = api_settings.DEFAULT_RENDERER_CLASSES + [MessagePackRenderer]
 
     queryset = Receipt.objects.all()
     serializer_class = ReceiptSerializer
 
+    @list_route()
+    def archived(self, request):
+        """
+        Streams the archived receipts as NDJSON (one receipt for each line),
+        reading only the archive segments of the requested dates. Optional
+        query parameters are ``start`` and ``end`` ISO dates (excluded).
+        """
+        dates = []
+        for name in ('start', 'end'):
+            value = request.query_params.get(name)
+            try:
+                day = parse_date(value) if value else None
+            except ValueError:
+                day = None
+            if value and day is None:
+                raise ValidationError('Use valid ISO dates.')
+            dates.append(timezone.make_aware(datetime.combine(day, time.min)) if day else None)
+        start, end = dates
+        lines = (json.dumps(receipt).encode() + b'\n' for receipt in scan(start, end))
+        return StreamingHttpResponse(lines, content_type='application/x-ndjson')
+
+    def get_serializer_class(self):
+        """
+        Uses the ``FastReceiptSerializer`` validation if it's enabled.
+        """
+        if settings.RECEIPTS_FAST_VALIDATION:
+            return FastReceiptSerializer
+        return self.serializer_class
+
     def perform_create(self, serializer):
         """
         Save the serializer so that the ``Receipt`` and connected models
-        are created, and call all registered ``Adapters``. If one of these
+        are created, and call all registered ``Adapters``. The ``Receipt``
+        is bound to the ``Register`` selected by the request. If one of these
         ``Adapters` fails, a rollback is executed; while this is true for
         many adapters, in general it's not possible to grant consistency because
         ``Adapters` may not have a possible rollback system, and even if
         it's available it may fail again.
         """
+        try:
+            register = Register.objects.for_request(self.request)
+        except Register.DoesNotExist:
+            raise ValidationError({'register': ['The selected register does not exist.']})
+
         with transaction.atomic():
             # create the ``Receipt`` model, honoring the ManyToMany
-            receipt = serializer.save()
-            for adapter in settings.PUSH_ADAPTERS:
-                # TODO: when an adapter is executed, we may store the
-                # execution so that it is not executed twice
-                adapter.push(receipt)
+            receipt = serializer.save(register=register)
+            # TODO: when an adapter is executed, we may store the
+            # execution so that it is not executed twice
+            push_receipts([receipt])
@@ -1,6 +1,7 @@
 from django.apps import AppConfig
-from django.conf import settings
-from django.utils.module_loading import import_string
+from django.core.signals import request_started
+
+from .db import check_connections
 
 
 class RegistersConfig(AppConfig):
@@ -8,7 +9,9 @@ class RegistersConfig(AppConfig):
 
     def ready(self):
         """
-        Initializes all `registers` adapters after the application is loaded.
+        Checks persistent database connections before each request, and
+        connects the signals that invalidate cached ``TillToken`` and
+        products catalog, and that generate ``Product`` icons.
         """
-        adapters_classes = [import_string(adapter) for adapter in settings.PUSH_ADAPTERS]
-        settings.PUSH_ADAPTERS = [Adapter() for Adapter in adapters_classes]
+        from . import authentication, catalog, icons  # noqa
+        request_started.connect(check_connections, dispatch_uid='registers.check_connections')
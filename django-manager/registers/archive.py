@@ -0,0 +1,229 @@
+import os
+import gzip
+import json
+import fcntl
+import logging
+
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .db import chunks, iterate
+from .models import Receipt, Sell
+from .partitions import months
+
+
+logger = logging.getLogger(__name__)
+
+INDEX_NAME = 'index.json'
+SEGMENT_PREFIX = 'receipts-{:%Y-%m}.'
+SEGMENT_NAME = SEGMENT_PREFIX + '{:04d}.ndjson.gz'
+
+
+def _path(name):
+    return os.path.join(settings.ARCHIVE_ROOT, name)
+
+
+def _write_durably(path, write):
+    """
+    Writes a file through a temporary file that is renamed when its
+    content is on disk, so that readers never see a partial file.
+    """
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as fp:
+        write(fp)
+        fp.flush()
+        os.fsync(fp.fileno())
+    os.rename(tmp_path, path)
+
+
+def read_index():
+    """
+    Returns the list of archived segments, in the order they have been
+    written. Each segment is a dict with:
+        * ``name``: the segment file name
+        * ``start`` and ``end``: the first and the last receipt date
+        * ``first_id`` and ``last_id``: the receipts primary key range
+        * ``receipts``: the number of receipts
+        * ``pending``: only set while the archived rows are being deleted
+    """
+    try:
+        with open(_path(INDEX_NAME)) as fp:
+            return json.load(fp)['segments']
+    except FileNotFoundError:
+        return []
+
+
+def _write_index(segments):
+    index = json.dumps({'segments': segments}, indent=2).encode()
+    _write_durably(_path(INDEX_NAME), lambda fp: fp.write(index))
+
+
+@contextmanager
+def _lock():
+    # only one process appends segments at a time
+    os.makedirs(settings.ARCHIVE_ROOT, exist_ok=True)
+    with open(_path('.lock'), 'w') as fp:
+        fcntl.flock(fp, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(fp, fcntl.LOCK_UN)
+
+
+def _records(receipts):
+    """
+    Returns the archive records of the given ``Receipt`` instances,
+    reading their sold items with one query.
+    """
+    dates = [receipt.date for receipt in receipts]
+    items = {}
+    sells = (
+        Sell.objects
+        # the date range selects the partitions of the receipts month
+        .filter(receipt__in=receipts, date__gte=min(dates), date__lte=max(dates))
+        .order_by('pk')
+        .values_list('receipt_id', 'product_id', 'product__name', 'price', 'price_currency', 'quantity')
+    )
+    for receipt_id, product_id, product, price, currency, quantity in sells:
+        items.setdefault(receipt_id, []).append({
+            'product_id': product_id,
+            'product': product,
+            'price': str(price),
+            'price_currency': currency,
+            'quantity': str(quantity),
+        })
+
+    return [
+        {
+            'id': receipt.pk,
+            'date': receipt.date.astimezone(timezone.utc).isoformat(),
+            'register': receipt.register.name if receipt.register else None,
+            'items': items.get(receipt.pk, []),
+        }
+        for receipt in receipts
+    ]
+
+
+def _delete_rows(ids, start, end, chunk_size):
+    """
+    Deletes archived receipts and their sold items, dated in the
+    ``[start, end]`` range. ``ProductSales`` counters are not changed.
+    """
+    for chunk in chunks(ids, chunk_size):
+        with transaction.atomic():
+            Sell.objects.filter(receipt_id__in=chunk, date__gte=start, date__lte=end).delete()
+            Receipt.objects.filter(pk__in=chunk).delete()
+
+
+def _finish_pending(segments, chunk_size):
+    """
+    Deletes the rows of segments written by a run that has been
+    interrupted before deleting them, so that they are not archived
+    again in a new segment.
+    """
+    pending = [segment for segment in segments if segment.get('pending')]
+    for segment in pending:
+        with gzip.open(_path(segment['name'])) as archive:
+            ids = [json.loads(line.decode())['id'] for line in archive]
+        _delete_rows(ids, parse_datetime(segment['start']), parse_datetime(segment['end']), chunk_size)
+        del segment['pending']
+        logger.warning('deleted %d receipts archived by an interrupted run in %s', len(ids), segment['name'])
+    if pending:
+        _write_index(segments)
+
+
+def archive_month(month, before, chunk_size=1000):
+    """
+    Moves receipts of the given month created before ``before`` and their
+    sold items to a new segment, and returns the segment or ``None`` if
+    there is nothing to archive. Rows are deleted only after the segment
+    and the index have been written to disk, while holding the archive
+    lock; the segment is marked as ``pending`` until all rows are deleted,
+    so that an interrupted deletion is completed by the next run instead
+    of archiving the same receipts twice.
+    """
+    start, end = (timezone.make_aware(datetime.combine(day, datetime.min.time()), timezone.utc)
+                  for day in months(month, 2))
+    queryset = Receipt.objects.filter(date__gte=start, date__lt=min(end, before)).select_related('register')
+
+    with _lock():
+        segments = read_index()
+        _finish_pending(segments, chunk_size)
+        sequence = sum(1 for segment in segments if segment['name'].startswith(SEGMENT_PREFIX.format(month)))
+        name = SEGMENT_NAME.format(month, sequence + 1)
+        archived = []
+        dates = []
+
+        def write(fp):
+            with gzip.GzipFile(fileobj=fp, mode='wb') as archive:
+                for receipts in chunks(iterate(queryset, chunk_size=chunk_size), chunk_size):
+                    for record in _records(receipts):
+                        archive.write(json.dumps(record, separators=(',', ':')).encode() + b'\n')
+                    archived.extend(receipt.pk for receipt in receipts)
+                    dates.extend(receipt.date for receipt in receipts)
+
+        _write_durably(_path(name), write)
+        if not archived:
+            os.remove(_path(name))
+            return None
+
+        segment = {
+            'name': name,
+            'start': min(dates).astimezone(timezone.utc).isoformat(),
+            'end': max(dates).astimezone(timezone.utc).isoformat(),
+            'first_id': min(archived),
+            'last_id': max(archived),
+            'receipts': len(archived),
+            'pending': True,
+        }
+        segments.append(segment)
+        _write_index(segments)
+        _delete_rows(archived, min(dates), max(dates), chunk_size)
+        del segment['pending']
+        _write_index(segments)
+
+    logger.info('archived %d receipts in %s', segment['receipts'], name)
+    return segment
+
+
+def archive_receipts(days=None):
+    """
+    Moves receipts older than ``days`` (default ``ARCHIVE_RETENTION_DAYS``)
+    to compressed, append-only segment files, one for each month. Returns
+    the written segments.
+    """
+    days = settings.ARCHIVE_RETENTION_DAYS if days is None else days
+    before = timezone.now() - timedelta(days=days)
+    first = Receipt.objects.filter(date__lt=before).order_by('date').values_list('date', flat=True).first()
+    if first is None:
+        return []
+
+    first = first.astimezone(timezone.utc)
+    count = (before.year - first.year) * 12 + before.month - first.month + 1
+    segments = [archive_month(month, before) for month in months(first, count)]
+    return [segment for segment in segments if segment is not None]
+
+
+def scan(start=None, end=None):
+    """
+    Returns the archived receipts with a date in the ``[start, end)``
+    range, reading only the segments that may include them. Receipts
+    are dicts with the same format of the archive records, and dates
+    must be timezone aware.
+    """
+    for segment in read_index():
+        if start is not None and parse_datetime(segment['end']) < start:
+            continue
+        if end is not None and parse_datetime(segment['start']) >= end:
+            continue
+        with gzip.open(_path(segment['name'])) as archive:
+            for line in archive:
+                receipt = json.loads(line.decode())
+                date = parse_datetime(receipt['date'])
+                if (start is None or date >= start) and (end is None or date < end):
+                    yield receipt
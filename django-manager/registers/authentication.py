@@ -0,0 +1,101 @@
+import time
+import uuid
+import threading
+
+from django.conf import settings
+from django.core.cache import cache
+from django.dispatch import receiver
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_delete, post_save
+
+from rest_framework.authentication import BaseAuthentication, get_authorization_header
+from rest_framework.exceptions import AuthenticationFailed
+
+from .models import TillToken
+
+
+# tokens resolved by this process: key -> (expires_at, generation, token)
+_tokens = {}
+_tokens_lock = threading.Lock()
+
+# changed when a token is revoked, so that all workers forget their tokens
+GENERATION_KEY = 'registers:tokens:generation'
+
+
+def get_token(key):
+    """
+    Returns the active ``TillToken`` of the given key, with its user and
+    register, or ``None`` if the key is not valid. Tokens are cached by
+    each process for ``TILL_TOKEN_CACHE_TTL`` seconds, so that API calls
+    of till devices don't query the database; the cache is invalidated
+    by ``revoke_tokens()`` in all processes that share the Django cache.
+    """
+    generation = cache.get(GENERATION_KEY)
+    now = time.monotonic()
+    entry = _tokens.get(key)
+    if entry is not None and entry[0] > now and entry[1] == generation:
+        return entry[2]
+
+    token = TillToken.objects.select_related('user', 'register').filter(key=key, revoked=False).first()
+    if token is not None:
+        with _tokens_lock:
+            if len(_tokens) >= settings.TILL_TOKEN_CACHE_SIZE:
+                _tokens.clear()
+            _tokens[key] = (now + settings.TILL_TOKEN_CACHE_TTL, generation, token)
+    return token
+
+
+def revoke_tokens():
+    """
+    Forgets cached tokens of all processes.
+    """
+    cache.set(GENERATION_KEY, uuid.uuid4().hex, timeout=None)
+    with _tokens_lock:
+        _tokens.clear()
+
+
+@receiver(post_save, sender=TillToken)
+@receiver(post_delete, sender=TillToken)
+def _revoke_on_token_change(sender, created=False, **kwargs):
+    if not created:
+        revoke_tokens()
+
+
+@receiver(post_save, sender=get_user_model())
+def _revoke_on_user_change(sender, instance, created, update_fields=None, **kwargs):
+    # permissions of cached users may have been changed, while
+    # logins only update the ``last_login`` field
+    if not created and update_fields != frozenset(['last_login']):
+        revoke_tokens()
+
+
+class TillTokenAuthentication(BaseAuthentication):
+    """
+    Authenticates till devices with their ``TillToken``, sent in the
+    ``Authorization: Token <key>`` header. Tokens are not bound to a
+    session, so CSRF checks are not enforced.
+    """
+    keyword = 'Token'
+
+    def authenticate(self, request):
+        auth = get_authorization_header(request).split()
+        if not auth or auth[0].lower() != self.keyword.lower().encode():
+            return None
+
+        if len(auth) != 2:
+            raise AuthenticationFailed('Invalid token header.')
+
+        try:
+            key = auth[1].decode()
+        except UnicodeError:
+            raise AuthenticationFailed('Invalid token header.')
+
+        token = get_token(key)
+        if token is None:
+            raise AuthenticationFailed('Invalid token.')
+        if not token.user.is_active:
+            raise AuthenticationFailed('User inactive or deleted.')
+        return (token.user, token)
+
+    def authenticate_header(self, request):
+        return self.keyword
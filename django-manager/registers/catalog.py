@@ -0,0 +1,69 @@
+import uuid
+
+from django.core.cache import cache
+from django.db import transaction
+from django.dispatch import receiver
+from django.db.models.signals import post_delete, post_save
+
+from rest_framework.renderers import JSONRenderer
+
+from .models import Product
+from .serializers import ProductSerializer
+
+
+# changed when a product is changed, so that all workers render the catalog again
+VERSION_KEY = 'registers:catalog:version'
+CATALOG_KEY = 'registers:catalog:{}'
+
+# characters that can't be included in an HTML <script> element
+SCRIPT_ESCAPES = {
+    ord('<'): '\\u003C',
+    ord('>'): '\\u003E',
+    ord('&'): '\\u0026',
+}
+
+
+def get_version():
+    """
+    Returns the current version of the products catalog.
+    """
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        # another worker may have set it in the meantime
+        cache.add(VERSION_KEY, uuid.uuid4().hex, timeout=None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+def invalidate_catalog():
+    """
+    Changes the catalog version, so that all workers that share the Django
+    cache render the catalog again.
+    """
+    cache.set(VERSION_KEY, uuid.uuid4().hex, timeout=None)
+
+
+def get_catalog():
+    """
+    Returns the current version of the products catalog, and the catalog
+    rendered as JSON. The catalog is rendered once for each version and
+    it's stored in the Django cache. The JSON is escaped so that it can
+    be included in an HTML ``<script>`` element.
+    """
+    version = get_version()
+    key = CATALOG_KEY.format(version)
+    catalog = cache.get(key)
+    if catalog is None:
+        products = ProductSerializer(Product.objects.all(), many=True).data
+        catalog = JSONRenderer().render(products).decode().translate(SCRIPT_ESCAPES)
+        # catalogs of previous versions expire with the default timeout
+        cache.set(key, catalog)
+    return version, catalog
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def _invalidate_on_product_change(sender, **kwargs):
+    # before the commit, other workers would cache the previous catalog
+    # (and the search index) under the new version
+    transaction.on_commit(invalidate_catalog)
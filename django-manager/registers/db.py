@@ -0,0 +1,121 @@
+import logging
+import threading
+
+from itertools import islice
+from contextlib import ContextDecorator
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+logger = logging.getLogger(__name__)
+
+# read-only scopes of the current thread
+_replica = threading.local()
+
+
+def check_connections(**kwargs):
+    """
+    Closes persistent connections that are not usable anymore (i.e. closed
+    by the database server), so that the request opens a new connection
+    instead of failing. It's connected to the ``request_started`` signal
+    and it's enabled by ``DATABASES_HEALTH_CHECKS``.
+    """
+    if not settings.DATABASES_HEALTH_CHECKS:
+        return
+
+    for connection in connections.all():
+        # only persistent connections that are already opened are checked
+        if connection.connection is None or not connection.settings_dict['CONN_MAX_AGE']:
+            continue
+        if connection.in_atomic_block:
+            continue
+        if not connection.is_usable():
+            logger.warning('closing unusable connection to database %s', connection.alias)
+            connection.close()
+
+
+def iterate(queryset, chunk_size=2000):
+    """
+    Iterates over the models of a large queryset without loading all of them
+    in memory. ``QuerySet.iterator()`` uses server-side cursors on PostgreSQL
+    that are not available through pgbouncer in transaction pooling mode, so
+    when ``DATABASES_PGBOUNCER`` is set rows are read in chunks ordered by
+    primary key, one query for each chunk.
+    """
+    if not settings.DATABASES_PGBOUNCER:
+        yield from queryset.iterator()
+        return
+
+    queryset = queryset.order_by('pk')
+    last_pk = None
+    while True:
+        chunk = queryset if last_pk is None else queryset.filter(pk__gt=last_pk)
+        chunk = list(chunk[:chunk_size])
+        if not chunk:
+            return
+        yield from chunk
+        last_pk = chunk[-1].pk
+
+
+def chunks(iterable, size):
+    """
+    Returns lists of ``size`` items of the given iterable (the last one
+    may be shorter), so that rows are read or written in batches.
+    """
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+class use_replica(ContextDecorator):
+    """
+    Marks a read-only path (i.e. a list or a report) whose queries can be
+    sent to the ``DATABASES_REPLICA`` database by the ``ReplicaRouter``.
+    It can be used as a context manager or as a decorator, and scopes can
+    be nested. Querysets must be evaluated in the scope (i.e. a
+    ``TemplateResponse`` must be rendered).
+    """
+    def __enter__(self):
+        _replica.depth = getattr(_replica, 'depth', 0) + 1
+        if _replica.depth == 1:
+            _replica.written = False
+        return self
+
+    def __exit__(self, *exc):
+        _replica.depth -= 1
+        return False
+
+
+class ReplicaRouter:
+    """
+    Sends reads of ``use_replica`` scopes to the ``DATABASES_REPLICA``
+    database, if it's configured. Everything else uses the default
+    database:
+        * writes, and reads that follow a write in the same scope, so that
+          a path always reads its own writes
+        * reads in a transaction, that must be consistent with it
+        * reads out of a read-only scope (i.e. receipt creation)
+    """
+    def db_for_read(self, model, **hints):
+        alias = settings.DATABASES_REPLICA
+        if not alias or not getattr(_replica, 'depth', 0) or _replica.written:
+            return None
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return None
+        return alias
+
+    def db_for_write(self, model, **hints):
+        if getattr(_replica, 'depth', 0):
+            _replica.written = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # the replica has the same data of the default database
+        databases = {DEFAULT_DB_ALIAS, settings.DATABASES_REPLICA or DEFAULT_DB_ALIAS}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
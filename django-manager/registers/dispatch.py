@@ -0,0 +1,41 @@
+import time
+import logging
+
+from manager.logs import log_context
+
+from .models import Receipt
+from .snapshots import build_snapshots
+from .adapters.breakers import CircuitBreaker
+from .adapters.registry import adapter_name, get_adapters
+
+
+logger = logging.getLogger(__name__)
+
+
+def push_receipts(receipts):
+    """
+    Pushes the given ``Receipt`` instances (or queryset) to all registered
+    ``Adapters``. Each receipt is converted once in a ``ReceiptSnapshot``
+    that is shared by all adapters; legacy adapters (``legacy = True``)
+    receive the ``Receipt`` model instead, loaded only if required.
+
+    Adapters are called through their ``CircuitBreaker`` (of the receipt
+    register device, for printers), so that an unavailable service or
+    printer fails fast instead of waiting for its timeouts.
+    Adapters are initialized by the first push of each process. Records
+    logged by adapters include the receipt and the adapter name.
+    """
+    for snapshot in build_snapshots(receipts):
+        receipt = None
+        port = snapshot.register.serial_port if snapshot.register else None
+        for adapter in get_adapters():
+            if getattr(adapter, 'legacy', False) is True:
+                if receipt is None:
+                    receipt = Receipt.objects.get(pk=snapshot.id)
+                payload = receipt
+            else:
+                payload = snapshot
+            with log_context(receipt=snapshot.id, adapter=adapter_name(adapter)):
+                start = time.monotonic()
+                CircuitBreaker.for_adapter(adapter, port).call(adapter.push, payload)
+                logger.debug('receipt pushed', extra={'duration': '{:.1f}ms'.format((time.monotonic() - start) * 1000)})
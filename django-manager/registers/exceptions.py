@@ -11,9 +11,31 @@ class AdapterPushFailed(APIException):
     default_detail = 'Adapter was unable to push data to the service.'
 
 
+class AdapterUnavailable(AdapterPushFailed):
+    """
+    Exception raised without calling an Adapter, because its circuit
+    breaker is open after many consecutive failures.
+    """
+    status_code = 503
+    default_detail = 'Adapter is temporarily disabled after repeated failures. Please retry later'
+    # seconds sent in the ``Retry-After`` header
+    wait = 5
+
+
 class CashRegisterNotReady(AdapterPushFailed):
     """
     Exception when the communication with the cash register
     doesn't work properly.
     """
     default_detail = 'The connected cash register is not ready. Please check the connection'
+
+
+class CashRegisterBusy(AdapterPushFailed):
+    """
+    Exception when the connected cash register has too many receipts
+    waiting to be printed. Clients should retry later.
+    """
+    status_code = 429
+    default_detail = 'The connected cash register is busy. Please retry later'
+    # seconds sent in the ``Retry-After`` header
+    wait = 1
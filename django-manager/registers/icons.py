@@ -0,0 +1,155 @@
+import io
+import os
+import hashlib
+import logging
+import threading
+
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.dispatch import receiver
+from django.db.models.signals import post_save
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+
+from PIL import Image
+
+from .models import Product
+
+
+logger = logging.getLogger(__name__)
+
+# Pillow format and save options of each variant format
+FORMATS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 6}),
+    'png': ('PNG', {'optimize': True}),
+}
+
+# workers that generate icons of the current process
+_executor = None
+_executor_pid = None
+_executor_lock = threading.Lock()
+
+
+def variant_name(name, digest, size, extension):
+    """
+    Returns the storage name of an icon variant. Names include the hash
+    of the original content, so that they can be cached forever.
+    """
+    stem = os.path.splitext(os.path.basename(name))[0]
+    return 'icons/{}-{}.{}.{}'.format(stem, size, digest, extension)
+
+
+def variant_names(name, digest):
+    """
+    Returns the storage names of all variants of an icon, by size
+    and format.
+    """
+    return {
+        size: {extension: variant_name(name, digest, size, extension) for extension in FORMATS}
+        for size in settings.ICONS_SIZES
+    }
+
+
+def render_variants(name, force=False):
+    """
+    Generates the missing variants of the stored icon ``name``, storing
+    them alongside the original, and returns the hash of the icon
+    content. If ``force`` is set, existing variants are generated again.
+    """
+    with default_storage.open(name) as icon:
+        content = icon.read()
+    digest = hashlib.sha1(content).hexdigest()[:12]
+
+    image = None
+    for size, formats in variant_names(name, digest).items():
+        for extension, variant in formats.items():
+            if default_storage.exists(variant):
+                if not force:
+                    continue
+                default_storage.delete(variant)
+            if image is None:
+                image = Image.open(io.BytesIO(content))
+                image = image.convert('RGBA')
+            thumbnail = image.copy()
+            thumbnail.thumbnail((size, size), Image.LANCZOS)
+            output = io.BytesIO()
+            pil_format, options = FORMATS[extension]
+            thumbnail.save(output, pil_format, **options)
+            default_storage.save(variant, ContentFile(output.getvalue()))
+
+    logger.debug('generated icon variants for %s', name)
+    return digest
+
+
+def generate_variants(product, force=False):
+    """
+    Generates the variants of the ``Product`` icon with ``render_variants()``
+    and saves the hash of the icon content in the ``Product``. Returns the
+    variants names.
+    """
+    name = product.icon.name
+    digest = render_variants(name, force=force)
+
+    # the catalog depends on serializers, that depend on this module
+    from .catalog import invalidate_catalog
+
+    # the icon may have been replaced in the meantime
+    if Product.objects.filter(pk=product.pk, icon=name).update(icon_hash=digest):
+        invalidate_catalog()
+    product.icon_hash = digest
+    return variant_names(name, digest)
+
+
+def generate_product_variants(product_id, force=False):
+    """
+    Generates the icon variants of the given ``Product``, logging errors
+    (i.e. an uploaded file that is not an image).
+    """
+    try:
+        product = Product.objects.filter(pk=product_id).first()
+        if product is not None and product.icon:
+            generate_variants(product, force=force)
+    except Exception:
+        logger.exception('unable to generate icon variants of product %s', product_id)
+
+
+def _generate_task(product_id, force=False):
+    try:
+        generate_product_variants(product_id, force=force)
+    finally:
+        # each worker thread has its own connection
+        connection.close()
+
+
+def get_executor():
+    """
+    Returns the worker pool that generates icons, creating it if it's the
+    first time it's used by the current process.
+    """
+    global _executor, _executor_pid
+    with _executor_lock:
+        # threads are not inherited by forked workers
+        if _executor is None or _executor_pid != os.getpid():
+            _executor = ThreadPoolExecutor(max_workers=settings.ICONS_WORKERS)
+            _executor_pid = os.getpid()
+        return _executor
+
+
+def schedule_variants(product_id):
+    """
+    Generates the icon variants of the given ``Product`` off the request
+    path, using the worker pool. If ``ICONS_WORKERS`` is ``0``, variants
+    are generated immediately.
+    """
+    if settings.ICONS_WORKERS:
+        return get_executor().submit(_generate_task, product_id)
+    generate_product_variants(product_id)
+
+
+@receiver(post_save, sender=Product)
+def _schedule_on_save(sender, instance, update_fields=None, **kwargs):
+    if instance.icon and (update_fields is None or 'icon' in update_fields):
+        # the worker must read the committed product
+        transaction.on_commit(lambda: schedule_variants(instance.pk))
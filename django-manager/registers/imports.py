@@ -0,0 +1,177 @@
+import io
+import csv
+import json
+
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, CharField, DecimalField, F, Value, When
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+
+from rest_framework.exceptions import ValidationError
+
+from .catalog import invalidate_catalog
+from .db import chunks
+from .icons import render_variants
+from .models import Product
+from .serializers import ProductImportSerializer
+
+
+# fields changed by an import, with their database type
+UPDATE_FIELDS = (
+    ('default_price', DecimalField()),
+    ('default_price_currency', CharField()),
+    ('icon', CharField()),
+    ('icon_hash', CharField()),
+)
+
+
+def parse_products(fp, format):
+    """
+    Returns the rows of a products file, that is a CSV file with a header
+    or a JSON list (``format`` is ``csv`` or ``json``). The file is opened
+    in binary mode and it must be UTF-8 encoded.
+    """
+    text = io.TextIOWrapper(fp, encoding='utf-8-sig')
+    try:
+        if format == 'json':
+            return json.load(text)
+        return list(csv.DictReader(text))
+    except (ValueError, csv.Error) as e:
+        raise ValidationError('Unable to parse the products file: {}'.format(e))
+    finally:
+        # the given file is closed by the caller
+        text.detach()
+
+
+def validate_products(rows):
+    """
+    Validates all rows in a single pass, so that all errors are reported
+    before any product is changed. Errors are reported by row number,
+    starting from 1. Returns the validated rows.
+    """
+    serializer = ProductImportSerializer(data=rows, many=True)
+    if not serializer.is_valid():
+        if isinstance(serializer.errors, dict):
+            raise ValidationError(serializer.errors)
+        raise ValidationError({
+            'rows': {index: errors for index, errors in enumerate(serializer.errors, 1) if errors},
+        })
+
+    names = Counter(row['name'] for row in serializer.validated_data)
+    duplicates = sorted(name for name, count in names.items() if count > 1)
+    if duplicates:
+        raise ValidationError({'name': ['Products imported twice: {}'.format(', '.join(duplicates))]})
+    return serializer.validated_data
+
+
+def _store_icon(name, open_icon):
+    """
+    Stores an imported icon and renders its variants. Returns the stored
+    name and the hash of the icon content. An icon already stored with
+    the same content is reused, so that imports can be repeated.
+    """
+    with open_icon() as fp:
+        content = fp.read()
+    if default_storage.exists(name):
+        with default_storage.open(name) as stored:
+            if stored.read() == content:
+                return name, render_variants(name)
+
+    stored = default_storage.save(name, ContentFile(content))
+    try:
+        return stored, render_variants(stored)
+    except OSError:
+        default_storage.delete(stored)
+        raise ValidationError({'icon': ['{} is not a valid image.'.format(name)]})
+
+
+def store_icons(names, icons):
+    """
+    Stores the given icons and renders their variants in parallel, with
+    ``ICONS_WORKERS`` threads. ``icons`` maps file names to callables that
+    open the icon file. Returns a dict of stored names and hashes.
+    """
+    missing = sorted(set(names) - set(icons))
+    if missing:
+        raise ValidationError({'icon': ['Icon files not found: {}'.format(', '.join(missing))]})
+
+    with ThreadPoolExecutor(max_workers=settings.ICONS_WORKERS or 1) as executor:
+        futures = {name: executor.submit(_store_icon, name, icons[name]) for name in names}
+    return {name: future.result() for name, future in futures.items()}
+
+
+def _bulk_update(updates, chunk_size):
+    """
+    Updates products with one query for each chunk, like ``bulk_update()``
+    of recent Django versions. ``updates`` is a list of primary keys and
+    changed values.
+    """
+    for chunk in chunks(updates, chunk_size):
+        values = {}
+        for field, output_field in UPDATE_FIELDS:
+            cases = [When(pk=pk, then=Value(row[field])) for pk, row in chunk if field in row]
+            if cases:
+                values[field] = Case(*cases, default=F(field), output_field=output_field)
+        Product.objects.filter(pk__in=[pk for pk, row in chunk]).update(**values)
+
+
+def import_products(rows, icons=None, chunk_size=500):
+    """
+    Creates or updates products by name, with a few queries for each
+    chunk of ``chunk_size`` products instead of one query for each
+    product:
+        * all rows are validated before changing anything
+        * icons are stored and resized in parallel, before saving products
+        * new products are created with ``bulk_create()``
+        * changed products are updated with one query for each chunk
+        * the catalog version is changed once, at the end
+
+    ``icons`` maps icon file names to callables that open the icon file.
+    Returns how many products have been created, updated and left unchanged.
+    """
+    rows = validate_products(rows)
+    stored_icons = store_icons({row['icon'] for row in rows if row.get('icon')}, icons or {})
+
+    existing = {}
+    for names in chunks([row['name'] for row in rows], chunk_size):
+        existing.update((product.name, product) for product in Product.objects.filter(name__in=names))
+
+    created = []
+    updated = []
+    for row in rows:
+        values = {
+            'default_price': row['default_price'],
+            'default_price_currency': row['default_price_currency'],
+        }
+        if row.get('icon'):
+            values['icon'], values['icon_hash'] = stored_icons[row['icon']]
+
+        product = existing.get(row['name'])
+        if product is None:
+            created.append(Product(name=row['name'], **values))
+            continue
+
+        current = {
+            'default_price': product.default_price.amount,
+            'default_price_currency': str(product.default_price.currency),
+            'icon': product.icon.name,
+            'icon_hash': product.icon_hash,
+        }
+        if any(current[field] != value for field, value in values.items()):
+            updated.append((product.pk, values))
+
+    with transaction.atomic():
+        Product.objects.bulk_create(created, batch_size=chunk_size)
+        _bulk_update(updated, chunk_size)
+
+    if created or updated:
+        invalidate_catalog()
+    return {
+        'created': len(created),
+        'updated': len(updated),
+        'unchanged': len(rows) - len(created) - len(updated),
+    }
@@ -0,0 +1,25 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from registers.archive import archive_receipts
+
+
+class Command(BaseCommand):
+    help = (
+        'Moves receipts older than the retention window, and their sold items, '
+        'to compressed segment files in ARCHIVE_ROOT. Daily product sales are kept.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days',
+            type=int,
+            default=settings.ARCHIVE_RETENTION_DAYS,
+            help='receipts older than these days are archived',
+        )
+
+    def handle(self, *args, **options):
+        segments = archive_receipts(options['days'])
+        for segment in segments:
+            self.stdout.write('{name}: {receipts} receipts from {start} to {end}'.format(**segment))
+        self.stdout.write('archived {} receipts'.format(sum(segment['receipts'] for segment in segments)))
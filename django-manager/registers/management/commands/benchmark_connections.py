@@ -0,0 +1,73 @@
+import time
+import uuid
+
+from django.conf import settings
+from django.db import close_old_connections, connection
+from django.db.backends.signals import connection_created
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.core.urlresolvers import reverse
+from django.test.utils import override_settings
+
+from rest_framework.test import APIClient
+
+
+class Command(BaseCommand):
+    help = (
+        'Sends requests to the products API with and without persistent database '
+        'connections, and reports the request latency and the number of opened '
+        'connections for each CONN_MAX_AGE value.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200, help='number of requests for each run')
+        parser.add_argument(
+            '--conn-max-age',
+            type=int,
+            nargs='+',
+            default=[0, connection.settings_dict['CONN_MAX_AGE'] or 60],
+            help='CONN_MAX_AGE values to compare',
+        )
+
+    def handle(self, *args, **options):
+        user = get_user_model().objects.create_superuser('benchmark-{}'.format(uuid.uuid4().hex[:8]), '', None)
+        api = APIClient()
+        api.force_authenticate(user)
+        conn_max_age = connection.settings_dict['CONN_MAX_AGE']
+
+        opened = []
+
+        def count_connections(sender, connection, **kwargs):
+            opened.append(connection.alias)
+
+        connection_created.connect(count_connections)
+        try:
+            with override_settings(ALLOWED_HOSTS=settings.ALLOWED_HOSTS + ['testserver']):
+                for max_age in options['conn_max_age']:
+                    connection.close()
+                    connection.settings_dict['CONN_MAX_AGE'] = max_age
+                    del opened[:]
+                    latencies = []
+                    for _ in range(options['requests']):
+                        start = time.monotonic()
+                        # the test client doesn't close connections like the
+                        # WSGI handler does, at the beginning and at the end
+                        # of each request
+                        close_old_connections()
+                        api.get(reverse('registers:product-list'))
+                        close_old_connections()
+                        latencies.append(time.monotonic() - start)
+                    self._report(max_age, latencies, len(opened))
+        finally:
+            connection_created.disconnect(count_connections)
+            connection.settings_dict['CONN_MAX_AGE'] = conn_max_age
+            user.delete()
+
+    def _report(self, max_age, latencies, connections):
+        latencies.sort()
+        self.stdout.write('CONN_MAX_AGE={}: {} requests, {} connections'.format(max_age, len(latencies), connections))
+        self.stdout.write('latency: mean={:.2f}ms p50={:.2f}ms p95={:.2f}ms'.format(
+            sum(latencies) / len(latencies) * 1000,
+            latencies[len(latencies) // 2] * 1000,
+            latencies[int(len(latencies) * 0.95)] * 1000,
+        ))
@@ -0,0 +1,57 @@
+import io
+import time
+
+from django.core.management.base import BaseCommand
+
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+
+from ...models import Product
+from ...parsers import MessagePackParser
+from ...renderers import MessagePackRenderer
+from ...serializers import ProductSerializer
+
+
+class Command(BaseCommand):
+    help = (
+        'Compares payload size, encoding and decoding time of JSON and MessagePack '
+        'for the products list and for a receipt. Data are not stored in the database.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=200, help='products in the products list')
+        parser.add_argument('--items', type=int, default=10, help='sold items in the receipt')
+        parser.add_argument('--repeat', type=int, default=200, help='times each operation is repeated')
+
+    def handle(self, *args, **options):
+        products = [
+            Product(id=i, name='Product {}'.format(i), default_price='{}.{:02d}'.format(i, i % 100))
+            for i in range(1, options['products'] + 1)
+        ]
+        payloads = [
+            ('products', ProductSerializer(products, many=True).data),
+            ('receipt', {
+                'products': [
+                    {'id': i, 'price': '1.50', 'price_currency': 'EUR', 'quantity': '2.00'}
+                    for i in range(1, options['items'] + 1)
+                ],
+            }),
+        ]
+        formats = [
+            ('json', JSONRenderer(), JSONParser()),
+            ('msgpack', MessagePackRenderer(), MessagePackParser()),
+        ]
+
+        for name, data in payloads:
+            for format_name, renderer, parser in formats:
+                encode = self._timeit(options['repeat'], renderer.render, data)
+                content = renderer.render(data)
+                decode = self._timeit(options['repeat'], lambda: parser.parse(io.BytesIO(content)))
+                self.stdout.write('{} {}: {} bytes, encode={:.3f}ms decode={:.3f}ms'.format(
+                    name, format_name, len(content), encode, decode))
+
+    def _timeit(self, repeat, func, *args):
+        start = time.perf_counter()
+        for _ in range(repeat):
+            func(*args)
+        return (time.perf_counter() - start) / repeat * 1000
@@ -0,0 +1,31 @@
+from django.conf import settings
+from django.db import connection
+from django.utils import timezone
+from django.core.management.base import BaseCommand
+
+from registers import partitions
+
+
+class Command(BaseCommand):
+    help = (
+        'Creates the monthly partitions of receipts and sold items for the '
+        'upcoming months, when DATABASES_PARTITIONING is enabled. It should '
+        'run periodically (i.e. daily), so that partitions always exist '
+        'before receipts are stored.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--months',
+            type=int,
+            default=settings.DATABASES_PARTITIONS_AHEAD,
+            help='number of months to create, starting from the current one',
+        )
+
+    def handle(self, *args, **options):
+        if not partitions.is_enabled(connection):
+            self.stdout.write('partitioning is not enabled')
+            return
+
+        created = partitions.create_partitions(connection, timezone.now(), options['months'] + 1)
+        self.stdout.write('created {} partitions: {}'.format(len(created), ', '.join(created) or '-'))
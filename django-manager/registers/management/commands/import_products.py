@@ -0,0 +1,54 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from rest_framework.exceptions import ValidationError
+
+from registers.imports import import_products, parse_products
+
+
+class Command(BaseCommand):
+    help = (
+        'Creates or updates products by name from a CSV file (with a header) or a JSON list. '
+        'Rows have name, default_price and optional default_price_currency and icon columns.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='the .csv or .json products file')
+        parser.add_argument(
+            '--icons',
+            help='directory of the icon files (default: the products file directory)',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=500,
+            help='products created or updated with each query',
+        )
+
+    def handle(self, *args, **options):
+        path = options['path']
+        format = os.path.splitext(path)[1].lstrip('.').lower()
+        if format not in ('csv', 'json'):
+            raise CommandError('Use a .csv or a .json file.')
+
+        root = options['icons'] or os.path.dirname(os.path.abspath(path))
+        icons = {
+            name: (lambda path=os.path.join(root, name): open(path, 'rb'))
+            for name in os.listdir(root)
+            if os.path.isfile(os.path.join(root, name))
+        }
+
+        start = time.monotonic()
+        try:
+            with open(path, 'rb') as fp:
+                rows = parse_products(fp, format)
+            counts = import_products(rows, icons, chunk_size=options['chunk_size'])
+        except ValidationError as e:
+            raise CommandError('Products not imported: {}'.format(e.detail))
+
+        self.stdout.write(
+            'created {created}, updated {updated}, unchanged {unchanged} products'.format(**counts) +
+            ' in {:.2f}s'.format(time.monotonic() - start)
+        )
@@ -0,0 +1,107 @@
+import time
+import uuid
+
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connection
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.core.urlresolvers import reverse
+from django.test.utils import override_settings
+
+from rest_framework.test import APIClient
+
+from ...models import Product, Receipt
+from ...simulators import SaremaX1Simulator
+from ...adapters.printers import CashRegisterAdapter, shutdown_devices
+
+
+class Command(BaseCommand):
+    help = (
+        'Creates receipts through the receipts API, printing them with a simulated '
+        'SaremaX1 cash register, and reports how many receipts per second are printed. '
+        'Created data are removed at the end of the test.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--receipts', type=int, default=100, help='number of receipts to create')
+        parser.add_argument('--concurrency', type=int, default=1, help='number of concurrent clients')
+        parser.add_argument('--items', type=int, default=3, help='sold items for each receipt')
+        parser.add_argument('--transport', choices=['pty', 'socket'], default='pty')
+        parser.add_argument('--baudrate', type=int, default=9600, help='simulated baud rate; 0 disables delays')
+        parser.add_argument('--failure-rate', type=float, default=0, help='receipts that fail (socket only)')
+
+    def handle(self, *args, **options):
+        simulator = SaremaX1Simulator(baudrate=options['baudrate'], failure_rate=options['failure_rate'])
+        if options['transport'] == 'pty':
+            port = simulator.start_pty()
+        else:
+            port = simulator.start_socket()
+
+        suffix = uuid.uuid4().hex[:8]
+        user = get_user_model().objects.create_superuser('loadtest-{}'.format(suffix), '', None)
+        products = [
+            Product.objects.create(name='loadtest-{}-{}'.format(suffix, i), default_price=1)
+            for i in range(options['items'])
+        ]
+        payload = {
+            'products': [{'id': product.id, 'price': '1.50', 'quantity': '2'} for product in products],
+        }
+
+        def client(receipts):
+            api = APIClient()
+            api.force_authenticate(user)
+            results = []
+            try:
+                for _ in range(receipts):
+                    start = time.monotonic()
+                    response = api.post(reverse('registers:receipt-list'), data=payload, format='json')
+                    results.append((response.status_code, time.monotonic() - start))
+            finally:
+                if options['concurrency'] > 1:
+                    # connections are opened by each thread
+                    connection.close()
+            return results
+
+        # split receipts between clients
+        clients = options['concurrency']
+        shares = [options['receipts'] // clients + (i < options['receipts'] % clients) for i in range(clients)]
+
+        try:
+            overrides = {
+                'ALLOWED_HOSTS': settings.ALLOWED_HOSTS + ['testserver'],
+                'PUSH_ADAPTERS': [CashRegisterAdapter()],
+                'SERIAL_PORT': port,
+            }
+            with override_settings(**overrides):
+                start = time.monotonic()
+                if clients > 1:
+                    with ThreadPoolExecutor(max_workers=clients) as executor:
+                        results = [r for rs in executor.map(client, shares) for r in rs]
+                else:
+                    results = client(shares[0])
+                elapsed = time.monotonic() - start
+        finally:
+            shutdown_devices()
+            simulator.stop()
+            Receipt.objects.filter(sell__product__in=products).delete()
+            for product in products:
+                product.delete()
+            user.delete()
+
+        statuses = Counter(status for status, _ in results)
+        latencies = sorted(latency for _, latency in results)
+        self.stdout.write('port: {} ({})'.format(port, options['transport']))
+        self.stdout.write('receipts: {} in {:.2f}s, {:.1f} receipts/sec'.format(
+            len(results), elapsed, len(results) / elapsed))
+        self.stdout.write('printed: {}, simulator errors: {}'.format(len(simulator.receipts), simulator.errors))
+        self.stdout.write('statuses: {}'.format(', '.join(
+            '{}={}'.format(status, count) for status, count in sorted(statuses.items()))))
+        if latencies:
+            self.stdout.write('latency: p50={:.1f}ms p95={:.1f}ms max={:.1f}ms'.format(
+                latencies[len(latencies) // 2] * 1000,
+                latencies[int(len(latencies) * 0.95)] * 1000,
+                latencies[-1] * 1000,
+            ))
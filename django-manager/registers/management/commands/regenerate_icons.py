@@ -0,0 +1,33 @@
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from registers.icons import _generate_task
+from registers.models import Product
+
+
+class Command(BaseCommand):
+    help = (
+        'Generates the icon variants of all products in parallel. Existing '
+        'variants are kept, unless --force is used.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=settings.ICONS_WORKERS or 1,
+            help='number of icons generated in parallel',
+        )
+        parser.add_argument('--force', action='store_true', help='generate existing variants again')
+
+    def handle(self, *args, **options):
+        products = list(Product.objects.exclude(icon='').exclude(icon=None).values_list('pk', flat=True))
+        start = time.monotonic()
+        with ThreadPoolExecutor(max_workers=options['workers']) as executor:
+            for product_id in products:
+                executor.submit(_generate_task, product_id, force=options['force'])
+        self.stdout.write('generated icons of {} products in {:.2f}s'.format(len(products), time.monotonic() - start))
@@ -0,0 +1,21 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11 on 2026-10-19 15:08
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import registers.receipts
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('registers', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='receipt',
+            name='date',
+            field=models.DateTimeField(blank=True, db_index=True, default=registers.receipts.timezone_now),
+        ),
+    ]
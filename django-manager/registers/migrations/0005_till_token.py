@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11 on 2026-10-19 15:30
+from __future__ import unicode_literals
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import registers.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('registers', '0004_register'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TillToken',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(default=registers.models.generate_token_key, editable=False, max_length=40, unique=True)),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('revoked', models.BooleanField(default=False)),
+                ('register', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='tokens', to='registers.Register')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='till_tokens', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+    ]
@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11 on 2026-10-19 15:38
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('registers', '0005_till_token'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='icon_hash',
+            field=models.CharField(blank=True, editable=False, max_length=12),
+        ),
+    ]
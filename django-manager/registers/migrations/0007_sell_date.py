@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11 on 2026-10-19 16:02
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def copy_receipt_dates(apps, schema_editor):
+    Receipt = apps.get_model('registers', 'Receipt')
+    Sell = apps.get_model('registers', 'Sell')
+    dates = Receipt.objects.filter(pk=OuterRef('receipt_id')).values('date')[:1]
+    Sell.objects.update(date=Subquery(dates))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('registers', '0006_product_icon_hash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='sell',
+            name='date',
+            field=models.DateTimeField(editable=False, null=True),
+        ),
+        migrations.RunPython(copy_receipt_dates, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='sell',
+            name='date',
+            field=models.DateTimeField(db_index=True, editable=False),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.conf import settings
+from django.db import migrations
+
+from registers import partitions
+
+
+def partition_tables(apps, schema_editor):
+    # opt-in, only on PostgreSQL
+    if partitions.is_enabled(schema_editor.connection):
+        partitions.partition_tables(schema_editor.connection, settings.DATABASES_PARTITIONS_AHEAD)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('registers', '0007_sell_date'),
+    ]
+
+    operations = [
+        # the schema of partitioned tables is the same for the Django ORM,
+        # so tables are not converted back
+        migrations.RunPython(partition_tables, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+def create_search_index(apps, schema_editor):
+    # the trigram index is used by case-insensitive prefix and substring
+    # matches, that Django filters with ``UPPER("name"::text) LIKE``;
+    # other databases use the in-memory index of ``registers.search``
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    schema_editor.execute(
+        'CREATE INDEX IF NOT EXISTS "registers_product_name_trgm" '
+        'ON "registers_product" USING gin (UPPER("name"::text) gin_trgm_ops)'
+    )
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute('DROP INDEX IF EXISTS "registers_product_name_trgm"')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('registers', '0008_partitioning'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -1,6 +1,12 @@
-from django.db import models
+import os
+import binascii
+
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.db import models, transaction, IntegrityError
 from django.db.models import Sum, F
-from django.utils import formats
+from django.utils import formats, timezone
 
 from djmoney.models.fields import MoneyField
 
@@ -21,24 +27,138 @@ class Product(models.Model):
     name = models.CharField(max_length=100, unique=True)
     default_price = MoneyField(max_digits=10, decimal_places=2, default_currency='EUR')
     icon = models.ImageField(blank=True, null=True)
+    # hash of the icon content, set when its variants are generated
+    icon_hash = models.CharField(max_length=12, blank=True, editable=False)
 
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        """
+        Clears the ``icon_hash`` when the icon is replaced or removed, so
+        that variants of the previous icon are not used until the new ones
+        are generated.
+        """
+        update_fields = kwargs.get('update_fields')
+        if self.pk and self.icon_hash and (update_fields is None or 'icon' in update_fields):
+            stored = Product.objects.filter(pk=self.pk).values_list('icon', flat=True).first()
+            if not self.icon or not self.icon._committed or self.icon.name != stored:
+                self.icon_hash = ''
+                if update_fields is not None:
+                    kwargs['update_fields'] = set(update_fields) | {'icon_hash'}
+        super().save(*args, **kwargs)
+
+    def sales_on(self, day):
+        """
+        Returns the ``ProductSales`` counters of the given day. If nothing
+        has been sold, an empty (not saved) instance is returned.
+        """
+        try:
+            return self.sales.get(day=day)
+        except ProductSales.DoesNotExist:
+            return ProductSales(product=self, day=day)
+
+
+class RegisterManager(models.Manager):
+    def for_request(self, request):
+        """
+        Returns the ``Register`` that must print receipts for the given
+        request. The register is selected:
+            * by name, if the request has the ``REGISTER_REQUEST_HEADER``
+            * by the ``TillToken`` used to authenticate the request
+            * by the API client, if the user is bound to a ``Register``
+        If none matches, ``None`` is returned and the default device
+        defined in settings is used. An unknown register name raises
+        ``Register.DoesNotExist``.
+        """
+        name = request.META.get(settings.REGISTER_REQUEST_HEADER)
+        if name:
+            return self.get(name=name)
+
+        # till devices are authenticated with their ``TillToken``
+        token = getattr(request, 'auth', None)
+        if isinstance(token, TillToken):
+            return token.register
+
+        user = request.user
+        if user.is_authenticated:
+            return self.filter(user=user).first()
+
+        return None
+
+
+class Register(models.Model):
+    """
+    A cash register connected to this server. Each ``Register`` has its
+    own serial device, so that many tills can print at the same time.
+    An API client may be bound to a ``Register`` so that its receipts
+    are always printed there.
+    """
+    name = models.CharField(max_length=100, unique=True)
+    serial_port = models.CharField(max_length=255, unique=True)
+    baudrate = models.PositiveIntegerField(default=9600)
+    xonxoff = models.BooleanField(default=True)
+    timeout = models.FloatField(default=1)
+    user = models.OneToOneField(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.SET_NULL,
+        related_name='register',
+        blank=True,
+        null=True,
+    )
+
+    objects = RegisterManager()
+
+    def __str__(self):
+        return self.name
+
+
+def generate_token_key():
+    return binascii.hexlify(os.urandom(20)).decode()
+
+
+class TillToken(models.Model):
+    """
+    API token of a till device. Requests authenticated with the token
+    act as the token ``user`` and print receipts on the token ``register``.
+    A revoked token cannot be used anymore.
+    """
+    key = models.CharField(max_length=40, unique=True, default=generate_token_key, editable=False)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='till_tokens')
+    register = models.ForeignKey(Register, on_delete=models.CASCADE, related_name='tokens')
+    created = models.DateTimeField(auto_now_add=True)
+    revoked = models.BooleanField(default=False)
+
+    def __str__(self):
+        return '{}...'.format(self.key[:8])
+
 
 class Receipt(models.Model):
     """
     ``Receipt`` model that aggregates a set of products and that
     creates the proper commands to print the ``Receipt``.
     """
-    date = models.DateTimeField(default=timezone_now, blank=True)
+    date = models.DateTimeField(default=timezone_now, blank=True, db_index=True)
+    register = models.ForeignKey(Register, on_delete=models.SET_NULL, blank=True, null=True)
     products = models.ManyToManyField('Product', through='Sell', related_name='receipts')
 
     def __str__(self):
-        total = self.sell_set.aggregate(total=Sum(F('price') * F('quantity')))['total'] or 0.0
+        # the date selects the partition of sold items
+        sells = self.sell_set.filter(date=self.date)
+        total = sells.aggregate(total=Sum(F('price') * F('quantity')))['total'] or 0.0
         date = formats.date_format(self.date, 'DATETIME_FORMAT')
         return "Total: {0:.2f} -- {1}".format(total, date)
 
+    def save(self, *args, **kwargs):
+        """
+        Sold items store the date of their ``Receipt``, so they are updated
+        when the date of an existing ``Receipt`` is changed.
+        """
+        adding = self._state.adding
+        super().save(*args, **kwargs)
+        if not adding:
+            self.sell_set.exclude(date=self.date).update(date=self.date)
+
 
 class Sell(models.Model):
     """
@@ -48,6 +168,8 @@ class Sell(models.Model):
         * the product foreign key
         * the quantity of sold items
         * the price of sold items
+        * the date of the receipt, so that sold items can be partitioned
+          by month together with their receipt
 
     Price of sold items is written in this relationship because
     the one in the ``Product`` model is just a default / suggested
@@ -58,6 +180,7 @@ class Sell(models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
     quantity = models.DecimalField(max_digits=10, decimal_places=3)
     price = MoneyField(max_digits=10, decimal_places=2, default_currency='EUR')
+    date = models.DateTimeField(editable=False, db_index=True)
 
     def __str__(self):
         return 'Sold {} {} for {} each'.format(self.quantity, self.product, self.price)
@@ -74,5 +197,133 @@ class Sell(models.Model):
         if self.price.amount.is_zero():
             self.price = self.product.default_price
 
+        # the receipt date is copied, so that queries on sold items
+        # don't need to join receipts to filter by date
+        self.date = self.receipt.date
+
         # save the item
         super().save(*args, **kwargs)
+
+
+class ProductSalesManager(models.Manager):
+    """
+    Manager that keeps ``ProductSales`` counters up to date. Counters
+    are updated with ``F()`` expressions so that concurrent receipts
+    never overwrite each other.
+    """
+    def record(self, date, sells):
+        """
+        Adds the given ``Sell`` instances to the counters of the day
+        the ``Receipt`` has been created. It must be called in the same
+        transaction that stores the ``Receipt``.
+        """
+        day = timezone.localtime(date).date()
+        counters = {}
+        for sell in sells:
+            # quantities may be given as ``float`` (e.g. serializer defaults)
+            sold = Sell._meta.get_field('quantity').to_python(sell.quantity)
+            quantity, revenue = counters.get(sell.product_id, (0, 0))
+            counters[sell.product_id] = (
+                quantity + sold,
+                revenue + sell.price.amount * sold,
+            )
+
+        for product_id, (quantity, revenue) in counters.items():
+            updated = self.filter(product_id=product_id, day=day).update(
+                quantity=F('quantity') + quantity,
+                revenue=F('revenue') + revenue,
+            )
+            if not updated:
+                try:
+                    # a savepoint is required because a concurrent receipt
+                    # may create the same counter in the meantime
+                    with transaction.atomic():
+                        self.create(product_id=product_id, day=day, quantity=quantity, revenue=revenue)
+                except IntegrityError:
+                    self.filter(product_id=product_id, day=day).update(
+                        quantity=F('quantity') + quantity,
+                        revenue=F('revenue') + revenue,
+                    )
+
+    def rebuild(self, day):
+        """
+        Recomputes all counters of the given day, aggregating the ``Sell``
+        table. It's meant for changes that cannot be applied incrementally,
+        like receipts edited through the Django admin.
+        """
+        start = timezone.make_aware(datetime.combine(day, time.min))
+        end = start + timedelta(days=1)
+        rows = (
+            Sell.objects
+            .filter(date__gte=start, date__lt=end)
+            .values('product')
+            .annotate(
+                sold=Sum('quantity'),
+                amount=Sum(F('price') * F('quantity'), output_field=models.DecimalField()),
+            )
+        )
+        with transaction.atomic():
+            self.filter(day=day).delete()
+            self.bulk_create([
+                ProductSales(product_id=row['product'], day=day, quantity=row['sold'], revenue=row['amount'])
+                for row in rows
+            ])
+
+    def top_sellers(self, day, limit=10):
+        """
+        Returns the most sold products for the given day, reading
+        only the precomputed counters.
+        """
+        queryset = self.filter(day=day).select_related('product')
+        return queryset.order_by('-quantity', '-revenue')[:limit]
+
+
+class ProductSales(models.Model):
+    """
+    Daily counters of sold quantities and revenues for each ``Product``.
+    Counters are materialized when a ``Receipt`` is stored so that
+    dashboards can show top sellers without aggregating the ``Sell``
+    table at read time.
+
+    Revenues keep the same precision of ``price * quantity`` so that
+    the incremental update and the ``rebuild()`` always match.
+    """
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='sales')
+    day = models.DateField(db_index=True)
+    quantity = models.DecimalField(max_digits=15, decimal_places=3, default=0)
+    revenue = MoneyField(max_digits=17, decimal_places=5, default_currency='EUR')
+
+    objects = ProductSalesManager()
+
+    class Meta:
+        unique_together = ('product', 'day')
+        verbose_name_plural = 'product sales'
+
+    def __str__(self):
+        return '{} sold {} on {}'.format(self.product, self.quantity, self.day)
+
+
+class Profile(models.Model):
+    """
+    Profile of an API request, stored when profiling is requested with
+    the ``X-Profile`` header or sampled (see ``registers.profiling``).
+    Sampled call stacks are stored in the folded format used by flame
+    graph tools, while ``pstats`` is a dump readable by ``pstats.Stats``.
+    """
+    created = models.DateTimeField(auto_now_add=True, db_index=True)
+    method = models.CharField(max_length=10)
+    path = models.CharField(max_length=255)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, blank=True, null=True, on_delete=models.SET_NULL)
+    register = models.ForeignKey(Register, blank=True, null=True, on_delete=models.SET_NULL)
+    status_code = models.PositiveSmallIntegerField()
+    # milliseconds
+    duration = models.FloatField()
+    samples = models.PositiveIntegerField()
+    stacks = models.TextField(blank=True)
+    pstats = models.BinaryField()
+
+    class Meta:
+        ordering = ['-created']
+
+    def __str__(self):
+        return '{} {} ({:.1f}ms)'.format(self.method, self.path, self.duration)
@@ -0,0 +1,10 @@
+from rest_framework.pagination import LimitOffsetPagination
+
+
+class SearchPagination(LimitOffsetPagination):
+    """
+    Pages search results with the ``limit`` and ``offset`` query
+    parameters, so that clients never download the whole catalog.
+    """
+    default_limit = 20
+    max_limit = 100
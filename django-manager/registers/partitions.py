@@ -0,0 +1,162 @@
+import logging
+
+from datetime import date
+
+from django.conf import settings
+from django.db import transaction
+from django.core.exceptions import ImproperlyConfigured
+
+
+logger = logging.getLogger(__name__)
+
+# tables partitioned by month of their ``date`` column
+TABLES = ('registers_receipt', 'registers_sell')
+
+# indexes and foreign keys of partitioned tables, created on all partitions
+INDEXES = {
+    'registers_receipt': ('date', 'register_id'),
+    'registers_sell': ('date', 'receipt_id', 'product_id'),
+}
+FOREIGN_KEYS = {
+    'registers_receipt': (('register_id', 'registers_register'),),
+    'registers_sell': (('product_id', 'registers_product'),),
+}
+
+
+def is_enabled(connection):
+    """
+    Returns ``True`` if receipts and sold items are partitioned by month
+    in the given database.
+    """
+    return settings.DATABASES_PARTITIONING and connection.vendor == 'postgresql'
+
+
+def months(start, count):
+    """
+    Returns the first day of ``count`` months, starting from the month
+    of the given ``start`` date.
+    """
+    year, month = start.year, start.month
+    for _ in range(count):
+        yield date(year, month, 1)
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+
+
+def partition_name(table, month):
+    return '{}_{:%Y_%m}'.format(table, month)
+
+
+def partition_sql(table, month):
+    """
+    Returns the statements that create the partition of ``table`` for the
+    given month. Rows of that month stored in the default partition (i.e.
+    receipts with a future date) are moved to the new partition.
+    """
+    name = partition_name(table, month)
+    start, end = months(month, 2)
+    params = {
+        'table': table,
+        'name': name,
+        'start': "'{:%Y-%m-%d} 00:00:00+00'".format(start),
+        'end': "'{:%Y-%m-%d} 00:00:00+00'".format(end),
+    }
+    return [
+        sql.format(**params) for sql in (
+            'CREATE TEMPORARY TABLE "{name}_moved" AS WITH moved AS ('
+            'DELETE FROM "{table}_default" WHERE "date" >= {start} AND "date" < {end} RETURNING *'
+            ') SELECT * FROM moved',
+            'CREATE TABLE "{name}" PARTITION OF "{table}" FOR VALUES FROM ({start}) TO ({end})',
+            'INSERT INTO "{table}" SELECT * FROM "{name}_moved"',
+            'DROP TABLE "{name}_moved"',
+        )
+    ]
+
+
+def get_partitions(cursor, table):
+    """
+    Returns the names of the partitions of the given table.
+    """
+    cursor.execute(
+        'SELECT child.relname FROM pg_inherits '
+        'JOIN pg_class parent ON parent.oid = pg_inherits.inhparent '
+        'JOIN pg_class child ON child.oid = pg_inherits.inhrelid '
+        'WHERE parent.relname = %s',
+        [table],
+    )
+    return {row[0] for row in cursor.fetchall()}
+
+
+def create_partitions(connection, start, count):
+    """
+    Creates the missing partitions of ``count`` months, starting from the
+    month of the given ``start`` date. Returns the created partitions.
+    """
+    created = []
+    with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+        for table in TABLES:
+            existing = get_partitions(cursor, table)
+            for month in months(start, count):
+                if partition_name(table, month) in existing:
+                    continue
+                for sql in partition_sql(table, month):
+                    cursor.execute(sql)
+                created.append(partition_name(table, month))
+    for name in created:
+        logger.info('created partition %s', name)
+    return created
+
+
+def partition_tables(connection, months_ahead):
+    """
+    Converts receipts and sold items tables in tables partitioned by the
+    month of their ``date``, with a partition for each month from the
+    first receipt to ``months_ahead`` months from now, and a default
+    partition. Requires PostgreSQL 11 or later.
+
+    Unique keys of a partitioned table must include the partition key, so
+    primary keys become ``(id, date)`` and sold items can't reference
+    receipts with a foreign key constraint anymore; receipts deletion
+    still cascades to sold items through the Django ORM.
+    """
+    if connection.pg_version < 110000:
+        raise ImproperlyConfigured('DATABASES_PARTITIONING requires PostgreSQL 11 or later')
+
+    with connection.cursor() as cursor:
+        if get_partitions(cursor, 'registers_sell'):
+            return
+
+        constraints = connection.introspection.get_constraints(cursor, 'registers_sell')
+        for name, constraint in constraints.items():
+            if constraint['foreign_key'] == ('registers_receipt', 'id'):
+                cursor.execute('ALTER TABLE "registers_sell" DROP CONSTRAINT "{}"'.format(name))
+
+        cursor.execute('SELECT min("date") FROM "registers_receipt"')
+        first = cursor.fetchone()[0] or date.today()
+        today = date.today()
+        count = (today.year - first.year) * 12 + today.month - first.month + months_ahead + 1
+
+        for table in TABLES:
+            cursor.execute('SELECT pg_get_serial_sequence(%s, %s)', [table, 'id'])
+            sequence = cursor.fetchone()[0]
+            cursor.execute('ALTER TABLE "{0}" RENAME TO "{0}_old"'.format(table))
+            cursor.execute(
+                'CREATE TABLE "{0}" (LIKE "{0}_old" INCLUDING DEFAULTS) PARTITION BY RANGE ("date")'.format(table)
+            )
+            cursor.execute('CREATE TABLE "{0}_default" PARTITION OF "{0}" DEFAULT'.format(table))
+            for month in months(first, count):
+                for sql in partition_sql(table, month):
+                    cursor.execute(sql)
+            cursor.execute('INSERT INTO "{0}" SELECT * FROM "{0}_old"'.format(table))
+            # the sequence would be dropped with the old table
+            cursor.execute('ALTER SEQUENCE {} OWNED BY "{}"."id"'.format(sequence, table))
+            cursor.execute('DROP TABLE "{}_old"'.format(table))
+
+        for table in TABLES:
+            cursor.execute('ALTER TABLE "{0}" ADD CONSTRAINT "{0}_pkey" PRIMARY KEY ("id", "date")'.format(table))
+            for column in INDEXES[table]:
+                cursor.execute('CREATE INDEX "{0}_{1}_idx" ON "{0}" ("{1}")'.format(table, column))
+            for column, target in FOREIGN_KEYS[table]:
+                cursor.execute(
+                    'ALTER TABLE "{0}" ADD CONSTRAINT "{0}_{1}_fk" FOREIGN KEY ("{1}") '
+                    'REFERENCES "{2}" ("id") DEFERRABLE INITIALLY DEFERRED'.format(table, column, target)
+                )
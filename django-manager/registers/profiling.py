@@ -0,0 +1,151 @@
+import sys
+import time
+import random
+import marshal
+import cProfile
+import logging
+import threading
+
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import Profile
+
+
+logger = logging.getLogger(__name__)
+
+# sample rate set in the admin, that overrides ``PROFILING_SAMPLE_RATE``
+SAMPLE_RATE_KEY = 'registers:profiling:rate'
+
+# the request header that enables profiling
+PROFILE_HEADER = 'HTTP_X_PROFILE'
+
+
+class Sampler(threading.Thread):
+    """
+    Thread that samples the call stack of another thread every
+    ``interval`` seconds, counting how many times each stack is seen.
+    The profiled thread is never interrupted, so code that is not
+    sampled runs at full speed.
+    """
+    def __init__(self, thread_id, interval):
+        super().__init__(daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stopped = threading.Event()
+
+    def run(self):
+        while not self._stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                return
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append('{}:{}'.format(frame.f_globals.get('__name__', code.co_filename), code.co_name))
+                frame = frame.f_back
+            self.stacks[';'.join(reversed(stack))] += 1
+
+    def stop(self):
+        self._stopped.set()
+        self.join()
+
+    def folded(self):
+        """
+        Returns the sampled stacks in the folded format (one stack with
+        its count on each line) read by flame graph tools.
+        """
+        return ''.join('{} {}\n'.format(stack, count) for stack, count in sorted(self.stacks.items()))
+
+
+def get_sample_rate():
+    """
+    Returns N if 1 out of N requests is profiled, or 0 if sampling is
+    disabled.
+    """
+    rate = cache.get(SAMPLE_RATE_KEY)
+    return settings.PROFILING_SAMPLE_RATE if rate is None else rate
+
+
+def set_sample_rate(rate, timeout=3600):
+    """
+    Profiles 1 out of ``rate`` requests (0 disables sampling) for the
+    next ``timeout`` seconds, in all workers that share the cache.
+    """
+    cache.set(SAMPLE_RATE_KEY, rate, timeout=timeout)
+
+
+def should_profile(request):
+    """
+    Returns ``True`` if the authenticated request must be profiled,
+    because it's sent by a staff user with the ``X-Profile`` header or
+    because it's sampled.
+    """
+    if not request.user.is_staff:
+        return False
+    if PROFILE_HEADER in request.META:
+        return True
+    rate = get_sample_rate()
+    return rate > 0 and random.randrange(rate) == 0
+
+
+def store_profile(request, response, duration, sampler, profiler):
+    """
+    Stores the ``Profile`` of a request, removing the oldest profiles.
+    """
+    profiler.create_stats()
+    profile = Profile.objects.create(
+        method=request.method,
+        path=request.get_full_path()[:255],
+        user=request.user if request.user.is_authenticated else None,
+        register=getattr(request.auth, 'register', None),
+        status_code=response.status_code,
+        duration=duration * 1000,
+        samples=sum(sampler.stacks.values()),
+        stacks=sampler.folded(),
+        pstats=marshal.dumps(profiler.stats),
+    )
+    oldest = Profile.objects.values_list('created', flat=True)[settings.PROFILING_KEEP:settings.PROFILING_KEEP + 1]
+    if oldest:
+        Profile.objects.filter(created__lte=oldest[0]).delete()
+    return profile
+
+
+class ProfilingMixin:
+    """
+    Profiles API requests of staff users with the ``X-Profile`` header,
+    and 1 out of ``PROFILING_SAMPLE_RATE`` requests. Profiling starts after
+    the request is authenticated and allowed, so other clients can't
+    start it. The call stack is sampled by a ``Sampler`` thread while
+    ``cProfile`` collects the calls statistics, so profiled requests are
+    slower; requests that are not profiled only read the sample rate.
+    """
+    _profiling = None
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if should_profile(request):
+            sampler = Sampler(threading.get_ident(), settings.PROFILING_INTERVAL)
+            profiler = cProfile.Profile()
+            self._profiling = (time.monotonic(), sampler, profiler)
+            sampler.start()
+            profiler.enable()
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        if self._profiling is None:
+            return response
+
+        start, sampler, profiler = self._profiling
+        self._profiling = None
+        profiler.disable()
+        sampler.stop()
+        try:
+            store_profile(request, response, time.monotonic() - start, sampler, profiler)
+        except Exception:
+            # profiling must not break the request
+            logger.exception('unable to store the profile of %s', request.path)
+        return response
@@ -8,33 +8,46 @@ from datetime import datetime
 TWOPLACES = D(10) ** -2
 
 
+def convert_item(description, price, quantity):
+    """
+    Utility function that converts a sold item into the dictionary
+    supported by the third-party library ``python-cash-register``.
+    """
+    # base row attributes
+    row = {
+        'description': description,
+        'price': str(price.quantize(TWOPLACES)),
+    }
+
+    # append the quantity only if > 1.0
+    # Note: the current implementation expects that the shop
+    # sells items in unit price instead of other measurement
+    # units. Because of that, selling 0.50 kg of stuff
+    # is not possible.
+    if quantity > 1:
+        row.update({'quantity': str(quantity.quantize(TWOPLACES))})
+
+    return row
+
+
 def convert_serializer(serializer):
     """
     Utility function that converts the serializer ``validated_data``
     into the proper list supported by the third-party library
     ``python-cash-register``.
     """
-    items = []
-    for product in serializer.validated_data['products']:
-        # base row attributes
-        description = product['id'].name
-        price = str(product['price'].quantize(TWOPLACES))
-        row = {
-            'description': description,
-            'price': price,
-        }
-
-        # append the quantity only if > 1.0
-        # Note: the current implementation expects that the shop
-        # sells items in unit price instead of other measurement
-        # units. Because of that, selling 0.50 kg of stuff
-        # is not possible.
-        if product['quantity'] > 1:
-            quantity = str(product['quantity'].quantize(TWOPLACES))
-            row.update({'quantity': quantity})
-
-        items.append(row)
-    return items
+    return [
+        convert_item(product['id'].name, product['price'], product['quantity'])
+        for product in serializer.validated_data['products']
+    ]
+
+
+def convert_snapshot(snapshot):
+    """
+    Utility function that converts a ``ReceiptSnapshot`` into the proper
+    list supported by the third-party library ``python-cash-register``.
+    """
+    return [convert_item(item.product, item.price, item.quantity) for item in snapshot.items]
 
 
 def timezone_now():
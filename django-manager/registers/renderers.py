@@ -0,0 +1,33 @@
+import decimal
+
+import msgpack
+
+from rest_framework.renderers import BaseRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+
+def _encode(obj):
+    """
+    Encodes values that are not supported by MessagePack. ``Decimal``
+    values are encoded as strings so that their precision is preserved,
+    while other values are encoded like the ``JSONRenderer`` does.
+    """
+    if isinstance(obj, decimal.Decimal):
+        return str(obj)
+    return JSONEncoder().default(obj)
+
+
+class MessagePackRenderer(BaseRenderer):
+    """
+    Renderer that serializes data with MessagePack, so that till devices
+    download smaller payloads than JSON ones.
+    """
+    media_type = 'application/msgpack'
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return msgpack.packb(data, use_bin_type=True, default=_encode)
@@ -0,0 +1,86 @@
+import logging
+import threading
+
+from bisect import bisect_left
+
+from django.db import connections
+from django.db.models import Case, IntegerField, Value, When
+from django.db.models.functions import Upper
+
+from .catalog import get_version
+from .models import Product
+
+
+logger = logging.getLogger(__name__)
+
+# in-memory index of the current process, with its catalog version
+_index = None
+_index_lock = threading.Lock()
+
+
+class PrefixIndex(object):
+    """
+    In-memory index of product names, used when the database can't index
+    substring matches (i.e. SQLite). Names are sorted case-insensitively,
+    so prefix matches are found with a binary search, while substring
+    matches scan the lowercase names without hitting the database.
+    """
+    def __init__(self, products):
+        self.entries = sorted((name.casefold(), name, pk) for pk, name in products)
+        self.keys = [key for key, name, pk in self.entries]
+
+    def search(self, query):
+        """
+        Returns the primary keys of products matching ``query``: prefix
+        matches first, then substring matches, both ordered by name.
+        """
+        query = query.casefold()
+        start = bisect_left(self.keys, query)
+        prefix = []
+        for key, name, pk in self.entries[start:]:
+            if not key.startswith(query):
+                break
+            prefix.append(pk)
+
+        substring = [pk for key, name, pk in self.entries if query in key and not key.startswith(query)]
+        return prefix + substring
+
+
+def get_index(using):
+    """
+    Returns the ``PrefixIndex`` of the current catalog version, building
+    it again when products are changed.
+    """
+    global _index
+    version = get_version()
+    index = _index
+    if index is not None and index[0] == version:
+        return index[1]
+
+    with _index_lock:
+        if _index is None or _index[0] != version:
+            products = Product.objects.using(using).values_list('pk', 'name')
+            _index = (version, PrefixIndex(products))
+            logger.debug('built the products search index for version %s', version)
+        return _index[1]
+
+
+def search_products(query):
+    """
+    Returns the primary keys of products whose name starts with or
+    contains ``query`` (case-insensitive), with prefix matches first.
+    On PostgreSQL the returned queryset uses the trigram index of
+    product names, otherwise the in-memory ``PrefixIndex`` is used.
+    """
+    queryset = Product.objects.all()
+    if connections[queryset.db].vendor != 'postgresql':
+        return get_index(queryset.db).search(query)
+
+    return (
+        queryset
+        .filter(name__icontains=query)
+        .annotate(prefix=Case(When(name__istartswith=query, then=Value(0)), default=Value(1),
+                              output_field=IntegerField()))
+        .order_by('prefix', Upper('name'), 'pk')
+        .values_list('pk', flat=True)
+    )
@@ -1,18 +1,71 @@
+import os
+import decimal
+
+from collections import OrderedDict
+
 from django.db import transaction
 from django.conf import settings
+from django.core.files.storage import default_storage
 
 from rest_framework import serializers
 
-from .models import Product, Receipt, Sell
+from .icons import variant_names
+from .models import Product, ProductSales, Receipt, Sell
 
 
 class ProductSerializer(serializers.ModelSerializer):
     """
-    Serializer for the Product model
+    Serializer for the Product model. ``icons`` includes the URLs of the
+    icon variants by size and format, when they have been generated.
     """
+    icons = serializers.SerializerMethodField()
+
     class Meta:
         model = Product
-        fields = '__all__'
+        exclude = ('icon_hash',)
+
+    def get_icons(self, product):
+        if not product.icon or not product.icon_hash:
+            return None
+
+        request = self.context.get('request')
+        icons = {}
+        for size, formats in variant_names(product.icon.name, product.icon_hash).items():
+            icons[str(size)] = {}
+            for extension, name in formats.items():
+                url = default_storage.url(name)
+                icons[str(size)][extension] = request.build_absolute_uri(url) if request else url
+        return icons
+
+
+class ProductImportSerializer(serializers.Serializer):
+    """
+    The ``ProductImportSerializer`` validates a row of a products import.
+    Products are matched by ``name``, so existing names are valid:
+        * ``default_price``: the new price of the product
+        * ``default_price_currency``: optional, defaults to 'EUR'
+        * ``icon``: optional file name of the product icon
+    """
+    name = serializers.CharField(max_length=100)
+    default_price = serializers.DecimalField(max_digits=10, decimal_places=2)
+    default_price_currency = serializers.ChoiceField(settings.CURRENCIES, default='EUR')
+    icon = serializers.CharField(max_length=100, required=False, allow_blank=True)
+
+    def validate_icon(self, value):
+        if value and os.path.basename(value) != value:
+            raise serializers.ValidationError('Use a file name, not a path.')
+        return value
+
+
+class ProductSalesSerializer(serializers.ModelSerializer):
+    """
+    Serializer for the daily ``ProductSales`` counters
+    """
+    name = serializers.CharField(source='product.name')
+
+    class Meta:
+        model = ProductSales
+        fields = ('product', 'name', 'day', 'quantity', 'revenue', 'revenue_currency')
 
 
 class ReceiptItemSerializer(serializers.Serializer):
@@ -50,23 +103,26 @@ class ReceiptSerializer(serializers.Serializer):
     products = ReceiptItemSerializer(many=True, allow_empty=False)
 
     @transaction.atomic
-    def save(self):
+    def save(self, **kwargs):
         """
         Custom save() for serializer that creates the ``Receipt``, honoring
         the ManyToMany relationship with ``Product`` (through the ``Sell``
-        model).
+        model). Given ``kwargs`` are ``Receipt`` attributes that are not
+        part of the user input (e.g. the ``Register``).
 
         The creation pass through the following steps:
             * a transaction is created
             * the ``Receipt`` is created
             * for each product in ``products``, create a ``Sell`` relationship
               with ``Product``
+            * update the ``ProductSales`` counters of sold products
             * if the result is GOOD => commit the transaction
             * if the result is BAD => rollback the transaction
         """
         # create an empty Receipt
-        receipt = Receipt.objects.create()
+        receipt = Receipt.objects.create(**kwargs)
         # add sold items to the Receipt
+        sells = []
         for item in self.validated_data['products']:
             sell = Sell(
                 receipt=receipt,
@@ -76,5 +132,137 @@ class ReceiptSerializer(serializers.Serializer):
                 price_currency=item['price_currency'],
             )
             sell.save()
+            sells.append(sell)
 
+        # update daily counters in the same transaction
+        ProductSales.objects.record(receipt.date, sells)
         return receipt
+
+
+def _decimal_quantizer(field):
+    """
+    Returns the precision limits and the quantize arguments of the
+    given ``DecimalField``.
+    """
+    context = decimal.getcontext().copy()
+    context.prec = field.max_digits
+    exponent = decimal.Decimal('.1') ** field.decimal_places
+    return (field.max_digits, field.decimal_places, field.max_digits - field.decimal_places, exponent, context)
+
+
+class FastReceiptSerializer(ReceiptSerializer):
+    """
+    ``ReceiptSerializer`` that validates receipts without the generic DRF
+    field machinery: sold items are validated in a single loop, and all
+    products are loaded with one query instead of one query for each line.
+    ``validated_data`` has the same shape and values of the
+    ``ReceiptSerializer`` ones.
+
+    Only valid input is handled by the fast path: if any value is not
+    valid, or it's not a plain JSON value, the ``ReceiptSerializer``
+    validation runs, so that errors are always the same.
+    """
+    MAX_STRING_LENGTH = serializers.DecimalField.MAX_STRING_LENGTH
+
+    # precomputed from the ``ReceiptItemSerializer`` fields
+    item_fields = ReceiptItemSerializer().fields
+    currencies = item_fields['price_currency'].choice_strings_to_values
+    default_currency = item_fields['price_currency'].default
+    default_quantity = item_fields['quantity'].default
+    price_quantizer = _decimal_quantizer(item_fields['price'])
+    quantity_quantizer = _decimal_quantizer(item_fields['quantity'])
+
+    def _decimal(self, value, quantizer):
+        """
+        Returns the quantized ``Decimal`` of the given value, or ``None``
+        if it's not valid for ``DecimalField``.
+        """
+        if isinstance(value, bool) or not isinstance(value, (str, int, float, decimal.Decimal)):
+            return None
+        value = str(value).strip()
+        if len(value) > self.MAX_STRING_LENGTH:
+            return None
+        try:
+            value = decimal.Decimal(value)
+        except decimal.DecimalException:
+            return None
+        if not value.is_finite():
+            return None
+
+        max_digits, max_decimal_places, max_whole_digits, exponent, context = quantizer
+        _, digits, value_exponent = value.as_tuple()
+        if value_exponent >= 0:
+            total_digits = whole_digits = len(digits) + value_exponent
+            decimal_places = 0
+        elif len(digits) > -value_exponent:
+            total_digits = len(digits)
+            decimal_places = -value_exponent
+            whole_digits = total_digits - decimal_places
+        else:
+            total_digits = decimal_places = -value_exponent
+            whole_digits = 0
+        if total_digits > max_digits or decimal_places > max_decimal_places or whole_digits > max_whole_digits:
+            return None
+        return value.quantize(exponent, context=context)
+
+    def _fast_internal_value(self, data):
+        """
+        Returns the validated data, or ``None`` if the fast path
+        cannot validate the given data.
+        """
+        if type(data) is not dict:
+            # QueryDict and other mappings are parsed by DRF
+            return None
+        items = data.get('products')
+        if type(items) is not list or not items:
+            return None
+
+        lines = []
+        product_ids = set()
+        for item in items:
+            if type(item) is not dict:
+                return None
+            pk = item.get('id')
+            if type(pk) is str and pk.isdecimal():
+                pk = int(pk)
+            elif type(pk) is not int:
+                return None
+            price = self._decimal(item.get('price'), self.price_quantizer)
+            if price is None:
+                return None
+            if 'price_currency' in item:
+                currency = self.currencies.get(str(item['price_currency']))
+                if currency is None:
+                    return None
+            else:
+                currency = self.default_currency
+            if 'quantity' in item:
+                quantity = self._decimal(item['quantity'], self.quantity_quantizer)
+                if quantity is None:
+                    return None
+            else:
+                quantity = self.default_quantity
+            lines.append((pk, price, currency, quantity))
+            product_ids.add(pk)
+
+        products = Product.objects.in_bulk(product_ids)
+        if len(products) != len(product_ids):
+            return None
+
+        return OrderedDict([
+            ('products', [
+                OrderedDict([
+                    ('id', products[pk]),
+                    ('price', price),
+                    ('price_currency', currency),
+                    ('quantity', quantity),
+                ])
+                for pk, price, currency, quantity in lines
+            ]),
+        ])
+
+    def to_internal_value(self, data):
+        value = self._fast_internal_value(data)
+        if value is None:
+            return super().to_internal_value(data)
+        return value
@@ -0,0 +1,201 @@
+import os
+import re
+import tty
+import struct
+import time
+import random
+import select
+import socket
+import logging
+import threading
+
+
+logger = logging.getLogger(__name__)
+
+# software flow control characters, honored by serial ports with ``xonxoff``
+XON = b'\x11'
+XOFF = b'\x13'
+
+# a sold item is sent as '"{description}"{price}{quantity}H1R', where the
+# optional quantity is prefixed by '*'
+SELL_COMMAND = re.compile(br'"(?P<description>[^"]*)"(?P<price>[0-9.]+)(?:\*(?P<quantity>[0-9.]+))?H1R')
+
+
+class SaremaX1Simulator(object):
+    """
+    SaremaX1Simulator is a fake cash register that understands the
+    commands sent by ``python-cash-register`` for the ``SaremaX1`` model.
+    It can be exposed through:
+        * a pseudo-terminal, with ``start_pty()``; the returned path is
+          used as a serial port and ``flush()`` waits until the simulator
+          has read all data, like a real serial line
+        * a TCP socket, with ``start_socket()``; the returned
+          ``socket://`` URL is used as a serial port
+
+    The simulator reads data as a serial line with the given ``baudrate``
+    would do (10 bits per byte); ``None`` disables the delay. With
+    a ``failure_rate`` greater than zero, some receipts drop the socket
+    connection as an unplugged device; failures are not available
+    for pseudo-terminals.
+
+    Printed receipts are stored in ``receipts`` as lists of items, using
+    the same schema of ``python-cash-register``.
+    """
+    def __init__(self, baudrate=None, failure_rate=0, seed=None):
+        self.baudrate = baudrate
+        self.failure_rate = failure_rate
+        self.receipts = []
+        self.errors = 0
+        self._random = random.Random(seed)
+        self._buffer = b''
+        self._items = None
+        self._running = False
+        self._threads = []
+        self._fds = []
+        self._server = None
+        self._last_read = 0
+
+    def feed(self, data):
+        """
+        Parses the given bytes, storing a receipt each time it's closed.
+        Incomplete commands are kept until more data is received.
+        """
+        self._buffer += data
+        while self._buffer:
+            if self._buffer.startswith(b'K'):
+                # clear: a new receipt starts
+                self._items = []
+                self._buffer = self._buffer[1:]
+            elif self._buffer.startswith(b'1T'):
+                # close: the receipt is printed
+                if self._items:
+                    self.receipts.append(self._items)
+                self._items = None
+                self._buffer = self._buffer[2:]
+            elif self._buffer.startswith(b'"'):
+                match = SELL_COMMAND.match(self._buffer)
+                if match is None:
+                    if b'H1R' in self._buffer:
+                        self._discard('malformed sell command')
+                        continue
+                    # wait for the rest of the command
+                    break
+                item = {
+                    'description': match.group('description').decode(),
+                    'price': match.group('price').decode(),
+                }
+                if match.group('quantity'):
+                    item['quantity'] = match.group('quantity').decode()
+                if self._items is None:
+                    self.errors += 1
+                    logger.warning('sell command without a clear command')
+                else:
+                    self._items.append(item)
+                self._buffer = self._buffer[match.end():]
+            elif self._buffer == b'1':
+                # wait for the rest of the close command
+                break
+            else:
+                self._discard('unknown command')
+
+    def _discard(self, reason):
+        # skip one byte so that the parser can recover
+        self.errors += 1
+        logger.warning('%s: %r', reason, self._buffer[:20])
+        self._buffer = self._buffer[1:]
+
+    def _read(self, fd, recv):
+        """
+        Reads from the given channel until the simulator is stopped or
+        the channel is closed. Returns ``False`` if a failure is injected.
+        """
+        while self._running:
+            ready, _, _ = select.select([fd], [], [], 0.1)
+            if not ready:
+                continue
+            try:
+                data = recv()
+            except OSError:
+                return True
+            if not data:
+                return True
+            self._last_read = time.monotonic()
+            if self.baudrate:
+                self._transmit(fd, len(data))
+            if b'K' in data and self._random.random() < self.failure_rate:
+                logger.info('injecting a failure')
+                return False
+            self.feed(data)
+        return True
+
+    def _transmit(self, fd, size):
+        """
+        Waits the time needed to receive ``size`` bytes. On pseudo-terminals
+        the output is paused with XOFF meanwhile, so that the adapter is
+        slowed down (and ``flush()`` blocks) as with a real serial line.
+        """
+        flow_control = fd in self._fds
+        if flow_control:
+            os.write(fd, XOFF)
+        time.sleep(size * 10.0 / self.baudrate)
+        if flow_control:
+            os.write(fd, XON)
+
+    def _start(self, target, *args):
+        self._running = True
+        thread = threading.Thread(target=target, args=args, daemon=True)
+        thread.start()
+        self._threads.append(thread)
+
+    def start_pty(self):
+        """
+        Starts the simulator on a pseudo-terminal and returns the path
+        of the serial port.
+        """
+        master, slave = os.openpty()
+        tty.setraw(slave)
+        # the slave is kept open, so the terminal survives when
+        # the adapter closes the serial port
+        self._fds.extend([master, slave])
+        self._start(self._read, master, lambda: os.read(master, 1024))
+        return os.ttyname(slave)
+
+    def _serve(self):
+        while self._running:
+            ready, _, _ = select.select([self._server], [], [], 0.1)
+            if not ready:
+                continue
+            conn, _ = self._server.accept()
+            with conn:
+                if not self._read(conn, lambda: conn.recv(1024)):
+                    # reset the connection as an unplugged device
+                    conn.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, struct.pack('ii', 1, 0))
+
+    def start_socket(self, host='127.0.0.1', port=0):
+        """
+        Starts the simulator on a TCP socket and returns the ``socket://``
+        URL of the serial port.
+        """
+        self._server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._server.bind((host, port))
+        self._server.listen(1)
+        self._start(self._serve)
+        host, port = self._server.getsockname()
+        return 'socket://{}:{}'.format(host, port)
+
+    def stop(self, idle=0.2):
+        """
+        Stops all simulator threads and closes the serial channels, after
+        pending data is read (no data received for ``idle`` seconds).
+        """
+        while time.monotonic() - self._last_read < idle:
+            time.sleep(idle / 2)
+        self._running = False
+        for thread in self._threads:
+            thread.join()
+        for fd in self._fds:
+            os.close(fd)
+        if self._server is not None:
+            self._server.close()
+        self._threads, self._fds, self._server = [], [], None
@@ -0,0 +1,87 @@
+from decimal import Decimal
+from collections import OrderedDict, namedtuple
+
+from django.db.models import QuerySet
+
+from .models import Receipt
+
+
+class SoldItem(namedtuple('SoldItem', ['product', 'price', 'quantity'])):
+    """
+    A sold item of a ``ReceiptSnapshot``:
+        * ``product``: the product name
+        * ``price``: the ``Decimal`` price of a single item
+        * ``quantity``: the ``Decimal`` quantity of sold items
+    """
+    __slots__ = ()
+
+    @property
+    def total(self):
+        return self.price * self.quantity
+
+
+class RegisterConfig(namedtuple('RegisterConfig', ['name', 'serial_port', 'baudrate', 'xonxoff', 'timeout'])):
+    """
+    Configuration of the ``Register`` that prints the receipt.
+    """
+    __slots__ = ()
+
+
+class ReceiptSnapshot(namedtuple('ReceiptSnapshot', ['id', 'date', 'register', 'items', 'total'])):
+    """
+    Immutable representation of a stored ``Receipt``, shared by all
+    ``Adapters``. It's built once for each receipt, so that adapters
+    never query the database:
+        * ``id``: the ``Receipt`` primary key
+        * ``date``: when the receipt has been created
+        * ``register``: a ``RegisterConfig``, or ``None`` if the receipt
+          is printed by the default device
+        * ``items``: a tuple of ``SoldItem``, in the order they have
+          been sold
+        * ``total``: the ``Decimal`` total amount of the receipt
+    """
+    __slots__ = ()
+
+
+def build_snapshots(receipts):
+    """
+    Returns a list of ``ReceiptSnapshot`` for the given ``Receipt``
+    instances (or queryset), using a single query.
+    """
+    if isinstance(receipts, QuerySet):
+        # used as a subquery
+        ids = receipts.values('pk')
+    else:
+        ids = [receipt.pk for receipt in receipts]
+
+    rows = (
+        Receipt.objects
+        .filter(pk__in=ids)
+        .order_by('pk', 'sell__id')
+        .values_list(
+            'pk',
+            'date',
+            'register__name',
+            'register__serial_port',
+            'register__baudrate',
+            'register__xonxoff',
+            'register__timeout',
+            'sell__product__name',
+            'sell__price',
+            'sell__quantity',
+        )
+    )
+
+    receipts = OrderedDict()
+    for pk, date, name, port, baudrate, xonxoff, timeout, product, price, quantity in rows:
+        if pk not in receipts:
+            register = RegisterConfig(name, port, baudrate, xonxoff, timeout) if name is not None else None
+            receipts[pk] = (date, register, [])
+        # receipts without sold items have a single empty row
+        if product is not None:
+            receipts[pk][2].append(SoldItem(product, price, quantity))
+
+    return [
+        ReceiptSnapshot(pk, date, register, tuple(items), sum((item.total for item in items), Decimal(0)))
+        for pk, (date, register, items) in receipts.items()
+    ]
@@ -2,6 +2,7 @@ import pytest
 
 from io import BytesIO
 
+from django.core.cache import cache
 from django.core.files.uploadedfile import InMemoryUploadedFile
 
 from PIL import Image
@@ -9,6 +10,16 @@ from PIL import Image
 from rest_framework.test import APIClient
 
 
+@pytest.fixture(autouse=True)
+def clear_cache():
+    """
+    The in-memory cache is shared between tests, so stored
+    states (e.g. circuit breakers) are removed after each test.
+    """
+    yield
+    cache.clear()
+
+
 @pytest.fixture
 def temp_image():
     """
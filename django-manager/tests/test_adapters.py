@@ -3,7 +3,12 @@ These tests don't check the validity of the ViewSet or of the
 Serializer but only assert that the ``python-cash-register``
 integration works properly.
 """
+import os
+import sys
+import fcntl
 import pytest
+import threading
+import subprocess
 
 from django.utils import timezone
 
@@ -12,18 +17,47 @@ from serial import SerialException
 from model_mommy import mommy
 
 from registers import adapters
-from registers.models import Product, Receipt, Sell
-from registers.exceptions import AdapterPushFailed
+from registers.dispatch import push_receipts
+from registers.models import Product, Receipt, Register, Sell
+from registers.exceptions import AdapterPushFailed, AdapterUnavailable, CashRegisterBusy, CashRegisterNotReady
+from registers.snapshots import ReceiptSnapshot, build_snapshots
+from registers.adapters.queues import PrintQueue
+from registers.adapters.breakers import CLOSED, HALF_OPEN, OPEN, CircuitBreaker
+from registers.adapters.registry import get_adapters, reset_adapters
 from registers.adapters.services import DatadogAdapter
-from registers.adapters.printers import CashRegisterAdapter
+from registers.adapters.printers import CashRegisterAdapter, get_device, shutdown_devices
+
+
+def _make_snapshot(register=None):
+    """
+    Creates a ``Receipt`` with 2 sold items and returns its snapshot.
+    """
+    receipt = mommy.make(Receipt, register=register)
+    Sell.objects.create(
+        receipt=receipt,
+        product=Product.objects.get_or_create(name='Croissant')[0],
+        quantity=1,
+        price=5.90,
+    )
+    Sell.objects.create(
+        receipt=receipt,
+        product=Product.objects.get_or_create(name='Begel')[0],
+        quantity=2,
+        price=2.00,
+    )
+    return build_snapshots([receipt])[0]
 
 
 class TestCashRegisterAdapter:
+    def teardown_method(self, method):
+        # devices are reused, so mocked connections must be discarded
+        shutdown_devices()
+
     @pytest.mark.django_db
     def test_cash_register_adapter(self, mocker):
         """
         Ensure that a list of sold items is printed:
-            * prepare a payload with 2 sold items
+            * prepare a receipt with 2 sold items
             * push the adapter
             * expect that the receipt is printed
         """
@@ -34,7 +68,14 @@ class TestCashRegisterAdapter:
         sell_products = mocker.spy(adapters.printers.SaremaX1, 'sell_products')
         send = mocker.spy(adapters.printers.SaremaX1, 'send')
         # sold products
-        sold_items = [
+        snapshot = _make_snapshot()
+        # push data
+        adapter.push(snapshot)
+        assert sell_products.call_count == 1
+        assert send.call_count == 1
+        # check the given payload
+        args, _ = sell_products.call_args
+        assert args[-1] == [
             {
                 'description': 'Croissant',
                 'price': '5.90',
@@ -45,17 +86,13 @@ class TestCashRegisterAdapter:
                 'quantity': '2.00',
             },
         ]
-        # push data
-        adapter.push(sold_items)
-        assert sell_products.call_count == 1
-        assert send.call_count == 1
 
     @pytest.mark.django_db
     def test_cash_register_adapter_failure(self, mocker):
         """
         Ensure that an AdapterPushFailed is raised when using this
         adapter:
-            * prepare a payload with 2 sold items
+            * prepare a receipt with 2 sold items
             * push the adapter
             * expect that an exception is raised
         """
@@ -65,22 +102,326 @@ class TestCashRegisterAdapter:
         serial_port = mocker.patch('registers.adapters.printers.Serial')
         serial_port.side_effect = SerialException
         # sold products
-        sold_items = [
-            {
-                'description': 'Croissant',
-                'price': '5.90',
-            },
-            {
-                'description': 'Begel',
-                'price': '2.00',
-                'quantity': '2.00',
-            },
-        ]
+        snapshot = _make_snapshot()
         # push data and check the Exception
         with pytest.raises(AdapterPushFailed) as excinfo:
-            adapter.push(sold_items)
+            adapter.push(snapshot)
         assert excinfo.typename == 'CashRegisterNotReady'
 
+    @pytest.mark.django_db
+    def test_cash_register_connection_reuse(self, mocker):
+        """
+        Ensure that the serial connection is opened once and reused:
+            * push two receipts to the default device
+            * expect that only one serial connection is opened
+        """
+        adapter = CashRegisterAdapter()
+        serial_port = mocker.patch('registers.adapters.printers.Serial')
+        adapter.push(_make_snapshot())
+        adapter.push(_make_snapshot())
+        assert serial_port.call_count == 1
+        assert serial_port.return_value.open.call_count == 1
+        assert serial_port.return_value.close.call_count == 0
+
+    @pytest.mark.django_db
+    def test_cash_register_connection_reset(self, mocker):
+        """
+        Ensure that a failing connection is not reused:
+            * the first write fails
+            * expect that the next receipt opens a new connection
+        """
+        adapter = CashRegisterAdapter()
+        serial_port = mocker.patch('registers.adapters.printers.Serial')
+        serial_port.return_value.write.side_effect = [SerialException, None, None, None, None]
+        with pytest.raises(CashRegisterNotReady):
+            adapter.push(_make_snapshot())
+        adapter.push(_make_snapshot())
+        assert serial_port.call_count == 2
+
+    @pytest.mark.django_db
+    def test_cash_register_routing(self, mocker, settings):
+        """
+        Ensure that receipts are printed by the device of their ``Register``:
+            * create a receipt for the default device
+            * create a receipt bound to a ``Register``
+            * expect that each receipt uses its own serial port
+        """
+        settings.SERIAL_PORT = '/dev/ttyUSB0'
+        register = mommy.make(Register, name='Till 2', serial_port='/dev/ttyUSB1')
+        adapter = CashRegisterAdapter()
+        serial_port = mocker.patch('registers.adapters.printers.Serial')
+        adapter.push(_make_snapshot())
+        adapter.push(_make_snapshot(register))
+        assert serial_port.call_count == 2
+        assert get_device() is not get_device(register)
+        assert get_device().port == '/dev/ttyUSB0'
+        assert get_device(register).port == '/dev/ttyUSB1'
+
+
+class TestPrintQueue:
+    def test_queue_depth(self):
+        """
+        Ensures that the queue depth counts receipts that are printing
+        """
+        queue = PrintQueue('/dev/ttyDepth')
+        assert queue.depth == 0
+        with queue.slot():
+            assert queue.depth == 1
+        assert queue.depth == 0
+
+    def test_queue_backpressure(self, settings):
+        """
+        Ensures that receipts are rejected when the queue is full:
+            * the queue accepts one receipt
+            * a second receipt raises ``CashRegisterBusy``
+            * the rejected receipt doesn't change the queue depth
+        """
+        settings.PRINT_QUEUE_MAX_DEPTH = 1
+        queue = PrintQueue('/dev/ttyFull')
+        with queue.slot():
+            with pytest.raises(CashRegisterBusy):
+                with queue.slot():
+                    pass
+            assert queue.depth == 1
+        assert queue.depth == 0
+
+    def test_queue_depth_expired(self, mocker):
+        """
+        Ensures that the queue depth is not reset when the counter expires
+        while another worker adds it again
+        """
+        queue = PrintQueue('/dev/ttyExpired')
+        cache = adapters.queues.cache
+        incr = cache.incr
+        expired = []
+
+        def incr_expired(key, delta=1, version=None):
+            if not expired:
+                # another worker adds the counter after it expired
+                expired.append(key)
+                cache.set(key, 2)
+                raise ValueError
+            return incr(key, delta, version)
+
+        mocker.patch.object(cache, 'incr', side_effect=incr_expired)
+        cache.set(queue.depth_key, 1)
+        with queue.slot() as depth:
+            assert depth == 3
+        assert queue.depth == 2
+
+    def test_lock_timeout(self, settings, tmpdir):
+        """
+        Ensures that a device locked by another worker raises
+        ``CashRegisterBusy`` after ``PRINT_QUEUE_TIMEOUT`` seconds.
+        """
+        settings.PRINT_QUEUE_TIMEOUT = 0.05
+        settings.PRINT_QUEUE_LOCK_DIR = str(tmpdir)
+        queue = PrintQueue('/dev/ttyLocked')
+        # another worker holds the lock
+        fd = os.open(queue.lock_path, os.O_RDWR | os.O_CREAT)
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        try:
+            with pytest.raises(CashRegisterBusy):
+                with queue.lock():
+                    pass
+        finally:
+            os.close(fd)
+        # the lock is released
+        with queue.lock():
+            pass
+
+
+class TestCircuitBreaker:
+    def test_circuit_opens(self, mocker, settings):
+        """
+        Ensures that the circuit opens after consecutive failures:
+            * the adapter fails ``ADAPTERS_CIRCUIT_THRESHOLD`` times
+            * the circuit is open
+            * the adapter is not called anymore
+        """
+        settings.ADAPTERS_CIRCUIT_THRESHOLD = 2
+        breaker = CircuitBreaker('test.opens')
+        push = mocker.Mock(side_effect=CashRegisterNotReady)
+        for _ in range(2):
+            with pytest.raises(CashRegisterNotReady):
+                breaker.call(push)
+        assert breaker.state == OPEN
+        with pytest.raises(AdapterUnavailable):
+            breaker.call(push)
+        assert push.call_count == 2
+
+    def test_circuit_half_open(self, mocker, settings):
+        """
+        Ensures that an open circuit allows a single probe after
+        ``ADAPTERS_CIRCUIT_RESET_TIMEOUT`` seconds:
+            * the circuit is open
+            * after the timeout the circuit is half-open
+            * a failing probe opens the circuit again
+            * a successful probe closes the circuit
+        """
+        settings.ADAPTERS_CIRCUIT_THRESHOLD = 1
+        settings.ADAPTERS_CIRCUIT_RESET_TIMEOUT = 30
+        clock = mocker.patch('registers.adapters.breakers.time.time', return_value=1000)
+        breaker = CircuitBreaker('test.half_open')
+        breaker.record_failure()
+        assert breaker.state == OPEN
+        # the probe fails
+        clock.return_value = 1031
+        assert breaker.state == HALF_OPEN
+        with pytest.raises(CashRegisterNotReady):
+            breaker.call(mocker.Mock(side_effect=CashRegisterNotReady))
+        assert breaker.state == OPEN
+        # the probe succeeds
+        clock.return_value = 1062
+        assert breaker.call(mocker.Mock(return_value='ok')) == 'ok'
+        assert breaker.state == CLOSED
+        assert breaker.failures == 0
+
+    def test_circuit_single_probe(self, mocker, settings):
+        """
+        Ensures that only one request probes a half-open circuit
+        """
+        settings.ADAPTERS_CIRCUIT_THRESHOLD = 1
+        clock = mocker.patch('registers.adapters.breakers.time.time', return_value=1000)
+        breaker = CircuitBreaker('test.single_probe')
+        breaker.record_failure()
+        clock.return_value = 1000 + settings.ADAPTERS_CIRCUIT_RESET_TIMEOUT
+
+        def probe():
+            # a concurrent request while probing
+            with pytest.raises(AdapterUnavailable):
+                breaker.call(mocker.Mock())
+
+        breaker.call(probe)
+        assert breaker.state == CLOSED
+
+    def test_client_errors_are_ignored(self, mocker, settings):
+        """
+        Ensures that a busy cash register doesn't open the circuit
+        """
+        settings.ADAPTERS_CIRCUIT_THRESHOLD = 1
+        breaker = CircuitBreaker('test.busy')
+        with pytest.raises(CashRegisterBusy):
+            breaker.call(mocker.Mock(side_effect=CashRegisterBusy))
+        assert breaker.state == CLOSED
+
+    def test_concurrent_failures(self, settings):
+        """
+        Ensures that failures recorded by concurrent workers are all counted
+        """
+        settings.ADAPTERS_CIRCUIT_THRESHOLD = 100
+        breaker = CircuitBreaker('test.concurrent')
+        threads = [threading.Thread(target=breaker.record_failure) for _ in range(20)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert breaker.failures == 20
+        assert breaker.state == CLOSED
+
+    @pytest.mark.django_db
+    def test_circuit_per_register(self, mocker, settings):
+        """
+        Ensures that a failing printer disables only its own register:
+            * the printer of the first register fails
+            * receipts of the other register are still printed
+        """
+        settings.ADAPTERS_CIRCUIT_THRESHOLD = 1
+        broken = mommy.make(Register, serial_port='/dev/ttyUSB0')
+        healthy = mommy.make(Register, serial_port='/dev/ttyUSB1')
+
+        def push(snapshot):
+            if snapshot.register.serial_port == broken.serial_port:
+                raise CashRegisterNotReady
+
+        adapter = mocker.Mock(per_device=True)
+        adapter.push.side_effect = push
+        settings.PUSH_ADAPTERS = [adapter]
+        with pytest.raises(CashRegisterNotReady):
+            push_receipts([mommy.make(Receipt, register=broken)])
+        with pytest.raises(AdapterUnavailable):
+            push_receipts([mommy.make(Receipt, register=broken)])
+        push_receipts([mommy.make(Receipt, register=healthy)])
+        assert adapter.push.call_count == 2
+        assert CircuitBreaker.for_adapter(adapter, broken.serial_port).state == OPEN
+        assert CircuitBreaker.for_adapter(adapter, healthy.serial_port).state == CLOSED
+        assert CircuitBreaker.for_adapter(adapter).state == CLOSED
+
+    def test_circuit_per_service(self, mocker, settings):
+        """
+        Ensures that adapters of network services have one circuit for
+        all registers, while printers have a circuit for each device
+        """
+        mocker.patch('registers.adapters.services.ThreadStats')
+        service = 'registers.adapters.services.DatadogAdapter'
+        printer = 'registers.adapters.printers.CashRegisterAdapter'
+        key = CircuitBreaker.for_adapter(service).key
+        assert CircuitBreaker.for_adapter(service, '/dev/ttyUSB0').key == key
+        assert CircuitBreaker.for_adapter(DatadogAdapter(), '/dev/ttyUSB0').key == key
+        keys = {CircuitBreaker.for_adapter(printer, port).key for port in (None, '/dev/ttyUSB0', '/dev/ttyUSB1')}
+        assert len(keys) == 3
+
+
+class TestAdaptersRegistry:
+    def teardown_method(self, method):
+        reset_adapters()
+
+    def test_adapters_are_lazy(self, mocker, settings):
+        """
+        Ensures that adapters are initialized once, when they are used
+        for the first time
+        """
+        init = mocker.patch('registers.adapters.services.DatadogAdapter.__init__', return_value=None)
+        settings.PUSH_ADAPTERS = ['registers.adapters.services.DatadogAdapter']
+        assert init.call_count == 0
+        adapters = get_adapters()
+        assert get_adapters() is adapters
+        assert isinstance(adapters[0], DatadogAdapter)
+        assert init.call_count == 1
+
+    def test_adapters_after_fork(self, mocker, settings):
+        """
+        Ensures that a forked worker doesn't reuse the adapters (and their
+        threads) of the parent process
+        """
+        mocker.patch('registers.adapters.services.ThreadStats')
+        settings.PUSH_ADAPTERS = ['registers.adapters.services.DatadogAdapter']
+        adapter = get_adapters()[0]
+        mocker.patch('registers.adapters.registry.os.getpid', return_value=-1)
+        assert get_adapters()[0] is not adapter
+
+    def test_adapters_instances(self, mocker, settings):
+        """
+        Ensures that configured instances are used as they are, and
+        that they are replaced when the setting changes
+        """
+        adapter = mocker.Mock()
+        settings.PUSH_ADAPTERS = [adapter]
+        assert get_adapters() == [adapter]
+        settings.PUSH_ADAPTERS = []
+        assert get_adapters() == []
+
+    def test_breaker_name(self, mocker):
+        """
+        Ensures that the circuit breaker is the same for an adapter
+        and its dotted path
+        """
+        mocker.patch('registers.adapters.services.ThreadStats')
+        path = 'registers.adapters.services.DatadogAdapter'
+        assert CircuitBreaker.for_adapter(path).key == CircuitBreaker.for_adapter(DatadogAdapter()).key
+
+    def test_startup_imports(self, settings):
+        """
+        Ensures that loading the application doesn't import the
+        adapters dependencies
+        """
+        code = (
+            'import sys, django; django.setup(); import manager.urls; '
+            'print(sorted(m for m in ("datadog", "serial", "cash_register") if m in sys.modules))'
+        )
+        output = subprocess.check_output([sys.executable, '-c', code], cwd=settings.BASE_DIR)
+        assert output.strip() == b'[]'
+
 
 class TestDatadogAdapter:
     def setup(self):
@@ -143,7 +484,7 @@ class TestDatadogAdapter:
             price=1.0,
         )
         # test the adapter
-        self.adapter.push(receipt)
+        self.adapter.push(build_snapshots([receipt])[0])
         assert increment.call_count == 3
         # receipt count metric
         args, kwargs = increment.call_args_list[0]
@@ -175,5 +516,5 @@ class TestDatadogAdapter:
         adapter.statsd.increment.side_effect = Exception
         # push data and check the Exception
         with pytest.raises(AdapterPushFailed) as excinfo:
-            adapter.push(Receipt())
+            adapter.push(ReceiptSnapshot(1, timezone.now(), None, (), 0))
         assert excinfo.typename == 'AdapterPushFailed'
@@ -0,0 +1,152 @@
+import pytest
+
+from decimal import Decimal as D
+from datetime import timedelta
+
+from model_mommy import mommy
+
+from django.db import connection
+from django.core.urlresolvers import reverse
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from registers.models import Product, ProductSales, Receipt, Register, Sell
+from registers.adapters.breakers import CLOSED, OPEN, CircuitBreaker
+
+
+def _make_receipts(count):
+    """
+    Creates ``count`` receipts, each one with two sold items.
+    """
+    products = mommy.make(Product, _quantity=2)
+    for _ in range(count):
+        receipt = mommy.make(Receipt)
+        Sell.objects.create(receipt=receipt, product=products[0], quantity=1, price=1.5)
+        Sell.objects.create(receipt=receipt, product=products[1], quantity=2, price=2)
+
+
+class TestReceiptAdmin:
+    @pytest.mark.django_db
+    def test_changelist_totals(self, alice_client):
+        """
+        Ensures that the changelist shows totals and items count
+        computed by the database:
+            * create a receipt with 2 sold items
+            * open the changelist
+            * the row is annotated with the total and the items count
+        """
+        _make_receipts(1)
+        endpoint = reverse('admin:registers_receipt_changelist')
+        response = alice_client.get(endpoint)
+        assert response.status_code == 200
+        receipt = response.context['cl'].result_list[0]
+        assert receipt.receipt_items == 2
+        assert receipt.receipt_total == D('5.50')
+
+    @pytest.mark.django_db
+    def test_changelist_queries(self, alice_client):
+        """
+        Ensures that the changelist executes the same number of queries
+        regardless of the number of receipts in the page:
+            * render the changelist with 1 receipt
+            * render the changelist with 10 receipts
+            * the number of queries must be the same
+        """
+        endpoint = reverse('admin:registers_receipt_changelist')
+        _make_receipts(1)
+        # warm up caches that are populated only once (e.g. content types)
+        alice_client.get(endpoint)
+        with CaptureQueriesContext(connection) as single:
+            alice_client.get(endpoint)
+        _make_receipts(9)
+        with CaptureQueriesContext(connection) as many:
+            alice_client.get(endpoint)
+        assert len(single) == len(many)
+
+    @pytest.mark.django_db
+    def test_change_view_queries(self, alice_client):
+        """
+        Ensures that the ``SellInline`` doesn't query the ``Product`` table
+        for each sold item:
+            * create receipts with 2 sold items
+            * add more items to the receipt
+            * the change view executes the same number of queries
+        """
+        _make_receipts(1)
+        receipt = Receipt.objects.get()
+        endpoint = reverse('admin:registers_receipt_change', args=[receipt.id])
+        # warm up caches that are populated only once (e.g. content types)
+        alice_client.get(endpoint)
+        with CaptureQueriesContext(connection) as few:
+            alice_client.get(endpoint)
+        product = Product.objects.first()
+        for _ in range(5):
+            Sell.objects.create(receipt=receipt, product=product, quantity=1, price=1)
+        with CaptureQueriesContext(connection) as many:
+            alice_client.get(endpoint)
+        assert len(few) == len(many)
+
+    @pytest.mark.django_db
+    def test_adapters_status(self, alice_client, mocker, settings):
+        """
+        Ensures that the admin shows adapters with an open circuit,
+        allowing to close it:
+            * an adapter circuit is open
+            * the changelist warns about the disabled adapter
+            * the adapters status lists the open circuit
+            * the circuit is closed from the admin
+        """
+        settings.ADAPTERS_CIRCUIT_THRESHOLD = 1
+        adapter = mocker.Mock(per_device=True)
+        service = mocker.MagicMock(per_device=False)
+        settings.PUSH_ADAPTERS = [adapter, service]
+        register = mommy.make(Register, serial_port='/dev/ttyUSB0')
+        breaker = CircuitBreaker.for_adapter(adapter, register.serial_port)
+        breaker.record_failure()
+        # the changelist warns about the adapter
+        endpoint = reverse('admin:registers_adapters')
+        response = alice_client.get(reverse('admin:registers_receipt_changelist'))
+        assert endpoint in response.content.decode()
+        # the status page lists the circuit
+        response = alice_client.get(endpoint)
+        assert response.status_code == 200
+        states = {item.name: item.state for item in response.context['breakers']}
+        assert states == {
+            breaker.name: OPEN,
+            CircuitBreaker.for_adapter(adapter).name: CLOSED,
+            CircuitBreaker.for_adapter(service).name: CLOSED,
+        }
+        # close the circuit
+        response = alice_client.post(endpoint, {'reset': breaker.name}, format='multipart')
+        assert response.status_code == 302
+        assert breaker.state == CLOSED
+
+    @pytest.mark.django_db
+    def test_bulk_delete(self, alice_client):
+        """
+        Ensures that the bulk delete updates the counters of the deleted
+        receipts days:
+            * two receipts are sold on a day, one on the next day
+            * one receipt of each day is deleted from the changelist
+            * the counters include only the remaining receipt
+        """
+        product = mommy.make(Product)
+        first_day = timezone.now() - timedelta(days=2)
+        receipts = [mommy.make(Receipt, date=date) for date in (first_day, first_day, first_day + timedelta(days=1))]
+        for receipt in receipts:
+            Sell.objects.create(receipt=receipt, product=product, quantity=1, price=D('1.50'))
+            ProductSales.objects.record(receipt.date, receipt.sell_set.all())
+
+        endpoint = reverse('admin:registers_receipt_changelist')
+        data = {'action': 'delete_receipts', '_selected_action': [receipts[1].pk, receipts[2].pk]}
+        # the confirmation page
+        response = alice_client.post(endpoint, data, format='multipart')
+        assert response.status_code == 200
+        assert Receipt.objects.count() == 3
+        response = alice_client.post(endpoint, dict(data, post='yes'), format='multipart')
+        assert response.status_code == 302
+        assert list(Receipt.objects.all()) == [receipts[0]]
+        assert product.sales_on(timezone.localtime(first_day).date()).quantity == D('1')
+        assert product.sales_on(timezone.localtime(receipts[2].date).date()).quantity == D('0')
+        # the default action is replaced
+        assert 'delete_selected' not in alice_client.get(endpoint).content.decode()
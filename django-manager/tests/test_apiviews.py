@@ -1,10 +1,15 @@
 import pytest
+import msgpack
+
+from datetime import date
+from decimal import Decimal as D
 
 from model_mommy import mommy
 
 from django.core.urlresolvers import reverse
 
-from registers.models import Product, Receipt
+from registers.models import Product, ProductSales, Receipt, Register, Sell
+from registers.renderers import MessagePackRenderer
 
 
 @pytest.mark.django_db
@@ -62,6 +67,36 @@ def test_product_api_unauthorized_for_anonymous(api_client):
     assert response.status_code == 403
 
 
+@pytest.mark.django_db
+def test_product_top_sellers(alice_client):
+    """
+    Alice wants to know which products are the most sold today.
+        * Alice is a super user
+        * Alice retrieves the top sellers list
+        * products are ordered by sold quantity
+    """
+    products = mommy.make(Product, _quantity=2)
+    mommy.make(ProductSales, product=products[0], day=date(2016, 1, 1), quantity=1)
+    mommy.make(ProductSales, product=products[1], day=date(2016, 1, 1), quantity=3)
+    # get the top sellers endpoint
+    endpoint = reverse('registers:product-top-sellers')
+    response = alice_client.get(endpoint, {'day': '2016-01-01'})
+    assert response.status_code == 200
+    assert len(response.data) == 2
+    assert response.data[0]['name'] == products[1].name
+    assert response.data[0]['quantity'] == '3.000'
+
+
+@pytest.mark.django_db
+def test_product_top_sellers_invalid_params(alice_client):
+    """
+    Ensures that invalid query parameters return a 400
+    """
+    endpoint = reverse('registers:product-top-sellers')
+    response = alice_client.get(endpoint, {'limit': 'many'})
+    assert response.status_code == 400
+
+
 @pytest.mark.django_db
 def test_receipt_api_ok(alice_client):
     """
@@ -102,6 +137,56 @@ def test_receipt_api_ok(alice_client):
     assert Receipt.objects.count() == 1
     receipt = Receipt.objects.all()[0]
     assert receipt.products.count() == 3
+    # daily counters are updated
+    assert ProductSales.objects.count() == 3
+
+
+@pytest.mark.django_db
+def test_receipt_api_register_header(alice_client):
+    """
+    Alice's shop has many tills, and the application selects the
+    one that prints the receipt.
+        * Alice posts a new receipt with the register header
+        * the receipt is bound to the selected register
+    """
+    product = mommy.make(Product)
+    register = mommy.make(Register, name='Till 2')
+    sold_items = {'products': [{'id': product.id, 'price': '5.90'}]}
+    endpoint = reverse('registers:receipt-list')
+    response = alice_client.post(endpoint, data=sold_items, HTTP_X_CASH_REGISTER='Till 2')
+    assert response.status_code == 201
+    assert Receipt.objects.get().register == register
+
+
+@pytest.mark.django_db
+def test_receipt_api_register_user(alice_client, django_user_model):
+    """
+    Alice's till is bound to a register, so that its receipts are
+    always printed there.
+        * Alice is bound to a register
+        * Alice posts a new receipt without the register header
+        * the receipt is bound to Alice's register
+    """
+    product = mommy.make(Product)
+    register = mommy.make(Register, user=django_user_model.objects.get(username='alice'))
+    sold_items = {'products': [{'id': product.id, 'price': '5.90'}]}
+    endpoint = reverse('registers:receipt-list')
+    response = alice_client.post(endpoint, data=sold_items)
+    assert response.status_code == 201
+    assert Receipt.objects.get().register == register
+
+
+@pytest.mark.django_db
+def test_receipt_api_unknown_register(alice_client):
+    """
+    Ensures that a receipt for an unknown register is not created
+    """
+    product = mommy.make(Product)
+    sold_items = {'products': [{'id': product.id, 'price': '5.90'}]}
+    endpoint = reverse('registers:receipt-list')
+    response = alice_client.post(endpoint, data=sold_items, HTTP_X_CASH_REGISTER='Missing')
+    assert response.status_code == 400
+    assert Receipt.objects.count() == 0
 
 
 @pytest.mark.django_db
@@ -159,3 +244,58 @@ def test_receipt_api_unauthorized_for_anonymous(api_client):
     response = api_client.post(endpoint, data=sold_items)
     # unauthorized
     assert response.status_code == 403
+
+
+@pytest.mark.django_db
+def test_product_api_msgpack(alice_client):
+    """
+    Alice's till downloads products with MessagePack
+    """
+    mommy.make(Product, default_price=D('5.90'), _quantity=2)
+    endpoint = reverse('registers:product-list')
+    response = alice_client.get(endpoint, HTTP_ACCEPT='application/msgpack')
+    assert response.status_code == 200
+    assert response['Content-Type'] == 'application/msgpack'
+    products = msgpack.unpackb(response.content, raw=False)
+    assert products == alice_client.get(endpoint).json()
+    assert products[0]['default_price'] == '5.90'
+
+
+@pytest.mark.django_db
+def test_receipt_api_msgpack(alice_client):
+    """
+    Alice's till posts receipts with MessagePack
+    """
+    product = mommy.make(Product)
+    sold_items = {'products': [{'id': product.id, 'price': '5.90', 'quantity': '1.68'}]}
+    endpoint = reverse('registers:receipt-list')
+    response = alice_client.post(
+        endpoint,
+        data=msgpack.packb(sold_items, use_bin_type=True),
+        content_type='application/msgpack',
+        HTTP_ACCEPT='application/msgpack',
+    )
+    assert response.status_code == 201
+    assert response['Content-Type'] == 'application/msgpack'
+    sell = Sell.objects.get()
+    assert sell.price.amount == D('5.90')
+    assert sell.quantity == D('1.68')
+
+
+@pytest.mark.django_db
+def test_receipt_api_msgpack_invalid(alice_client):
+    """
+    Ensures that a malformed MessagePack body is rejected
+    """
+    endpoint = reverse('registers:receipt-list')
+    response = alice_client.post(endpoint, data=b'\xc1', content_type='application/msgpack')
+    assert response.status_code == 400
+    assert Receipt.objects.count() == 0
+
+
+def test_msgpack_renderer_decimal():
+    """
+    Ensures that ``Decimal`` values are rendered without losing precision
+    """
+    content = MessagePackRenderer().render({'price': D('0.10000000000000000001')})
+    assert msgpack.unpackb(content, raw=False) == {'price': '0.10000000000000000001'}
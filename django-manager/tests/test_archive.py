@@ -0,0 +1,158 @@
+import gzip
+import json
+import pytest
+
+from io import StringIO
+from datetime import date, datetime, timedelta
+from decimal import Decimal as D
+
+from model_mommy import mommy
+
+from django.core.management import call_command
+from django.core.urlresolvers import reverse
+from django.db import DatabaseError
+from django.utils import timezone
+
+from registers.archive import archive_receipts, read_index, scan
+from registers.models import Product, ProductSales, Receipt, Sell
+
+
+@pytest.fixture
+def archive(settings, tmpdir):
+    """
+    Stores archived segments in a temporary ``ARCHIVE_ROOT``.
+    """
+    settings.ARCHIVE_ROOT = str(tmpdir)
+    return tmpdir
+
+
+def _receipt(when, product, quantity=1):
+    receipt = mommy.make(Receipt, date=when)
+    Sell.objects.create(receipt=receipt, product=product, quantity=quantity, price=D('1.50'))
+    ProductSales.objects.record(receipt.date, receipt.sell_set.all())
+    return receipt
+
+
+def _date(year, month, day):
+    return datetime(year, month, day, 10, tzinfo=timezone.utc)
+
+
+@pytest.mark.django_db
+class TestArchive:
+    def test_archive_receipts(self, archive):
+        """
+        Ensures that old receipts are moved to one segment for each month,
+        while recent receipts and counters are kept
+        """
+        product = mommy.make(Product, name='Croissant')
+        _receipt(_date(2016, 1, 1), product)
+        _receipt(_date(2016, 1, 20), product, quantity=2)
+        _receipt(_date(2016, 3, 1), product)
+        recent = _receipt(timezone.now() - timedelta(days=1), product)
+
+        segments = archive_receipts(days=30)
+        assert [segment['name'] for segment in segments] == [
+            'receipts-2016-01.0001.ndjson.gz',
+            'receipts-2016-03.0001.ndjson.gz',
+        ]
+        assert segments[0]['receipts'] == 2
+        assert segments[0]['start'] == '2016-01-01T10:00:00+00:00'
+        assert segments[0]['end'] == '2016-01-20T10:00:00+00:00'
+        assert read_index() == segments
+        # hot tables keep only recent receipts
+        assert list(Receipt.objects.all()) == [recent]
+        assert Sell.objects.count() == 1
+        # rollups are kept
+        assert product.sales_on(date(2016, 1, 20)).quantity == D('2')
+
+        with gzip.open(str(archive.join(segments[0]['name']))) as segment:
+            records = [json.loads(line.decode()) for line in segment]
+        assert [record['date'] for record in records] == ['2016-01-01T10:00:00+00:00', '2016-01-20T10:00:00+00:00']
+        assert records[1]['items'] == [
+            {'product_id': product.pk, 'product': 'Croissant', 'price': '1.50', 'price_currency': 'EUR',
+             'quantity': '2.000'},
+        ]
+
+    def test_append_only(self, archive):
+        """
+        Ensures that a new run for an archived month writes a new segment
+        """
+        product = mommy.make(Product)
+        _receipt(_date(2016, 1, 1), product)
+        archive_receipts(days=30)
+        _receipt(_date(2016, 1, 2), product)
+        assert archive_receipts(days=30)[0]['name'] == 'receipts-2016-01.0002.ndjson.gz'
+        assert len(read_index()) == 2
+        assert len(list(scan())) == 2
+
+    def test_interrupted_delete(self, archive, mocker):
+        """
+        Ensures that receipts are not archived twice when the deletion of
+        archived rows fails: the next run deletes them instead
+        """
+        product = mommy.make(Product)
+        _receipt(_date(2016, 1, 1), product)
+        _receipt(_date(2016, 1, 2), product)
+        mocker.patch('registers.archive._delete_rows', side_effect=DatabaseError)
+        with pytest.raises(DatabaseError):
+            archive_receipts(days=30)
+        assert read_index()[0]['pending'] is True
+        assert Receipt.objects.count() == 2
+
+        mocker.stopall()
+        assert archive_receipts(days=30) == []
+        assert len(read_index()) == 1
+        assert 'pending' not in read_index()[0]
+        assert Receipt.objects.count() == 0
+        assert Sell.objects.count() == 0
+        assert len(list(scan())) == 2
+
+    def test_nothing_to_archive(self, archive):
+        """
+        Ensures that no segments are written without old receipts
+        """
+        _receipt(timezone.now(), mommy.make(Product))
+        assert archive_receipts(days=30) == []
+        assert read_index() == []
+
+    def test_scan(self, archive, mocker):
+        """
+        Ensures that only segments of the requested dates are read
+        """
+        product = mommy.make(Product)
+        for month in (1, 2, 3):
+            _receipt(_date(2016, month, 10), product)
+        archive_receipts(days=30)
+
+        open_segment = mocker.spy(gzip, 'open')
+        receipts = list(scan(_date(2016, 2, 1), _date(2016, 3, 1)))
+        assert [receipt['date'] for receipt in receipts] == ['2016-02-10T10:00:00+00:00']
+        assert open_segment.call_count == 1
+
+    def test_command(self, archive):
+        """
+        Ensures that the command reports the archived receipts
+        """
+        _receipt(_date(2016, 1, 1), mommy.make(Product))
+        out = StringIO()
+        call_command('archive_receipts', days=30, stdout=out)
+        assert out.getvalue().endswith('archived 1 receipts\n')
+
+    def test_archived_api(self, archive, alice_client):
+        """
+        Ensures that archived receipts are streamed as NDJSON
+        """
+        product = mommy.make(Product)
+        _receipt(_date(2016, 1, 10), product)
+        _receipt(_date(2016, 2, 10), product)
+        archive_receipts(days=30)
+
+        endpoint = reverse('registers:receipt-archived')
+        response = alice_client.get(endpoint, {'start': '2016-02-01'})
+        assert response.status_code == 200
+        assert response['Content-Type'] == 'application/x-ndjson'
+        lines = b''.join(response.streaming_content).splitlines()
+        assert [json.loads(line.decode())['date'] for line in lines] == ['2016-02-10T10:00:00+00:00']
+        assert alice_client.get(endpoint, {'start': '2016-13-01'}).status_code == 400
+        assert alice_client.get(endpoint, {'start': 'abc'}).status_code == 400
+        assert alice_client.get(endpoint, {'end': '2016-02'}).status_code == 400
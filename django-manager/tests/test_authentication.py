@@ -0,0 +1,104 @@
+import pytest
+
+from model_mommy import mommy
+
+from django.db import connection
+from django.core.cache import cache
+from django.core.urlresolvers import reverse
+from django.test.utils import CaptureQueriesContext
+
+from registers.models import Product, Receipt, Register, TillToken
+from registers.authentication import GENERATION_KEY, revoke_tokens
+
+
+@pytest.fixture
+def till_token(django_user_model):
+    """
+    Returns the ``TillToken`` of a till device bound to ``Till 2``
+    """
+    user = django_user_model.objects.create_user(username='till', password='123456', is_staff=True)
+    register = mommy.make(Register, name='Till 2')
+    return TillToken.objects.create(user=user, register=register)
+
+
+@pytest.mark.django_db
+class TestTillTokenAuthentication:
+    def teardown_method(self, method):
+        revoke_tokens()
+
+    def test_create_receipt(self, api_client, till_token):
+        """
+        Ensures that a till device creates receipts with its token,
+        printing them on the token register
+        """
+        product = mommy.make(Product)
+        sold_items = {'products': [{'id': product.id, 'price': '5.90'}]}
+        api_client.credentials(HTTP_AUTHORIZATION='Token {}'.format(till_token.key))
+        response = api_client.post(reverse('registers:receipt-list'), data=sold_items)
+        assert response.status_code == 201
+        assert Receipt.objects.get().register == till_token.register
+
+    def test_cached_token(self, api_client, till_token):
+        """
+        Ensures that the token is resolved once, so that following
+        requests don't query users and sessions
+        """
+        mommy.make(Product)
+        api_client.credentials(HTTP_AUTHORIZATION='Token {}'.format(till_token.key))
+        endpoint = reverse('registers:product-list')
+        with CaptureQueriesContext(connection) as queries:
+            assert api_client.get(endpoint).status_code == 200
+        assert len(queries) == 2
+        with CaptureQueriesContext(connection) as queries:
+            assert api_client.get(endpoint).status_code == 200
+        # only products are loaded
+        assert len(queries) == 1
+
+    def test_invalid_token(self, api_client, till_token):
+        """
+        Ensures that unknown keys and malformed headers are rejected
+        """
+        endpoint = reverse('registers:product-list')
+        api_client.credentials(HTTP_AUTHORIZATION='Token unknown')
+        assert api_client.get(endpoint).status_code == 403
+        api_client.credentials(HTTP_AUTHORIZATION='Token {} extra'.format(till_token.key))
+        assert api_client.get(endpoint).status_code == 403
+
+    def test_revoked_token(self, api_client, till_token):
+        """
+        Ensures that a revoked token cannot be used, even if it's cached
+        """
+        endpoint = reverse('registers:product-list')
+        api_client.credentials(HTTP_AUTHORIZATION='Token {}'.format(till_token.key))
+        assert api_client.get(endpoint).status_code == 200
+        till_token.revoked = True
+        till_token.save()
+        assert api_client.get(endpoint).status_code == 403
+
+    def test_revoked_by_another_worker(self, api_client, till_token, mocker):
+        """
+        Ensures that tokens cached by a worker are forgotten when
+        another worker revokes a token
+        """
+        endpoint = reverse('registers:product-list')
+        api_client.credentials(HTTP_AUTHORIZATION='Token {}'.format(till_token.key))
+        assert api_client.get(endpoint).status_code == 200
+        # the token is revoked by another worker
+        TillToken.objects.filter(pk=till_token.pk).update(revoked=True)
+        cache.set(GENERATION_KEY, 'another-worker')
+        assert api_client.get(endpoint).status_code == 403
+
+    def test_inactive_user(self, api_client, till_token):
+        """
+        Ensures that tokens of disabled users cannot be used
+        """
+        till_token.user.is_active = False
+        till_token.user.save()
+        api_client.credentials(HTTP_AUTHORIZATION='Token {}'.format(till_token.key))
+        assert api_client.get(reverse('registers:product-list')).status_code == 403
+
+    def test_session_authentication(self, alice_client):
+        """
+        Ensures that the admin session can still be used
+        """
+        assert alice_client.get(reverse('registers:product-list')).status_code == 200
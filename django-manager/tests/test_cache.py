@@ -0,0 +1,164 @@
+import time
+import pytest
+import multiprocessing
+
+from django.core.cache import cache
+from django.core.cache.backends.base import InvalidCacheBackendError
+
+from manager import cache as backends
+from manager.cache import UWSGICache
+
+from registers.adapters.breakers import CircuitBreaker
+
+
+class FakeUWSGI:
+    """
+    In-memory implementation of the uWSGI caching API
+    """
+    def __init__(self):
+        self.caches = {'default': {}}
+        self.locked = 0
+
+    def cache_get(self, key, name):
+        return self.caches[name].get(key, (None, 0))[0]
+
+    def cache_set(self, key, value, expires, name):
+        if key in self.caches[name]:
+            return None
+        self.caches[name][key] = (value, expires)
+        return True
+
+    def cache_update(self, key, value, expires, name):
+        self.caches[name][key] = (value, expires)
+        return True
+
+    def cache_del(self, key, name):
+        self.caches[name].pop(key, None)
+
+    def cache_exists(self, key, name):
+        return key in self.caches[name]
+
+    def cache_clear(self, name):
+        self.caches[name].clear()
+
+    def lock(self):
+        self.locked += 1
+
+    def unlock(self):
+        self.locked -= 1
+
+
+class TestUWSGICache:
+    def setup_method(self, method):
+        self.uwsgi = FakeUWSGI()
+
+    @pytest.fixture
+    def uwsgi_cache(self, monkeypatch):
+        monkeypatch.setattr(backends, 'uwsgi', self.uwsgi)
+        return UWSGICache('default', {'TIMEOUT': 60})
+
+    def test_requires_uwsgi(self, monkeypatch):
+        """
+        Ensures that the backend cannot be used outside uWSGI
+        """
+        monkeypatch.setattr(backends, 'uwsgi', None)
+        with pytest.raises(InvalidCacheBackendError):
+            UWSGICache('default', {})
+
+    def test_set_get(self, uwsgi_cache):
+        """
+        Ensures that pickled values are stored with their expiration
+        """
+        uwsgi_cache.set('circuit', {'failures': 1})
+        uwsgi_cache.set('forever', 1, timeout=None)
+        assert uwsgi_cache.get('circuit') == {'failures': 1}
+        assert uwsgi_cache.get('missing', 'default') == 'default'
+        assert self.uwsgi.caches['default'][':1:circuit'][1] == 60
+        assert self.uwsgi.caches['default'][':1:forever'][1] == 0
+        uwsgi_cache.set('circuit', 1, timeout=0)
+        assert 'circuit' not in uwsgi_cache
+
+    def test_add(self, uwsgi_cache):
+        """
+        Ensures that existing items are not replaced
+        """
+        assert uwsgi_cache.add('probe', 1, timeout=0.5) is True
+        assert uwsgi_cache.add('probe', 2) is False
+        assert uwsgi_cache.get('probe') == 1
+        assert self.uwsgi.caches['default'][':1:probe'][1] == 1
+
+    def test_expiration(self, uwsgi_cache, mocker):
+        """
+        Ensures that expired items are ignored before the uWSGI
+        sweeper removes them
+        """
+        uwsgi_cache.set('circuit', 1, timeout=1)
+        uwsgi_cache.add('probe', 1, timeout=1)
+        mocker.patch('manager.cache.time.time', return_value=time.time() + 2)
+        assert uwsgi_cache.get('circuit') is None
+        assert 'circuit' not in uwsgi_cache
+        assert uwsgi_cache.add('probe', 2) is True
+        assert uwsgi_cache.get('probe') == 2
+
+    def test_incr(self, uwsgi_cache):
+        """
+        Ensures that counters are updated while holding the uWSGI lock
+        """
+        uwsgi_cache.add('depth', 0)
+        assert uwsgi_cache.incr('depth') == 1
+        assert uwsgi_cache.decr('depth', 2) == -1
+        assert self.uwsgi.locked == 0
+        with pytest.raises(ValueError):
+            uwsgi_cache.incr('missing')
+        assert self.uwsgi.locked == 0
+
+    def test_incr_expiration(self, uwsgi_cache, mocker):
+        """
+        Ensures that counters keep their expiration time when updated
+        """
+        uwsgi_cache.add('failures', 0, timeout=None)
+        uwsgi_cache.add('depth', 0, timeout=600)
+        assert uwsgi_cache.incr('failures') == 1
+        assert uwsgi_cache.incr('depth') == 1
+        assert self.uwsgi.caches['default'][':1:failures'][1] == 0
+        assert self.uwsgi.caches['default'][':1:depth'][1] > 60
+        # the default timeout doesn't replace the expiration time
+        mocker.patch('manager.cache.time.time', return_value=time.time() + 120)
+        assert uwsgi_cache.get('failures') == 1
+        assert uwsgi_cache.get('depth') == 1
+        mocker.patch('manager.cache.time.time', return_value=time.time() + 700)
+        assert uwsgi_cache.get('failures') == 1
+        assert uwsgi_cache.get('depth') is None
+        with pytest.raises(ValueError):
+            uwsgi_cache.incr('depth')
+
+    def test_delete_clear(self, uwsgi_cache):
+        """
+        Ensures that items are removed from the uWSGI cache
+        """
+        uwsgi_cache.set_many({'a': 1, 'b': 2})
+        uwsgi_cache.delete('a')
+        assert uwsgi_cache.get_many(['a', 'b']) == {'b': 2}
+        uwsgi_cache.clear()
+        assert uwsgi_cache.get('b') is None
+
+
+def test_file_cache_shared_by_processes(settings, tmpdir):
+    """
+    Ensures that a circuit breaker opened by a worker is open for the
+    other workers when a file cache is used
+    """
+    settings.CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': str(tmpdir),
+        }
+    }
+    settings.ADAPTERS_CIRCUIT_THRESHOLD = 1
+    breaker = CircuitBreaker('test.shared')
+    worker = multiprocessing.Process(target=breaker.record_failure)
+    worker.start()
+    worker.join()
+    assert worker.exitcode == 0
+    assert breaker.failures == 1
+    cache.clear()
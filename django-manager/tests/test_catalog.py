@@ -0,0 +1,124 @@
+import json
+import pytest
+
+from django.contrib import admin
+from django.conf.urls import url, include
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from model_mommy import mommy
+
+from registers.catalog import get_catalog, get_version
+from registers.models import Product
+
+
+urlpatterns = [
+    url(r'^admin/', admin.site.urls),
+    url(r'^', include('pos.urls')),
+]
+
+
+@pytest.fixture
+def pos(settings):
+    """
+    Installs the POS application, that is disabled by default.
+    """
+    settings.INSTALLED_APPS = settings.INSTALLED_APPS + ('pos',)
+    settings.ROOT_URLCONF = __name__
+
+
+class TestCatalog:
+    @pytest.mark.django_db
+    def test_catalog(self):
+        """
+        The catalog includes all products, and it's rendered once
+        for each version
+        """
+        mommy.make(Product, name='Croissant', default_price='5.90')
+        version, catalog = get_catalog()
+        assert [product['name'] for product in json.loads(catalog)] == ['Croissant']
+        with CaptureQueriesContext(connection) as queries:
+            assert get_catalog() == (version, catalog)
+        assert len(queries) == 0
+
+    @pytest.mark.django_db(transaction=True)
+    def test_catalog_invalidation(self):
+        """
+        Changed and deleted products change the catalog version
+        """
+        product = mommy.make(Product, name='Croissant')
+        version = get_version()
+        product.name = 'Brioche'
+        product.save()
+        new_version, catalog = get_catalog()
+        assert new_version != version
+        assert json.loads(catalog)[0]['name'] == 'Brioche'
+        product.delete()
+        assert get_catalog()[1] == '[]'
+
+    @pytest.mark.django_db(transaction=True)
+    def test_catalog_invalidation_on_commit(self):
+        """
+        The version changes when the transaction is committed, so that other
+        workers can't cache the previous catalog under the new version
+        """
+        version = get_version()
+        with transaction.atomic():
+            mommy.make(Product, name='Croissant')
+            assert get_version() == version
+        assert get_version() != version
+        with pytest.raises(ValueError):
+            with transaction.atomic():
+                mommy.make(Product, name='Brioche')
+                raise ValueError
+        assert json.loads(get_catalog()[1])[0]['name'] == 'Croissant'
+
+    @pytest.mark.django_db
+    def test_catalog_script_escape(self):
+        """
+        The catalog can be included in a <script> element
+        """
+        mommy.make(Product, name='</script><script>alert("&")')
+        version, catalog = get_catalog()
+        assert '<' not in catalog and '>' not in catalog and '&' not in catalog
+        assert json.loads(catalog)[0]['name'] == '</script><script>alert("&")'
+
+
+class TestPOS:
+    def test_pos_staff_only(self, pos, bob_client):
+        """
+        The POS page includes the catalog, so it's available only
+        to staff users
+        """
+        response = bob_client.get('/')
+        assert response.status_code == 302
+
+    def test_pos_catalog(self, pos, transactional_db, alice_client):
+        """
+        The POS page includes the catalog and it's rendered once for
+        each catalog version
+        """
+        mommy.make(Product, name='Croissant')
+        response = alice_client.get('/')
+        assert response.status_code == 200
+        assert b'<script id="catalog" type="application/json">[{"id":' in response.content
+        assert b'Croissant' in response.content
+        assert response['Cache-Control'] == 'private, no-cache'
+        # the cached page is used
+        with CaptureQueriesContext(connection) as queries:
+            cached = alice_client.get('/')
+        assert cached.content == response.content
+        assert not [query for query in queries if 'registers_product' in query['sql']]
+        # a new product changes the page
+        mommy.make(Product, name='Brioche')
+        assert b'Brioche' in alice_client.get('/').content
+
+    def test_pos_etag(self, pos, transactional_db, alice_client):
+        """
+        Browsers revalidate the page with its ETag, that changes with
+        the catalog version
+        """
+        etag = alice_client.get('/')['ETag']
+        assert alice_client.get('/', HTTP_IF_NONE_MATCH=etag).status_code == 304
+        mommy.make(Product)
+        assert alice_client.get('/', HTTP_IF_NONE_MATCH=etag).status_code == 200
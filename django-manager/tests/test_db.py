@@ -0,0 +1,176 @@
+import pytest
+
+from io import StringIO
+
+from model_mommy import mommy
+
+from django.db import connection, connections, transaction
+from django.core.management import call_command
+from django.core.urlresolvers import reverse
+from django.test.utils import CaptureQueriesContext
+
+from registers.db import ReplicaRouter, check_connections, iterate, use_replica
+from registers.models import Product, Receipt
+
+
+class TestCheckConnections:
+    def _connection(self, mocker, conn_max_age=60, usable=True):
+        conn = mocker.Mock(settings_dict={'CONN_MAX_AGE': conn_max_age}, in_atomic_block=False)
+        conn.is_usable.return_value = usable
+        mocker.patch('registers.db.connections').all.return_value = [conn]
+        return conn
+
+    def test_close_unusable_connection(self, mocker):
+        """
+        Ensures that a persistent connection closed by the server is
+        closed before the request uses it
+        """
+        conn = self._connection(mocker, usable=False)
+        check_connections()
+        assert conn.close.call_count == 1
+
+    def test_keep_usable_connection(self, mocker):
+        """
+        Ensures that usable connections are reused
+        """
+        conn = self._connection(mocker)
+        check_connections()
+        assert conn.is_usable.call_count == 1
+        assert conn.close.call_count == 0
+
+    def test_skip_not_persistent_connection(self, mocker):
+        """
+        Ensures that connections closed at the end of each request
+        are not checked
+        """
+        conn = self._connection(mocker, conn_max_age=0)
+        check_connections()
+        assert conn.is_usable.call_count == 0
+
+    def test_health_checks_disabled(self, mocker, settings):
+        """
+        Ensures that connections are not checked if health checks are disabled
+        """
+        settings.DATABASES_HEALTH_CHECKS = False
+        conn = self._connection(mocker, usable=False)
+        check_connections()
+        assert conn.is_usable.call_count == 0
+
+
+@pytest.mark.django_db
+class TestIterate:
+    def test_iterator(self, settings):
+        """
+        Ensures that all models are returned with a single query
+        """
+        settings.DATABASES_PGBOUNCER = False
+        products = mommy.make(Product, _quantity=5)
+        with CaptureQueriesContext(connection) as queries:
+            assert sorted(p.pk for p in iterate(Product.objects.all())) == [p.pk for p in products]
+        assert len(queries) == 1
+
+    def test_chunks_with_pgbouncer(self, settings):
+        """
+        Ensures that models are read in chunks when server-side cursors
+        are not available
+        """
+        settings.DATABASES_PGBOUNCER = True
+        products = mommy.make(Product, _quantity=5)
+        with CaptureQueriesContext(connection) as queries:
+            assert [p.pk for p in iterate(Product.objects.all(), chunk_size=2)] == [p.pk for p in products]
+        # 3 chunks and the last empty one
+        assert len(queries) == 4
+
+
+@pytest.fixture
+def replica(settings, transactional_db):
+    """
+    Enables the ``replica`` test database, that is a second SQLite
+    database. Its tables are emptied after the test.
+    """
+    settings.DATABASES_REPLICA = 'replica'
+    yield connections['replica']
+    for model in (Receipt, Product):
+        model.objects.using('replica').all().delete()
+
+
+class TestReplicaRouter:
+    def test_read_only_scope(self, settings):
+        """
+        Ensures that only reads of a read-only scope use the replica
+        """
+        settings.DATABASES_REPLICA = 'replica'
+        router = ReplicaRouter()
+        assert router.db_for_read(Product) is None
+        with use_replica():
+            with use_replica():
+                assert router.db_for_read(Product) == 'replica'
+            assert router.db_for_read(Product) == 'replica'
+            assert router.db_for_write(Product) == 'default'
+        assert router.db_for_read(Product) is None
+
+    def test_replica_not_configured(self, settings):
+        """
+        Ensures that the default database is used without a replica
+        """
+        settings.DATABASES_REPLICA = None
+        with use_replica():
+            assert ReplicaRouter().db_for_read(Product) is None
+
+    def test_read_after_write(self, replica):
+        """
+        Ensures that reads that follow a write, or that are in a
+        transaction, use the default database
+        """
+        with use_replica():
+            Product.objects.create(name='Croissant')
+            assert Product.objects.count() == 1
+        with use_replica():
+            with transaction.atomic():
+                assert Product.objects.count() == 1
+            assert Product.objects.count() == 0
+
+    def test_products_list(self, replica, alice_client):
+        """
+        Ensures that the products list is read from the replica
+        """
+        mommy.make(Product, name='Primary')
+        Product.objects.using('replica').create(name='Replica')
+        response = alice_client.get(reverse('registers:product-list'))
+        assert [product['name'] for product in response.json()] == ['Replica']
+
+    def test_admin_changelist(self, replica, alice_client):
+        """
+        Ensures that admin changelists are read from the replica
+        """
+        mommy.make(Product, name='Primary')
+        Product.objects.using('replica').create(name='Replica')
+        response = alice_client.get(reverse('admin:registers_product_changelist'))
+        assert b'Replica' in response.content
+        assert b'Primary' not in response.content
+
+    def test_receipt_create(self, replica, alice_client):
+        """
+        Ensures that receipts are created reading products from
+        the default database
+        """
+        product = mommy.make(Product)
+        data = {'products': [{'id': product.id, 'price': '5.90'}]}
+        response = alice_client.post(reverse('registers:receipt-list'), data=data)
+        assert response.status_code == 201
+        assert Receipt.objects.count() == 1
+
+
+@pytest.mark.django_db
+def test_benchmark_connections_command():
+    """
+    Ensures that the benchmark reports each CONN_MAX_AGE value and
+    restores the database settings.
+    """
+    conn_max_age = connection.settings_dict['CONN_MAX_AGE']
+    out = StringIO()
+    call_command('benchmark_connections', requests=3, conn_max_age=[0, 60], stdout=out)
+    output = out.getvalue()
+    assert 'CONN_MAX_AGE=0: 3 requests' in output
+    assert 'CONN_MAX_AGE=60: 3 requests' in output
+    assert connection.settings_dict['CONN_MAX_AGE'] == conn_max_age
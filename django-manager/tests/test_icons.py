@@ -0,0 +1,168 @@
+import pytest
+
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+
+from model_mommy import mommy
+from PIL import Image
+
+from registers.icons import generate_variants, schedule_variants, variant_names
+from registers.models import Product
+from registers.serializers import ProductSerializer
+
+
+@pytest.fixture
+def media(settings, tmpdir):
+    """
+    Stores uploaded files in a temporary ``MEDIA_ROOT``.
+    """
+    settings.MEDIA_ROOT = str(tmpdir)
+    settings.ICONS_SIZES = (64, 128)
+    return tmpdir
+
+
+def icon(name='croissant.png', size=(300, 200)):
+    """
+    Returns the content of a PNG icon.
+    """
+    memory_fp = BytesIO()
+    Image.new('RGB', size, 'orange').save(memory_fp, format='PNG')
+    return ContentFile(memory_fp.getvalue(), name=name)
+
+
+class TestIcons:
+    @pytest.mark.django_db
+    def test_generate_variants(self, media):
+        """
+        Variants are stored alongside the original, in all sizes and
+        formats, and the icon hash is saved in the ``Product``
+        """
+        product = mommy.make(Product, icon=icon())
+        names = generate_variants(product)
+        product.refresh_from_db()
+        assert len(product.icon_hash) == 12
+        assert names == variant_names(product.icon.name, product.icon_hash)
+        for size, formats in names.items():
+            assert set(formats) == {'webp', 'png'}
+            for name in formats.values():
+                with default_storage.open(name) as variant:
+                    image = Image.open(variant)
+                    # the aspect ratio is preserved
+                    assert image.size == (size, size * 2 // 3)
+
+    @pytest.mark.django_db
+    def test_generate_variants_existing(self, media):
+        """
+        Existing variants are not generated again, unless forced
+        """
+        product = mommy.make(Product, icon=icon())
+        name = generate_variants(product)[64]['png']
+        modified = default_storage.get_modified_time(name)
+        default_storage.delete(generate_variants(product)[128]['webp'])
+        names = generate_variants(product)
+        assert default_storage.get_modified_time(name) == modified
+        assert default_storage.exists(names[128]['webp'])
+        generate_variants(product, force=True)
+        assert default_storage.exists(name)
+
+    @pytest.mark.django_db(transaction=True)
+    def test_schedule_variants(self, media, settings):
+        """
+        Variants are generated by the worker pool, that reads
+        committed products
+        """
+        settings.ICONS_WORKERS = 1
+        product = mommy.make(Product, icon=icon())
+        schedule_variants(product.pk).result(timeout=10)
+        product.refresh_from_db()
+        assert product.icon_hash != ''
+
+    @pytest.mark.django_db
+    def test_schedule_invalid_icon(self, media, settings):
+        """
+        Invalid icons are logged, without raising errors
+        """
+        settings.ICONS_WORKERS = 0
+        product = mommy.make(Product, icon=ContentFile(b'not an image', name='broken.png'))
+        schedule_variants(product.pk)
+        product.refresh_from_db()
+        assert product.icon_hash == ''
+
+    @pytest.mark.django_db(transaction=True)
+    def test_generate_on_save(self, media, settings):
+        """
+        Variants are generated when the icon is uploaded
+        """
+        settings.ICONS_WORKERS = 0
+        product = mommy.make(Product, icon=icon())
+        product.refresh_from_db()
+        assert product.icon_hash != ''
+        # other fields don't change the icon
+        product.icon_hash = ''
+        product.save(update_fields=['name', 'icon_hash'])
+        product.refresh_from_db()
+        assert product.icon_hash == ''
+
+    @pytest.mark.django_db
+    def test_replace_icon(self, media):
+        """
+        Replacing the icon clears the hash, so the variants of the previous
+        icon are not used until the new ones are generated
+        """
+        product = mommy.make(Product, icon=icon())
+        generate_variants(product)
+        # the product is saved again without changing the icon
+        product.save()
+        assert product.icon_hash != ''
+        product.icon = icon('muffin.png')
+        product.save()
+        product.refresh_from_db()
+        assert product.icon.name == 'muffin.png'
+        assert product.icon_hash == ''
+        assert ProductSerializer(product).data['icons'] is None
+        generate_variants(product)
+        assert ProductSerializer(product).data['icons']['64']['png'].startswith('/media/icons/muffin-64.')
+
+    @pytest.mark.django_db(transaction=True)
+    def test_replace_invalid_icon(self, media, settings):
+        """
+        Replacing the icon with a file that is not an image clears the hash
+        """
+        settings.ICONS_WORKERS = 0
+        product = mommy.make(Product, icon=icon())
+        product.refresh_from_db()
+        assert product.icon_hash != ''
+        product.icon = ContentFile(b'not an image', name='broken.png')
+        product.save(update_fields=['icon'])
+        product.refresh_from_db()
+        assert product.icon_hash == ''
+        assert ProductSerializer(product).data['icons'] is None
+
+    @pytest.mark.django_db
+    def test_serializer_urls(self, media, rf):
+        """
+        The serializer includes the variants URLs, once generated
+        """
+        product = mommy.make(Product, icon=icon())
+        assert ProductSerializer(product).data['icons'] is None
+        generate_variants(product)
+        serializer = ProductSerializer(product, context={'request': rf.get('/')})
+        icons = serializer.data['icons']
+        assert set(icons) == {'64', '128'}
+        assert icons['64']['webp'] == 'http://testserver/media/icons/croissant-64.{}.webp'.format(product.icon_hash)
+        assert 'icon_hash' not in serializer.data
+
+    @pytest.mark.django_db(transaction=True)
+    def test_regenerate_command(self, media):
+        """
+        The command generates icons of all products
+        """
+        products = [mommy.make(Product, icon=icon()) for _ in range(3)]
+        mommy.make(Product, icon=None)
+        call_command('regenerate_icons', workers=2, force=True)
+        for product in products:
+            product.refresh_from_db()
+            assert product.icon_hash != ''
@@ -0,0 +1,228 @@
+import json
+import pytest
+
+from io import BytesIO, StringIO
+from decimal import Decimal as D
+
+from model_mommy import mommy
+from PIL import Image
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.core.urlresolvers import reverse
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from rest_framework.exceptions import ValidationError
+
+from registers import imports
+from registers.catalog import get_version
+from registers.imports import import_products, parse_products
+from registers.models import Product
+
+
+@pytest.fixture
+def media(settings, tmpdir):
+    """
+    Stores uploaded files in a temporary ``MEDIA_ROOT``.
+    """
+    settings.MEDIA_ROOT = str(tmpdir.mkdir('media'))
+    settings.ICONS_SIZES = (64,)
+    return tmpdir
+
+
+def icon_content(color='orange'):
+    memory_fp = BytesIO()
+    Image.new('RGB', (100, 100), color).save(memory_fp, format='PNG')
+    return memory_fp.getvalue()
+
+
+def opener(content):
+    return lambda: BytesIO(content)
+
+
+@pytest.mark.django_db
+class TestImportProducts:
+    def test_create_and_update(self):
+        """
+        Ensures that products are created or updated by name
+        """
+        mommy.make(Product, name='Croissant', default_price=D('1.00'))
+        counts = import_products([
+            {'name': 'Croissant', 'default_price': '1.20'},
+            {'name': 'Cappuccino', 'default_price': '1.50', 'default_price_currency': 'EUR'},
+        ])
+        assert counts == {'created': 1, 'updated': 1, 'unchanged': 0}
+        prices = {product.name: product.default_price.amount for product in Product.objects.all()}
+        assert prices == {'Croissant': D('1.20'), 'Cappuccino': D('1.50')}
+
+    def test_unchanged(self, mocker):
+        """
+        Ensures that products with the same values are not updated, and
+        that the catalog is not invalidated without changes
+        """
+        mommy.make(Product, name='Croissant', default_price=D('1.20'))
+        invalidate = mocker.spy(imports, 'invalidate_catalog')
+        counts = import_products([{'name': 'Croissant', 'default_price': '1.20'}])
+        assert counts == {'created': 0, 'updated': 0, 'unchanged': 1}
+        assert invalidate.call_count == 0
+
+    def test_catalog_version(self, mocker):
+        """
+        Ensures that the catalog version changes once for the whole import
+        """
+        version = get_version()
+        invalidate = mocker.spy(imports, 'invalidate_catalog')
+        import_products([{'name': 'Product {}'.format(i), 'default_price': '1.00'} for i in range(10)])
+        assert invalidate.call_count == 1
+        assert get_version() != version
+
+    def test_validation_errors(self):
+        """
+        Ensures that all rows are validated before any change, and errors
+        are reported by row number
+        """
+        with pytest.raises(ValidationError) as e:
+            import_products([
+                {'name': 'Croissant', 'default_price': '1.20'},
+                {'name': 'Cappuccino', 'default_price': 'free'},
+                {'name': 'Tea', 'default_price': '1.00', 'default_price_currency': 'XXX'},
+            ])
+        assert set(e.value.detail['rows']) == {2, 3}
+        assert 'default_price' in e.value.detail['rows'][2]
+        assert 'default_price_currency' in e.value.detail['rows'][3]
+        assert Product.objects.count() == 0
+
+    def test_duplicates(self):
+        """
+        Ensures that a product can't be imported twice
+        """
+        with pytest.raises(ValidationError) as e:
+            import_products([
+                {'name': 'Croissant', 'default_price': '1.20'},
+                {'name': 'Croissant', 'default_price': '1.30'},
+            ])
+        assert 'Croissant' in str(e.value.detail['name'][0])
+
+    def test_queries(self):
+        """
+        Ensures that the number of queries doesn't grow with the products
+        """
+        mommy.make(Product, name='Product 0', default_price=D('1.00'))
+        rows = [{'name': 'Product {}'.format(i), 'default_price': '2.00'} for i in range(50)]
+        with CaptureQueriesContext(connection) as queries:
+            counts = import_products(rows, chunk_size=100)
+        assert counts == {'created': 49, 'updated': 1, 'unchanged': 0}
+        # the ``SELECT``, the ``INSERT``, the ``UPDATE`` and the savepoint
+        assert len(queries) <= 5
+        assert Product.objects.filter(default_price=D('2.00')).count() == 50
+
+    def test_icons(self, media):
+        """
+        Ensures that icons are stored with their variants, and that
+        importing the same icon again doesn't change the product
+        """
+        rows = [
+            {'name': 'Croissant', 'default_price': '1.20', 'icon': 'croissant.png'},
+            {'name': 'Cappuccino', 'default_price': '1.50', 'icon': 'cappuccino.png'},
+        ]
+        icons = {
+            'croissant.png': opener(icon_content('orange')),
+            'cappuccino.png': opener(icon_content('brown')),
+        }
+        assert import_products(rows, icons)['created'] == 2
+        croissant = Product.objects.get(name='Croissant')
+        assert croissant.icon.name == 'croissant.png'
+        assert len(croissant.icon_hash) == 12
+        assert media.join('media', 'icons', 'croissant-64.{}.webp'.format(croissant.icon_hash)).check()
+        assert import_products(rows, icons)['unchanged'] == 2
+
+    def test_icons_errors(self, media):
+        """
+        Ensures that missing and invalid icons are reported
+        """
+        rows = [{'name': 'Croissant', 'default_price': '1.20', 'icon': 'croissant.png'}]
+        with pytest.raises(ValidationError):
+            import_products(rows)
+        with pytest.raises(ValidationError):
+            import_products(rows, {'croissant.png': opener(b'not an image')})
+        assert not media.join('media', 'croissant.png').check()
+        assert Product.objects.count() == 0
+
+
+class TestParseProducts:
+    def test_csv(self):
+        fp = BytesIO('﻿name,default_price\nCroissant,1.20\n'.encode())
+        assert parse_products(fp, 'csv') == [{'name': 'Croissant', 'default_price': '1.20'}]
+        # the given file is not closed
+        assert not fp.closed
+
+    def test_json(self):
+        fp = BytesIO(b'[{"name": "Croissant", "default_price": "1.20"}]')
+        assert parse_products(fp, 'json') == [{'name': 'Croissant', 'default_price': '1.20'}]
+
+    def test_invalid(self):
+        with pytest.raises(ValidationError):
+            parse_products(BytesIO(b'[{"name": '), 'json')
+
+
+@pytest.mark.django_db
+class TestImportAPI:
+    def test_json(self, alice_client):
+        """
+        Ensures that products are imported from a JSON list
+        """
+        endpoint = reverse('registers:product-import')
+        response = alice_client.post(
+            endpoint, json.dumps([{'name': 'Croissant', 'default_price': '1.20'}]), content_type='application/json',
+        )
+        assert response.status_code == 200
+        assert response.data == {'created': 1, 'updated': 0, 'unchanged': 0}
+
+    def test_upload(self, alice_client, media):
+        """
+        Ensures that products are imported from an uploaded file with icons
+        """
+        endpoint = reverse('registers:product-import')
+        response = alice_client.post(endpoint, {
+            'file': SimpleUploadedFile('products.csv', b'name,default_price,icon\nCroissant,1.20,croissant.png\n'),
+            'icons': [SimpleUploadedFile('croissant.png', icon_content())],
+        }, format='multipart')
+        assert response.status_code == 200
+        assert Product.objects.get(name='Croissant').icon_hash
+
+    def test_errors(self, alice_client):
+        endpoint = reverse('registers:product-import')
+        response = alice_client.post(endpoint, {'file': SimpleUploadedFile('products.xls', b'')}, format='multipart')
+        assert response.status_code == 400
+        response = alice_client.post(
+            endpoint, json.dumps([{'name': 'Croissant'}]), content_type='application/json',
+        )
+        assert response.status_code == 400
+        assert 'default_price' in response.json()['rows']['1']
+
+    def test_permissions(self, api_client):
+        endpoint = reverse('registers:product-import')
+        assert api_client.post(endpoint, [], format='json').status_code == 403
+
+
+@pytest.mark.django_db
+class TestImportCommand:
+    def test_command(self, media):
+        """
+        Ensures that icons are read from the products file directory
+        """
+        media.join('croissant.png').write_binary(icon_content())
+        products = media.join('products.json')
+        products.write(json.dumps([{'name': 'Croissant', 'default_price': '1.20', 'icon': 'croissant.png'}]))
+        out = StringIO()
+        call_command('import_products', str(products), stdout=out)
+        assert out.getvalue().startswith('created 1, updated 0, unchanged 0 products')
+        assert Product.objects.get(name='Croissant').icon.name == 'croissant.png'
+
+    def test_command_errors(self, media):
+        products = media.join('products.csv')
+        products.write('name,default_price\nCroissant,free\n')
+        with pytest.raises(CommandError):
+            call_command('import_products', str(products))
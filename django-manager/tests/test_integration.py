@@ -11,7 +11,7 @@ from django.core.urlresolvers import reverse
 
 from registers.models import Product, Receipt
 from registers.receipts import convert_serializer
-from registers.exceptions import CashRegisterNotReady
+from registers.exceptions import CashRegisterBusy, CashRegisterNotReady
 from registers.serializers import ReceiptSerializer
 
 
@@ -54,12 +54,16 @@ def test_endpoint_calls_adapters(alice_client, mocker, settings):
     assert adapter_2.push.call_count == 1
     # check the given payload
     args, _ = adapter_1.push.call_args_list[0]
-    receipt = args[0]
-    items = receipt.sell_set.all()
-    assert items[0].product.name == products[0].name
-    assert items[1].product.name == products[1].name
-    assert float(items[0].price.amount) == 5.9
-    assert float(items[1].price.amount) == 2.0
+    snapshot = args[0]
+    items = snapshot.items
+    assert items[0].product == products[0].name
+    assert items[1].product == products[1].name
+    assert float(items[0].price) == 5.9
+    assert float(items[1].price) == 2.0
+    assert float(snapshot.total) == 9.9
+    # all adapters share the same snapshot
+    args, _ = adapter_2.push.call_args_list[0]
+    assert args[0] is snapshot
 
 
 @pytest.mark.django_db
@@ -111,6 +115,52 @@ def test_receipt_post_rollback_on_adapters_errors(alice_client, mocker, settings
     assert Receipt.objects.count() == 0
 
 
+@pytest.mark.django_db
+def test_receipt_post_busy_register(alice_client, mocker, settings):
+    """
+    Ensure that a POST on the receipt endpoint returns a 429 if the
+    cash register has too many receipts in its queue:
+        * the adapter raises ``CashRegisterBusy``
+        * expect that the client is asked to retry later
+        * expect that the database did a rollback
+    """
+    adapter = mocker.Mock()
+    adapter.push.side_effect = CashRegisterBusy
+    settings.PUSH_ADAPTERS = [adapter]
+    product = mommy.make(Product)
+    sold_items = {'products': [{'id': product.id, 'price': '5.90'}]}
+    endpoint = reverse('registers:receipt-list')
+    response = alice_client.post(endpoint, data=sold_items)
+    assert response.status_code == 429
+    assert response['Retry-After'] == '1'
+    assert Receipt.objects.count() == 0
+
+
+@pytest.mark.django_db
+def test_receipt_post_open_circuit(alice_client, mocker, settings):
+    """
+    Ensure that a POST on the receipt endpoint fails fast when an adapter
+    keeps failing:
+        * the adapter fails ``ADAPTERS_CIRCUIT_THRESHOLD`` times
+        * expect that the next request returns a 503
+        * expect that the adapter is not called
+    """
+    settings.ADAPTERS_CIRCUIT_THRESHOLD = 2
+    adapter = mocker.Mock()
+    adapter.push.side_effect = CashRegisterNotReady
+    settings.PUSH_ADAPTERS = [adapter]
+    product = mommy.make(Product)
+    sold_items = {'products': [{'id': product.id, 'price': '5.90'}]}
+    endpoint = reverse('registers:receipt-list')
+    for _ in range(2):
+        response = alice_client.post(endpoint, data=sold_items)
+        assert response.status_code == 500
+    response = alice_client.post(endpoint, data=sold_items)
+    assert response.status_code == 503
+    assert adapter.push.call_count == 2
+    assert Receipt.objects.count() == 0
+
+
 @pytest.mark.django_db
 def test_convert_serializer():
     """
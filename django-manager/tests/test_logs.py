@@ -0,0 +1,169 @@
+import logging
+import threading
+import pytest
+
+from model_mommy import mommy
+
+from manager import logs
+from manager.logs import ContextFilter, QueueHandler, disable_queue, enable_queue, get_stats, log_context
+
+from registers.dispatch import push_receipts
+from registers.models import Receipt
+
+
+class RecordsHandler(logging.Handler):
+    """
+    Stores handled records, optionally waiting for the ``resumed`` event
+    before handling them like a stalled syslog socket.
+    """
+    def __init__(self, resumed=None):
+        super().__init__()
+        self.records = []
+        self.resumed = resumed
+
+    def emit(self, record):
+        if self.resumed is not None:
+            self.resumed.wait(5)
+        self.records.append(record)
+
+
+@pytest.fixture
+def logger():
+    logger = logging.getLogger('test_logs')
+    logger.setLevel(logging.DEBUG)
+    logger.propagate = False
+    yield logger
+    disable_queue()
+    logger.handlers = []
+
+
+def _record(message='message', **extra):
+    record = logging.LogRecord('test_logs', logging.INFO, __file__, 0, message, None, None)
+    record.__dict__.update(extra)
+    return record
+
+
+class TestContext:
+    def test_log_context(self):
+        """
+        Ensures that records include the values of nested contexts
+        """
+        context_filter = ContextFilter()
+        with log_context(receipt=42):
+            with log_context(adapter='printer'):
+                record = _record()
+                context_filter.filter(record)
+            outer = _record()
+            context_filter.filter(outer)
+        assert record.context == ' receipt=42 adapter=printer'
+        assert outer.context == ' receipt=42'
+        assert not hasattr(outer, 'adapter')
+
+    def test_extra(self):
+        """
+        Ensures that ``extra`` values are kept and records are filtered once
+        """
+        record = _record(duration='1.0ms')
+        with log_context(receipt=42, duration='2.0ms'):
+            ContextFilter().filter(record)
+        assert record.context == ' receipt=42 duration=1.0ms'
+        # i.e. a ``QueueListener`` handler doesn't reset the context
+        ContextFilter().filter(record)
+        assert record.context == ' receipt=42 duration=1.0ms'
+
+    def test_other_threads(self):
+        """
+        Ensures that the context of a thread is not shared
+        """
+        records = []
+        with log_context(receipt=42):
+            thread = threading.Thread(target=lambda: records.append(ContextFilter().filter(_record()) and _record()))
+            thread.start()
+            thread.join()
+        assert ContextFilter().filter(records[0]) and records[0].context == ''
+
+
+class TestQueue:
+    def test_enable_queue(self, logger):
+        """
+        Ensures that handlers are replaced by a queue, written by a
+        listener thread
+        """
+        target = RecordsHandler()
+        logger.addHandler(target)
+        enable_queue(['test_logs'], maxsize=10)
+        assert isinstance(logger.handlers[0], QueueHandler)
+
+        with log_context(receipt=42):
+            logger.info('pushed %s', 'receipt')
+        disable_queue()
+        assert logger.handlers == [target]
+        assert target.records[0].getMessage() == 'pushed receipt'
+        assert target.records[0].context == ' receipt=42'
+
+    def test_stalled_handler(self, logger):
+        """
+        Ensures that logging doesn't block when the handler is stalled, and
+        that dropped records are counted and reported
+        """
+        resumed = threading.Event()
+        target = RecordsHandler(resumed)
+        logger.addHandler(target)
+        enable_queue(['test_logs'], maxsize=2)
+
+        handler = logger.handlers[0]
+        for i in range(10):
+            logger.info('record %d', i)
+        stats = get_stats()[0]
+        # the listener may have taken the first record from the queue
+        assert stats['dropped'] in (7, 8)
+        resumed.set()
+        handler.queue.join()
+        logger.info('recovered')
+        disable_queue()
+        messages = [record.getMessage() for record in target.records]
+        assert messages[-2] == 'log queue full, dropped {} records'.format(stats['dropped'])
+        assert messages[-1] == 'recovered'
+
+    def test_forked_worker(self, logger, mocker):
+        """
+        Ensures that a forked worker starts its own listener
+        """
+        logger.addHandler(RecordsHandler())
+        enable_queue(['test_logs'], maxsize=10)
+        handler = logger.handlers[0]
+        listener = handler.listener
+        enable_queue()
+        assert handler.listener is listener
+
+        listener.stop()
+        mocker.patch.object(logs.os, 'getpid', return_value=handler.pid + 1)
+        enable_queue()
+        assert handler.listener is not listener
+        assert logger.handlers == [handler]
+
+
+@pytest.mark.django_db
+def test_push_receipts_context(mocker, settings):
+    """
+    Ensures that adapters log with the receipt and the adapter context
+    """
+    adapter = mocker.Mock()
+    adapter.push.side_effect = lambda payload: logging.getLogger('registers.test').warning('pushed')
+    settings.PUSH_ADAPTERS = [adapter]
+    records = RecordsHandler()
+    records.addFilter(ContextFilter())
+    dispatch_logger = logging.getLogger('registers')
+    dispatch_logger.addHandler(records)
+    dispatch_logger.setLevel(logging.DEBUG)
+    try:
+        receipt = mommy.make(Receipt)
+        push_receipts([receipt])
+    finally:
+        dispatch_logger.removeHandler(records)
+        dispatch_logger.setLevel(logging.NOTSET)
+
+    warning, pushed = records.records
+    assert warning.context == ' receipt={} adapter=unittest.mock.Mock'.format(receipt.pk)
+    assert pushed.getMessage() == 'receipt pushed'
+    assert pushed.duration.endswith('ms')
@@ -0,0 +1,75 @@
+import os
+import pytest
+
+
+@pytest.fixture
+def media(settings, tmpdir):
+    """
+    Stores media files in a temporary ``MEDIA_ROOT``, with an original
+    icon and one of its content-hashed variants.
+    """
+    settings.MEDIA_ROOT = str(tmpdir)
+    tmpdir.join('croissant.png').write_binary(b'original')
+    tmpdir.mkdir('icons').join('croissant-64.0123456789ab.png').write_binary(b'variant')
+    return tmpdir
+
+
+class TestMedia:
+    def test_serve(self, client, media):
+        """
+        Files are streamed by Django, and cached for MEDIA_MAX_AGE
+        """
+        response = client.get('/media/croissant.png')
+        assert response.status_code == 200
+        assert response.streaming is True
+        assert b''.join(response.streaming_content) == b'original'
+        assert response['Content-Type'] == 'image/png'
+        assert response['Cache-Control'] == 'public, max-age=3600'
+
+    def test_serve_immutable(self, client, media):
+        """
+        Content-hashed names are cached forever
+        """
+        response = client.get('/media/icons/croissant-64.0123456789ab.png')
+        assert response.status_code == 200
+        assert response['Cache-Control'] == 'public, max-age=31536000, immutable'
+
+    def test_serve_not_found(self, client, media):
+        """
+        Missing files are not found, and not cached
+        """
+        assert client.get('/media/missing.png').status_code == 404
+        assert 'Cache-Control' not in client.get('/media/missing.png')
+
+    @pytest.mark.parametrize('mode', ['x-sendfile', 'x-accel-redirect'])
+    def test_serve_not_found_server_modes(self, client, settings, media, mode):
+        """
+        Missing files and files outside MEDIA_ROOT are not delegated
+        """
+        settings.MEDIA_SERVE_MODE = mode
+        assert client.get('/media/missing.png').status_code == 404
+        assert client.get('/media/../manage.py').status_code == 404
+        assert client.get('/media/icons').status_code == 404
+
+    def test_serve_x_sendfile(self, client, settings, media):
+        """
+        The file transfer is delegated with the X-Sendfile header
+        """
+        settings.MEDIA_SERVE_MODE = 'x-sendfile'
+        response = client.get('/media/icons/croissant-64.0123456789ab.png')
+        assert response.status_code == 200
+        assert response.content == b''
+        assert response['X-Sendfile'] == os.path.join(str(media), 'icons', 'croissant-64.0123456789ab.png')
+        assert response['Content-Type'] == 'image/png'
+        assert response['Cache-Control'] == 'public, max-age=31536000, immutable'
+
+    def test_serve_x_accel_redirect(self, client, settings, media):
+        """
+        The file transfer is delegated to nginx with the X-Accel-Redirect header
+        """
+        settings.MEDIA_SERVE_MODE = 'x-accel-redirect'
+        response = client.get('/media/croissant.png')
+        assert response.status_code == 200
+        assert response.content == b''
+        assert response['X-Accel-Redirect'] == '/protected-media/croissant.png'
+        assert response['Cache-Control'] == 'public, max-age=3600'
@@ -0,0 +1,119 @@
+import io
+import gzip
+import json
+import pytest
+
+from django.core.urlresolvers import reverse
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.test import RequestFactory
+
+from manager.middleware import CompressionMiddleware
+
+from registers.models import Product
+
+
+def _process(response, accept_encoding='gzip, deflate, br'):
+    request = RequestFactory().get('/', HTTP_ACCEPT_ENCODING=accept_encoding)
+    return CompressionMiddleware().process_response(request, response)
+
+
+@pytest.mark.django_db
+def test_compressed_catalog(alice_client):
+    """
+    Ensures that the products list of a 1,000 products catalog
+    is compressed
+    """
+    Product.objects.bulk_create(
+        Product(name='Product {}'.format(i), default_price='{}.50'.format(i)) for i in range(1000)
+    )
+    endpoint = reverse('registers:product-list')
+    plain = alice_client.get(endpoint)
+    response = alice_client.get(endpoint, HTTP_ACCEPT_ENCODING='gzip')
+    assert response['Content-Encoding'] == 'gzip'
+    assert 'Accept-Encoding' in response['Vary']
+    assert int(response['Content-Length']) == len(response.content)
+    # the catalog is at least 5 times smaller
+    assert len(response.content) * 5 < len(plain.content)
+    assert len(json.loads(gzip.decompress(response.content).decode())) == 1000
+
+
+def test_brotli():
+    """
+    Ensures that brotli is preferred, when it's available
+    """
+    brotli = pytest.importorskip('brotli')
+    content = b'receipt ' * 1000
+    response = _process(HttpResponse(content))
+    assert response['Content-Encoding'] == 'br'
+    assert brotli.decompress(response.content) == content
+
+
+def test_gzip_without_brotli(mocker):
+    """
+    Ensures that gzip is used if brotli is not installed
+    """
+    mocker.patch('manager.middleware.brotli', None)
+    content = b'receipt ' * 1000
+    response = _process(HttpResponse(content))
+    assert response['Content-Encoding'] == 'gzip'
+    assert gzip.decompress(response.content) == content
+
+
+def test_skip_short_response():
+    response = _process(HttpResponse(b'receipt'))
+    assert not response.has_header('Content-Encoding')
+
+
+def test_skip_not_accepted():
+    response = _process(HttpResponse(b'receipt ' * 1000), accept_encoding='identity')
+    assert not response.has_header('Content-Encoding')
+    assert 'Accept-Encoding' in response['Vary']
+
+
+def test_skip_compressed_content():
+    """
+    Ensures that compressed responses and content types are not
+    compressed again
+    """
+    response = HttpResponse(b'receipt ' * 1000, content_type='application/json')
+    response['Content-Encoding'] = 'gzip'
+    assert _process(response).content == b'receipt ' * 1000
+    response = _process(HttpResponse(b'\x89PNG' * 1000, content_type='image/png'))
+    assert not response.has_header('Content-Encoding')
+
+
+@pytest.mark.parametrize('encoding', ['gzip', 'br'])
+def test_streaming_response(encoding, mocker):
+    """
+    Ensures that each chunk of a streaming response (i.e. an export)
+    is sent as soon as it's compressed
+    """
+    if encoding == 'br':
+        decompress = pytest.importorskip('brotli').decompress
+    else:
+        mocker.patch('manager.middleware.brotli', None)
+        decompress = gzip.decompress
+    rows = ('{{"receipt": {}}}\n'.format(i).encode() for i in range(100))
+    response = _process(StreamingHttpResponse(rows), accept_encoding=encoding)
+    assert response['Content-Encoding'] == encoding
+    assert not response.has_header('Content-Length')
+    chunks = list(response.streaming_content)
+    assert len(chunks) == 101
+    assert decompress(b''.join(chunks)).count(b'receipt') == 100
+
+
+def test_weak_etag():
+    response = HttpResponse(b'receipt ' * 1000)
+    response['ETag'] = '"products"'
+    assert _process(response)['ETag'] == 'W/"products"'
+
+
+def test_skip_file_response():
+    """
+    Ensures that files are not compressed, so that they are still sent
+    with ``wsgi.file_wrapper``
+    """
+    response = FileResponse(io.BytesIO(b'{"receipts": []}' * 1000), content_type='application/json')
+    assert _process(response) is response
+    assert response.file_to_stream is not None
+    assert not response.has_header('Content-Encoding')
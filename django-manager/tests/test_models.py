@@ -1,10 +1,13 @@
 import pytest
 
+from decimal import Decimal as D
+from datetime import date
+
 from django.utils import timezone
 
 from model_mommy import mommy
 
-from registers.models import Product, Receipt, Sell
+from registers.models import Product, ProductSales, Receipt, Sell
 
 
 class TestProduct:
@@ -199,3 +202,88 @@ class TestReceipt:
         )
         # check default attributes
         assert str(receipt) == 'Total: 1.00 -- Jan. 1, 2016, midnight'
+
+    @pytest.mark.django_db
+    def test_sold_items_date(self):
+        """
+        Ensures that sold items store the date of their receipt, also
+        when the receipt date is changed
+        """
+        receipt = mommy.make(Receipt, date=timezone.datetime(2016, 1, 1, 10, tzinfo=timezone.utc))
+        sell = Sell.objects.create(receipt=receipt, product=mommy.make(Product), quantity=1, price=1)
+        assert sell.date == receipt.date
+        receipt.date = timezone.datetime(2016, 2, 1, 10, tzinfo=timezone.utc)
+        receipt.save()
+        sell.refresh_from_db()
+        assert sell.date == receipt.date
+
+
+class TestProductSales:
+    @pytest.mark.django_db
+    def test_record(self):
+        """
+        Ensures that sold items are added to the daily counters:
+            * two products are sold in two different receipts
+            * counters are created for the first receipt
+            * counters are incremented for the second receipt
+        """
+        product_1 = mommy.make(Product)
+        product_2 = mommy.make(Product)
+        receipt = mommy.make(Receipt, date=timezone.datetime(2016, 1, 1, 10, tzinfo=timezone.utc))
+        sells = [
+            Sell.objects.create(receipt=receipt, product=product_1, quantity=1, price=1.5),
+            Sell.objects.create(receipt=receipt, product=product_1, quantity=2, price=1.5),
+            Sell.objects.create(receipt=receipt, product=product_2, quantity=1, price=2),
+        ]
+        # first receipt creates the counters
+        ProductSales.objects.record(receipt.date, sells)
+        counter = product_1.sales_on(date(2016, 1, 1))
+        assert counter.quantity == D('3')
+        assert counter.revenue.amount == D('4.5')
+        # second receipt increments the counters
+        ProductSales.objects.record(receipt.date, sells[:1])
+        counter = product_1.sales_on(date(2016, 1, 1))
+        assert counter.quantity == D('4')
+        assert counter.revenue.amount == D('6')
+        assert product_2.sales_on(date(2016, 1, 1)).quantity == D('1')
+        assert ProductSales.objects.count() == 2
+
+    @pytest.mark.django_db
+    def test_sales_on_empty_day(self):
+        """
+        Ensures that a day without sold items returns empty counters
+        """
+        product = mommy.make(Product)
+        counter = product.sales_on(date(2016, 1, 1))
+        assert counter.pk is None
+        assert counter.quantity == 0
+
+    @pytest.mark.django_db
+    def test_rebuild(self):
+        """
+        Ensures that counters are recomputed from the ``Sell`` table,
+        using only receipts of the given day.
+        """
+        product = mommy.make(Product)
+        receipt = mommy.make(Receipt, date=timezone.datetime(2016, 1, 1, 10, tzinfo=timezone.utc))
+        other_day = mommy.make(Receipt, date=timezone.datetime(2016, 1, 2, 10, tzinfo=timezone.utc))
+        Sell.objects.create(receipt=receipt, product=product, quantity=2, price=1.5)
+        Sell.objects.create(receipt=other_day, product=product, quantity=1, price=1.5)
+        # stale counters are replaced
+        mommy.make(ProductSales, product=product, day=date(2016, 1, 1), quantity=10)
+        ProductSales.objects.rebuild(date(2016, 1, 1))
+        counter = product.sales_on(date(2016, 1, 1))
+        assert counter.quantity == D('2')
+        assert counter.revenue.amount == D('3')
+
+    @pytest.mark.django_db
+    def test_top_sellers(self):
+        """
+        Ensures that top sellers are ordered by sold quantity
+        """
+        products = mommy.make(Product, _quantity=3)
+        for quantity, product in enumerate(products, 1):
+            mommy.make(ProductSales, product=product, day=date(2016, 1, 1), quantity=quantity)
+        mommy.make(ProductSales, product=products[0], day=date(2016, 1, 2), quantity=10)
+        top_sellers = ProductSales.objects.top_sellers(date(2016, 1, 1), limit=2)
+        assert [counter.product for counter in top_sellers] == [products[2], products[1]]
@@ -0,0 +1,58 @@
+import pytest
+
+from io import StringIO
+from datetime import date
+
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command
+
+from registers.partitions import create_partitions, months, partition_sql, partition_tables
+
+
+class TestPartitions:
+    def test_months(self):
+        """
+        Ensures that months continue in the next year
+        """
+        assert list(months(date(2016, 11, 15), 3)) == [date(2016, 11, 1), date(2016, 12, 1), date(2017, 1, 1)]
+
+    def test_partition_sql(self):
+        """
+        Ensures that a partition includes a whole month, and that rows
+        of that month are moved out of the default partition
+        """
+        statements = partition_sql('registers_sell', date(2016, 12, 1))
+        assert statements[1] == (
+            'CREATE TABLE "registers_sell_2016_12" PARTITION OF "registers_sell" '
+            "FOR VALUES FROM ('2016-12-01 00:00:00+00') TO ('2017-01-01 00:00:00+00')"
+        )
+        assert 'DELETE FROM "registers_sell_default"' in statements[0]
+        assert statements[2] == 'INSERT INTO "registers_sell" SELECT * FROM "registers_sell_2016_12_moved"'
+
+    def test_create_partitions(self, mocker):
+        """
+        Ensures that only missing partitions are created
+        """
+        mocker.patch('registers.partitions.transaction')
+        connection = mocker.MagicMock()
+        cursor = connection.cursor.return_value.__enter__.return_value
+        cursor.fetchall.return_value = [('registers_receipt_2016_12',), ('registers_sell_2016_12',)]
+        created = create_partitions(connection, date(2016, 12, 1), 2)
+        assert created == ['registers_receipt_2017_01', 'registers_sell_2017_01']
+
+    def test_partition_tables_old_postgresql(self, mocker):
+        """
+        Ensures that partitioning requires PostgreSQL 11
+        """
+        with pytest.raises(ImproperlyConfigured):
+            partition_tables(mocker.Mock(pg_version=100005), 3)
+
+    @pytest.mark.django_db
+    def test_command_disabled(self):
+        """
+        Ensures that partitions are created only on PostgreSQL, when
+        partitioning is enabled
+        """
+        out = StringIO()
+        call_command('create_partitions', stdout=out)
+        assert out.getvalue() == 'partitioning is not enabled\n'
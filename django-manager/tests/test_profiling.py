@@ -0,0 +1,152 @@
+import time
+import pstats
+import threading
+import pytest
+
+from model_mommy import mommy
+
+from django.core.urlresolvers import reverse
+
+from rest_framework.test import APIClient
+
+from registers import profiling
+from registers.models import Product, Profile
+from registers.profiling import Sampler, get_sample_rate, set_sample_rate
+
+
+def busy(seconds):
+    end = time.monotonic() + seconds
+    while time.monotonic() < end:
+        pass
+
+
+class TestSampler:
+    def test_stacks(self):
+        """
+        Ensures that the call stacks of the profiled thread are counted
+        """
+        sampler = Sampler(threading.get_ident(), 0.001)
+        sampler.start()
+        busy(0.05)
+        sampler.stop()
+        assert sum(sampler.stacks.values()) > 0
+        folded = sampler.folded()
+        assert 'tests.test_profiling:test_stacks;tests.test_profiling:busy' in folded
+        stack, count = folded.splitlines()[0].rsplit(' ', 1)
+        assert int(count) > 0
+
+
+class TestSampleRate:
+    def test_default(self, settings):
+        settings.PROFILING_SAMPLE_RATE = 50
+        assert get_sample_rate() == 50
+
+    def test_admin_rate(self, settings):
+        settings.PROFILING_SAMPLE_RATE = 0
+        set_sample_rate(10)
+        assert get_sample_rate() == 10
+
+
+@pytest.mark.django_db
+class TestProfilingMixin:
+    def test_header(self, alice_client, tmpdir):
+        """
+        Ensures that requests with the ``X-Profile`` header are profiled
+        """
+        mommy.make(Product)
+        response = alice_client.get(reverse('registers:product-list'), HTTP_X_PROFILE='1')
+        assert response.status_code == 200
+        profile = Profile.objects.get()
+        assert profile.path == '/api/products/'
+        assert profile.method == 'GET'
+        assert profile.status_code == 200
+        assert profile.user.username == 'alice'
+        assert profile.duration > 0
+        assert len(profile.stacks.splitlines()) <= profile.samples
+        # the statistics include the view
+        stats_file = tmpdir.join('profile.pstats')
+        stats_file.write_binary(bytes(profile.pstats))
+        functions = pstats.Stats(str(stats_file)).stats
+        assert any(name == 'list' and filename.endswith('apiviews.py') for filename, line, name in functions)
+
+    def test_not_profiled(self, alice_client, mocker, settings):
+        """
+        Ensures that profiling costs nothing when it's not requested
+        """
+        settings.PROFILING_SAMPLE_RATE = 0
+        profile = mocker.spy(profiling.cProfile, 'Profile')
+        response = alice_client.get(reverse('registers:product-list'))
+        assert response.status_code == 200
+        assert profile.call_count == 0
+        assert Profile.objects.count() == 0
+
+    def test_sampled(self, alice_client):
+        """
+        Ensures that requests are sampled with the rate set in the admin
+        """
+        set_sample_rate(1)
+        alice_client.get(reverse('registers:product-list'))
+        alice_client.get(reverse('registers:product-search'), {'q': 'a'})
+        assert Profile.objects.count() == 2
+
+    def test_not_staff(self, bob_client, mocker):
+        """
+        Ensures that only staff users can start profiling
+        """
+        profile = mocker.spy(profiling.cProfile, 'Profile')
+        set_sample_rate(1)
+        response = APIClient().get(reverse('registers:product-list'), HTTP_X_PROFILE='1')
+        assert response.status_code == 403
+        response = bob_client.get(reverse('registers:product-list'), HTTP_X_PROFILE='1')
+        assert response.status_code == 403
+        assert profile.call_count == 0
+        assert Profile.objects.count() == 0
+
+    def test_keep(self, alice_client, settings):
+        """
+        Ensures that only the latest profiles are kept
+        """
+        settings.PROFILING_KEEP = 2
+        for _ in range(4):
+            alice_client.get(reverse('registers:product-list'), HTTP_X_PROFILE='1')
+        assert Profile.objects.count() == 2
+
+
+@pytest.mark.django_db
+class TestProfileAdmin:
+    def test_changelist(self, alice_client):
+        """
+        Ensures that profiles are listed with their downloads
+        """
+        alice_client.get(reverse('registers:product-list'), HTTP_X_PROFILE='1')
+        profile = Profile.objects.get()
+        response = alice_client.get(reverse('admin:registers_profile_changelist'))
+        assert response.status_code == 200
+        content = response.content.decode()
+        assert reverse('admin:registers_profile_stacks', args=[profile.pk]) in content
+        assert reverse('admin:registers_profile_sampling') in content
+        assert 'sampling is disabled' in content
+        assert response.context['sample_rate'] == 0
+        assert not list(response.context['messages'])
+
+    def test_downloads(self, alice_client):
+        alice_client.get(reverse('registers:product-list'), HTTP_X_PROFILE='1')
+        profile = Profile.objects.get()
+        response = alice_client.get(reverse('admin:registers_profile_stacks', args=[profile.pk]))
+        assert response.status_code == 200
+        assert response.content.decode() == profile.stacks
+        response = alice_client.get(reverse('admin:registers_profile_pstats', args=[profile.pk]))
+        assert response['Content-Disposition'] == 'attachment; filename="profile-{}.pstats"'.format(profile.pk)
+        assert response.content == bytes(profile.pstats)
+
+    def test_sampling(self, alice_client):
+        """
+        Ensures that the sample rate is changed in the admin
+        """
+        endpoint = reverse('admin:registers_profile_sampling')
+        assert alice_client.get(endpoint).status_code == 200
+        response = alice_client.post(endpoint, {'rate': 20, 'minutes': 10}, format='multipart')
+        assert response.status_code == 302
+        assert get_sample_rate() == 20
+        alice_client.post(endpoint, {'rate': 'many', 'minutes': 10}, format='multipart')
+        assert get_sample_rate() == 20
@@ -0,0 +1,84 @@
+import pytest
+
+from decimal import Decimal as D
+
+from model_mommy import mommy
+
+from django.core.urlresolvers import reverse
+from django.db import connection
+
+from registers import search
+from registers.models import Product
+from registers.search import PrefixIndex, get_index, search_products
+
+
+@pytest.fixture
+def products():
+    names = ['Cappuccino', 'Iced Cappuccino', 'Croissant', 'cake', 'Espresso']
+    return {name: mommy.make(Product, name=name, default_price=D('1.00')) for name in names}
+
+
+class TestPrefixIndex:
+    def test_search(self):
+        """
+        Ensures that prefix matches come first, then substring matches
+        """
+        index = PrefixIndex([(1, 'Cappuccino'), (2, 'Iced Cappuccino'), (3, 'cake'), (4, 'Croissant')])
+        assert index.search('ca') == [3, 1, 2]
+        assert index.search('CAPP') == [1, 2]
+        assert index.search('ssa') == [4]
+        assert index.search('tea') == []
+
+
+@pytest.mark.django_db
+class TestSearchProducts:
+    @pytest.mark.django_db(transaction=True)
+    def test_index_rebuilt(self, products):
+        """
+        Ensures that the in-memory index is built once for each catalog version
+        """
+        index = get_index('default')
+        assert get_index('default') is index
+        mommy.make(Product, name='Cappuccino Decaf')
+        assert get_index('default') is not index
+        assert len(search_products('cappuccino')) == 3
+
+    def test_postgresql(self, products, mocker):
+        """
+        Ensures that PostgreSQL filters and sorts matches in the database
+        """
+        mocker.patch.object(connection, 'vendor', 'postgresql')
+        get_index = mocker.spy(search, 'get_index')
+        pks = search_products('ca')
+        assert 'LIKE' in str(pks.query)
+        assert list(pks) == [products[name].pk for name in ('cake', 'Cappuccino', 'Iced Cappuccino')]
+        assert get_index.call_count == 0
+
+
+@pytest.mark.django_db
+class TestSearchAPI:
+    def test_search(self, alice_client, products):
+        """
+        Ensures that a page of matching products is returned
+        """
+        endpoint = reverse('registers:product-search')
+        response = alice_client.get(endpoint, {'q': 'cappuccino'})
+        assert response.status_code == 200
+        assert response.data['count'] == 2
+        assert [product['name'] for product in response.data['results']] == ['Cappuccino', 'Iced Cappuccino']
+
+    def test_paging(self, alice_client, products):
+        endpoint = reverse('registers:product-search')
+        response = alice_client.get(endpoint, {'q': 'c', 'limit': 2, 'offset': 2})
+        assert response.data['count'] == 4
+        assert [product['name'] for product in response.data['results']] == ['Croissant', 'Iced Cappuccino']
+        assert response.data['next'] is None
+
+    def test_query_required(self, alice_client):
+        endpoint = reverse('registers:product-search')
+        assert alice_client.get(endpoint).status_code == 400
+        assert alice_client.get(endpoint, {'q': '  '}).status_code == 400
+
+    def test_permissions(self, api_client):
+        endpoint = reverse('registers:product-search')
+        assert api_client.get(endpoint, {'q': 'ca'}).status_code == 403
@@ -4,8 +4,12 @@ from decimal import Decimal as D
 
 from model_mommy import mommy
 
+from django.db import connection
+from django.http import QueryDict
+from django.test.utils import CaptureQueriesContext
+
 from registers.models import Product, Receipt
-from registers.serializers import ProductSerializer, ReceiptItemSerializer, ReceiptSerializer
+from registers.serializers import FastReceiptSerializer, ProductSerializer, ReceiptItemSerializer, ReceiptSerializer
 
 
 class TestProduct:
@@ -240,3 +244,81 @@ class TestReceipt:
         # the Receipt must not be created
         assert Receipt.objects.count() == 0
         assert Product.objects.count() == 0
+
+
+RECEIPTS = [
+    # valid receipts
+    {'products': [{'id': 1, 'price': '5.90'}]},
+    {'products': [{'id': '1', 'price': 5.9, 'quantity': 2}, {'id': 2, 'price': '2', 'quantity': '1.68'}]},
+    {'products': [{'id': 1, 'price': ' 0.5 ', 'price_currency': 'EUR', 'extra': True}, {'id': 1, 'price': 1}]},
+    {'products': [{'id': 2, 'price': D('99999999.99'), 'quantity': '-1.00'}], 'extra': []},
+    {'products': [{'id': 2, 'price': '1E+2', 'quantity': '0.01'}]},
+    # invalid receipts
+    {},
+    [],
+    'receipt',
+    {'products': []},
+    {'products': {'id': 1, 'price': '5.90'}},
+    {'products': ['product']},
+    {'products': [{'id': 3, 'price': '5.90'}]},
+    {'products': [{'id': None, 'price': '5.90'}, {'id': 'one', 'price': '5.90'}]},
+    {'products': [{'id': True, 'price': '5.90'}, {'id': 1.0, 'price': '5.90'}]},
+    {'products': [{'id': 1}, {'id': 1, 'price': ''}, {'id': 1, 'price': None}]},
+    {'products': [{'id': 1, 'price': '5.901'}, {'id': 1, 'price': '1.500'}, {'id': 1, 'price': '123456789'}]},
+    {'products': [{'id': 1, 'price': 'NaN'}, {'id': 1, 'price': '-Inf'}, {'id': 1, 'price': True}]},
+    {'products': [{'id': 1, 'price': '5.90', 'price_currency': 'USD'}, {'id': 1, 'price': '1', 'quantity': None}]},
+    {'products': [{'id': 1, 'price': '5.90', 'price_currency': ''}, {'id': 1, 'price': '1', 'quantity': 'x'}]},
+    {'products': [{'id': 1, 'price': ['5.90']}, {'id': 1, 'price': '1' * 1001}]},
+]
+
+
+def _data(serializer):
+    """
+    Returns validated data with products primary keys, so that
+    they can be compared
+    """
+    data = serializer.validated_data
+    return [
+        [(key, value.pk if key == 'id' else value, type(value)) for key, value in item.items()]
+        for item in data['products']
+    ] if data else data
+
+
+@pytest.mark.django_db
+class TestFastReceiptSerializer:
+    @pytest.mark.parametrize('receipt', RECEIPTS)
+    def test_equivalent_validation(self, receipt):
+        """
+        Ensures that the fast path returns the same validated data
+        and errors of the ``ReceiptSerializer``
+        """
+        mommy.make(Product, id=1)
+        mommy.make(Product, id=2)
+        serializer = ReceiptSerializer(data=receipt)
+        fast_serializer = FastReceiptSerializer(data=receipt)
+        assert fast_serializer.is_valid() is serializer.is_valid()
+        assert fast_serializer.errors == serializer.errors
+        assert _data(fast_serializer) == _data(serializer)
+
+    def test_html_input(self):
+        """
+        Ensures that form data are validated by DRF
+        """
+        data = QueryDict('products[0]id=1&products[0]price=5.90')
+        serializer = ReceiptSerializer(data=data)
+        fast_serializer = FastReceiptSerializer(data=data)
+        assert fast_serializer.is_valid() is serializer.is_valid()
+        assert fast_serializer.errors == serializer.errors
+
+    def test_single_query(self):
+        """
+        Ensures that products are loaded with a single query
+        """
+        products = mommy.make(Product, _quantity=10)
+        receipt = {'products': [{'id': product.id, 'price': '1.00'} for product in products]}
+        with CaptureQueriesContext(connection) as queries:
+            assert FastReceiptSerializer(data=receipt).is_valid() is True
+        assert len(queries) == 1
+        with CaptureQueriesContext(connection) as queries:
+            assert ReceiptSerializer(data=receipt).is_valid() is True
+        assert len(queries) == 10
@@ -0,0 +1,141 @@
+import pytest
+
+from io import StringIO
+
+from django.core.management import call_command
+
+from cash_register.models.xditron import SaremaX1
+
+from model_mommy import mommy
+
+from registers.models import Product, Receipt, Sell
+from registers.exceptions import CashRegisterNotReady
+from registers.snapshots import build_snapshots
+from registers.simulators import SaremaX1Simulator
+from registers.adapters.printers import CashRegisterAdapter, shutdown_devices
+
+
+class FakeConnection:
+    """
+    Connection handler that stores written commands
+    """
+    def __init__(self):
+        self.data = b''
+
+    def write(self, data):
+        self.data += data
+
+    def open(self):
+        pass
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+
+SOLD_ITEMS = [
+    {
+        'description': 'Croissant',
+        'price': '5.90',
+    },
+    {
+        'description': 'Begel',
+        'price': '2.00',
+        'quantity': '2.00',
+    },
+]
+
+
+def _commands(items):
+    """
+    Returns the bytes that ``python-cash-register`` sends to print
+    the given items.
+    """
+    connection = FakeConnection()
+    register = SaremaX1('Shop', connection=connection)
+    register.sell_products(items)
+    register.send()
+    return connection.data
+
+
+class TestSaremaX1Simulator:
+    def teardown_method(self, method):
+        shutdown_devices()
+
+    def test_parse_commands(self):
+        """
+        Ensures that the simulator understands ``SaremaX1`` commands, even
+        when they are received in many chunks:
+            * send two receipts, one byte at a time
+            * expect that both receipts are printed
+        """
+        simulator = SaremaX1Simulator()
+        data = _commands(SOLD_ITEMS) * 2
+        for i in range(len(data)):
+            simulator.feed(data[i:i + 1])
+        assert simulator.receipts == [SOLD_ITEMS, SOLD_ITEMS]
+        assert simulator.errors == 0
+
+    def test_parse_unknown_commands(self):
+        """
+        Ensures that unknown commands are counted as errors and skipped
+        """
+        simulator = SaremaX1Simulator()
+        simulator.feed(b'K??"Croissant"5.90H1R1T')
+        assert simulator.receipts == [SOLD_ITEMS[:1]]
+        assert simulator.errors == 2
+
+    @pytest.mark.django_db
+    def test_print_with_pty(self, settings):
+        """
+        Ensures that the ``CashRegisterAdapter`` prints a receipt on a
+        simulated cash register connected through a pseudo-terminal.
+        """
+        simulator = SaremaX1Simulator(baudrate=115200)
+        settings.SERIAL_PORT = simulator.start_pty()
+        receipt = mommy.make(Receipt)
+        Sell.objects.create(receipt=receipt, product=mommy.make(Product, name='Croissant'), quantity=1, price=5.90)
+        try:
+            CashRegisterAdapter().push(build_snapshots([receipt])[0])
+        finally:
+            simulator.stop()
+        assert simulator.receipts == [SOLD_ITEMS[:1]]
+
+    @pytest.mark.django_db
+    def test_failure_with_socket(self, settings):
+        """
+        Ensures that failures injected in a simulated cash register
+        connected through a socket are raised by the adapter.
+        """
+        simulator = SaremaX1Simulator(failure_rate=1)
+        settings.SERIAL_PORT = simulator.start_socket()
+        receipt = mommy.make(Receipt)
+        Sell.objects.create(receipt=receipt, product=mommy.make(Product), quantity=1, price=5.90)
+        adapter = CashRegisterAdapter()
+        snapshot = build_snapshots([receipt])[0]
+        try:
+            # the connection is reset while the receipt is sent, so
+            # the error may be raised by the next receipt
+            with pytest.raises(CashRegisterNotReady):
+                for _ in range(10):
+                    adapter.push(snapshot)
+        finally:
+            simulator.stop()
+        assert simulator.receipts == []
+
+
+@pytest.mark.django_db
+def test_loadtest_command():
+    """
+    Ensures that the load test command prints receipts through the API
+    and removes created data.
+    """
+    out = StringIO()
+    call_command('loadtest_receipts', receipts=3, baudrate=0, stdout=out)
+    output = out.getvalue()
+    assert 'printed: 3' in output
+    assert 'statuses: 201=3' in output
+    assert Receipt.objects.count() == 0
+    assert Product.objects.count() == 0
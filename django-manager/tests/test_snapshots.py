@@ -0,0 +1,81 @@
+import pytest
+
+from decimal import Decimal as D
+
+from model_mommy import mommy
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from registers.models import Product, Receipt, Register, Sell
+from registers.dispatch import push_receipts
+from registers.snapshots import build_snapshots
+
+
+@pytest.mark.django_db
+def test_build_snapshots():
+    """
+    Ensures that snapshots include all data required by adapters:
+        * create a receipt with 2 sold items, bound to a register
+        * create a receipt without sold items
+        * both snapshots are built with a single query
+    """
+    register = mommy.make(Register, name='Till 2', serial_port='/dev/ttyUSB1')
+    croissant = mommy.make(Product, name='Croissant')
+    begel = mommy.make(Product, name='Begel')
+    receipt = mommy.make(Receipt, register=register)
+    Sell.objects.create(receipt=receipt, product=croissant, quantity=1, price=5.90)
+    Sell.objects.create(receipt=receipt, product=begel, quantity=2, price=2)
+    empty = mommy.make(Receipt)
+    # build snapshots
+    with CaptureQueriesContext(connection) as queries:
+        snapshot, empty_snapshot = build_snapshots(Receipt.objects.all())
+    assert len(queries) == 1
+    # sold items
+    assert snapshot.id == receipt.id
+    assert snapshot.date == receipt.date
+    assert snapshot.register.name == 'Till 2'
+    assert snapshot.register.serial_port == '/dev/ttyUSB1'
+    assert [item.product for item in snapshot.items] == ['Croissant', 'Begel']
+    assert snapshot.items[1].price == D('2.00')
+    assert snapshot.items[1].quantity == D('2')
+    assert snapshot.total == D('9.90')
+    # empty receipt
+    assert empty_snapshot.id == empty.id
+    assert empty_snapshot.register is None
+    assert empty_snapshot.items == ()
+    assert empty_snapshot.total == 0
+
+
+@pytest.mark.django_db
+def test_snapshot_is_immutable():
+    """
+    Ensures that adapters cannot change the shared snapshot
+    """
+    snapshot = build_snapshots([mommy.make(Receipt)])[0]
+    with pytest.raises(AttributeError):
+        snapshot.total = 0
+    with pytest.raises(AttributeError):
+        snapshot.extra = 0
+
+
+@pytest.mark.django_db
+def test_push_receipts(mocker, settings):
+    """
+    Ensures that all adapters receive the same snapshot, while legacy
+    adapters receive the ``Receipt`` model:
+        * register an adapter and a legacy adapter
+        * push two receipts
+        * expect that each adapter is called with the right payload
+    """
+    adapter = mocker.Mock()
+    legacy_adapter = mocker.Mock(legacy=True)
+    settings.PUSH_ADAPTERS = [adapter, legacy_adapter]
+    receipts = mommy.make(Receipt, _quantity=2)
+    push_receipts(Receipt.objects.order_by('pk'))
+    assert adapter.push.call_count == 2
+    assert legacy_adapter.push.call_count == 2
+    args, _ = adapter.push.call_args_list[0]
+    assert args[0].id == receipts[0].id
+    args, _ = legacy_adapter.push.call_args_list[1]
+    assert args[0] == receipts[1]
@@ -0,0 +1,37 @@
+import pytest
+
+from manager.warmup import preload, warmup
+
+from registers.adapters.registry import reset_adapters
+
+
+class TestWarmup:
+    def teardown_method(self, method):
+        reset_adapters()
+
+    def test_preload(self, mocker, settings):
+        """
+        Ensures that adapters modules are imported but adapters
+        are not initialized
+        """
+        import_string = mocker.patch('manager.warmup.import_string')
+        settings.PUSH_ADAPTERS = ['registers.adapters.services.DatadogAdapter', mocker.Mock()]
+        preload()
+        import_string.assert_called_once_with('registers.adapters.services.DatadogAdapter')
+        assert import_string.return_value.call_count == 0
+
+    @pytest.mark.django_db
+    def test_warmup(self, mocker, settings):
+        """
+        Ensures that a worker opens the database connections,
+        initializes the adapters and renders the catalog before
+        accepting requests
+        """
+        init = mocker.patch('registers.adapters.services.DatadogAdapter.__init__', return_value=None)
+        settings.PUSH_ADAPTERS = ['registers.adapters.services.DatadogAdapter']
+        ensure_connection = mocker.patch('django.db.backends.base.base.BaseDatabaseWrapper.ensure_connection')
+        get_catalog = mocker.patch('manager.warmup.get_catalog')
+        warmup()
+        assert ensure_connection.call_count == len(settings.DATABASES)
+        assert init.call_count == 1
+        assert get_catalog.call_count == 1